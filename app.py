@@ -1,93 +1,36 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash
-from pymongo import MongoClient
 import cloudinary
 import os
-from dotenv import load_dotenv
-import bcrypt
+from werkzeug.middleware.proxy_fix import ProxyFix
+from extensions import INSTANCE_PATH, STATIC_FOLDER, client, db, routes
+from services import login_throttle
+from services.cache import fragment_cache
+from services.passwords import check_password, hash_password, needs_rehash
+from services.repository import user_repo
+
+# Number of proxies in front of the app whose X-Forwarded-For is trusted
+# for the client address (sign-in throttling). 0 unless set: without a proxy
+# the header comes straight from the client. Set PROXY_HOPS=1 behind Render's
+# router.
+PROXY_HOPS = int((os.getenv("PROXY_HOPS") or "0").strip())
 
-load_dotenv()
-
-app = Flask(__name__, static_folder="static", template_folder="templates")
-app.secret_key = (os.getenv("SECRET_KEY") or "dev-secret").strip()
-
-# ---------------- MONGO (FIXED) ----------------
-MONGO_URI = (os.getenv("MONGO_URI") or "").strip()   # ✅ STRIP NEWLINES/SPACES
-DB_NAME = (os.getenv("DB_NAME") or "Ascend").strip()
-
-if not MONGO_URI:
-    raise RuntimeError("❌ MONGO_URI is missing in Render env vars")
-
-# Ensure standard options exist (and no newline issues)
-if "retryWrites=" not in MONGO_URI:
-    joiner = "&" if "?" in MONGO_URI else "?"
-    MONGO_URI = f"{MONGO_URI}{joiner}retryWrites=true"
-
-if "w=" not in MONGO_URI:
-    MONGO_URI = f"{MONGO_URI}&w=majority" if "?" in MONGO_URI else f"{MONGO_URI}?w=majority"
-
-client = MongoClient(
-    MONGO_URI,
-    serverSelectionTimeoutMS=8000,
-    connectTimeoutMS=8000,
-    socketTimeoutMS=8000,
-)
-
-db = client[DB_NAME]
-
-try:
-    client.admin.command("ping")
-    print("✅ MongoDB connected")
-except Exception as e:
-    print("❌ MongoDB connection failed:", repr(e))
-    raise
-
-courses_collection = db["courses"]
-enrollments_collection = db["enrollments"]
 users_collection = db["users"]
 
-# ---------------- CLOUDINARY ----------------
-cloudinary.config(
-    cloud_name=(os.getenv("CLOUDINARY_CLOUD_NAME") or "").strip(),
-    api_key=(os.getenv("CLOUDINARY_API_KEY") or "").strip(),
-    api_secret=(os.getenv("CLOUDINARY_API_SECRET") or "").strip(),
-)
-
-# ---------------- ADMIN BOOTSTRAP ----------------
-def create_admin_if_not_exists():
-    admin_email = "admin@ascend.com"
-    if users_collection.find_one({"email": admin_email}):
-        print("ℹ️ Admin user already exists")
-        return
-
-    hashed_password = bcrypt.hashpw(b"admin123", bcrypt.gensalt())
-    users_collection.insert_one({
-        "fullname": "Super Admin",
-        "email": admin_email,
-        "mobile": "9999999999",
-        "password": hashed_password.decode("utf-8"),
-        "role": "admin",
-    })
-    print("✅ Admin user created")
-
-try:
-    create_admin_if_not_exists()
-except Exception as e:
-    print("⚠️ Admin creation skipped:", repr(e))
-
 # ---------------- ROUTES ----------------
-@app.route("/")
+@routes.route("/")
 def home():
     return render_template("home.html")
 
-@app.route("/courses")
+@routes.route("/courses")
 def courses():
-    return render_template("courses.html")
+    # Same page for every visitor; results are fetched from the search API
+    return fragment_cache.get_or_set("page:courses", lambda: render_template("courses.html"))
 
-@app.route("/about")
+@routes.route("/about")
 def about():
     return render_template("about.html")
 
-@app.route("/signin-up", methods=["GET", "POST"])
+@routes.route("/signin-up", methods=["GET", "POST"])
 def signin_signup():
     if request.method == "POST":
         action = (request.form.get("action") or "").strip()
@@ -109,17 +52,16 @@ def signin_signup():
                                        error="All fields are required for signup.",
                                        error_type="signup", panel="signup")
 
-            if users_collection.find_one({"email": email}):
+            if user_repo.by_email(email, {"_id": 1}):
                 return render_template("signin-up.html",
                                        error="Email already exists. Please sign in.",
                                        error_type="signup", panel="signup")
 
-            hashed_pw = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
             users_collection.insert_one({
                 "fullname": fullname,
                 "email": email,
                 "mobile": mobile,
-                "password": hashed_pw.decode("utf-8"),
+                "password": hash_password(password),
                 "role": role
             })
 
@@ -127,17 +69,31 @@ def signin_signup():
             return redirect(url_for("signin_signup"))
 
         elif action == "signin":
-            user = users_collection.find_one({"email": email})
+            ip = request.remote_addr or "unknown"
+            wait = login_throttle.retry_after(email, ip)
+            if wait:
+                return render_template("signin-up.html",
+                                       error=f"Too many failed sign-ins. Try again in {(wait + 59) // 60} min.",
+                                       error_type="signin", panel="signin"), 429
+
+            user = user_repo.by_email(email)
             if not user:
+                login_throttle.record_failure(email, ip)
                 return render_template("signin-up.html",
                                        error="No account found with this email.",
                                        error_type="signin", panel="signin")
 
-            if not bcrypt.checkpw(password.encode("utf-8"), user["password"].encode("utf-8")):
+            if not check_password(password, user.get("password")):
+                login_throttle.record_failure(email, ip)
                 return render_template("signin-up.html",
                                        error="Incorrect password.",
                                        error_type="signin", panel="signin")
 
+            login_throttle.clear_account(email)
+            # Older hashes move to the current BCRYPT_ROUNDS as users sign in
+            if needs_rehash(user["password"]):
+                user_repo.set_password(user["_id"], hash_password(password))
+
             session.clear()
             session["user_id"] = str(user["_id"])
             session["role"] = user["role"]
@@ -159,27 +115,57 @@ def signin_signup():
 
     return render_template("signin-up.html", panel="signin")
 
-@app.route("/logout")
+@routes.route("/logout")
 def logout():
     session.clear()
     flash("You have been logged out.", "success")
     return redirect(url_for("signin_signup"))
 
-@app.context_processor
 def inject_theme():
     theme = request.cookies.get("theme", "light")
     return dict(theme=theme)
 
-@app.route("/health")
+@routes.route("/health")
 def health():
     client.admin.command("ping")
     return {"status": "ok"}
 
-# Import controllers
-from controllers.admin import *
-from controllers.instructor import *
-from controllers.student import *
-from controllers.chat import *
+
+# ---------------- APP FACTORY ----------------
+def create_app():
+    """
+    Build the Flask app. Nothing here touches the network: Mongo connects
+    on a worker's first query, and one-off setup (admin account, indexes)
+    is `flask bootstrap`, run once per deploy. Cheap enough to import in
+    the gunicorn master with --preload (see gunicorn.conf.py).
+    """
+    app = Flask(__name__, static_folder=STATIC_FOLDER, template_folder="templates", instance_path=INSTANCE_PATH)
+    app.secret_key = (os.getenv("SECRET_KEY") or "dev-secret").strip()
+    if PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+
+    cloudinary.config(
+        cloud_name=(os.getenv("CLOUDINARY_CLOUD_NAME") or "").strip(),
+        api_key=(os.getenv("CLOUDINARY_API_KEY") or "").strip(),
+        api_secret=(os.getenv("CLOUDINARY_API_SECRET") or "").strip(),
+    )
+
+    # Importing a controller declares its views on `routes`
+    import controllers.admin, controllers.catalog, controllers.chat  # noqa: E401
+    import controllers.instructor, controllers.media, controllers.student  # noqa: E401
+    import commands
+    import services.assets
+    import services.images
+
+    routes.init_app(app)
+    app.context_processor(inject_theme)
+    services.images.init_app(app)
+    services.assets.init_app(app)  # fingerprinted static URLs (flask build-static)
+    commands.init_app(app)
+    return app
+
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int((os.getenv("PORT") or "5000").strip()), debug=True)
@@ -0,0 +1,495 @@
+# commands.py
+import json
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from extensions import db
+from services.assets import DIST_DIR, brotli, build_static
+from services.course_structure import assign_topic_bits, coerce_structure, is_native_structure, structure_stats
+from services.course_topics import save_structure
+from services.images import IMAGE_FIELDS, build_image_variants, variants_field
+from services.indexes import INDEXES, create_indexes
+from services.jobs import JOB_HANDLERS, run_job, stale_jobs
+from services.leaderboard import (
+    course_leaderboard, leaderboard, leaderboard_scores,
+    week_expires_at, week_key, weekly_leaderboard,
+)
+from services.learning_stats import refresh_learning_stats
+from services.passwords import hash_password
+from services.progress import DAY_FORMAT, bucket_legacy_updates
+from services.progress_buffer import JOURNAL_DIR, replay_orphans
+from services.query_plans import HOT_PATHS, collection_scans, missing_indexes
+from services.search import create_search_index
+
+# Documents whose structure (or its module list) is still a JSON string
+STRING_STRUCTURE_FILTER = {"$or": [
+    {"structure": {"$type": "string"}},
+    {"structure.modules": {"$type": "string"}},
+]}
+
+# Write-time guard installed once the data is clean
+COURSE_VALIDATOR = {"$jsonSchema": {
+    "bsonType": "object",
+    "properties": {
+        "structure": {
+            "bsonType": "object",
+            "properties": {"modules": {"bsonType": "array"}},
+        },
+    },
+}}
+
+
+# Commands are declared on this group and added to `flask` itself by init_app
+cli = AppGroup("commands")
+
+
+def init_app(app):
+    for command in cli.commands.values():
+        app.cli.add_command(command)
+
+
+def _flush(ops, dry_run, collection=None):
+    if ops and not dry_run:
+        (collection if collection is not None else db.courses).bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+@cli.command("normalize-structures")
+@click.option("--batch-size", default=500, show_default=True, help="Documents per cursor batch and bulk write.")
+@click.option("--dry-run", is_flag=True, help="Report what would change without writing.")
+@click.option("--skip-validator", is_flag=True, help="Don't install the collection validator afterwards.")
+def normalize_structures(batch_size, dry_run, skip_validator):
+    """Rewrite string-encoded course structures as native BSON."""
+    total = db.courses.count_documents(STRING_STRUCTURE_FILTER)
+    click.echo(f"{total} course(s) with string-encoded structure{' (dry run)' if dry_run else ''}")
+
+    cursor = db.courses.find(STRING_STRUCTURE_FILTER, {"structure": 1}).batch_size(batch_size)
+    ops, seen, written, failed = [], 0, 0, []
+    for course in cursor:
+        seen += 1
+        try:
+            structure = coerce_structure(course.get("structure"))
+        except (ValueError, json.JSONDecodeError) as e:
+            failed.append((course["_id"], str(e)))
+            continue
+        ops.append(UpdateOne({"_id": course["_id"]}, {"$set": {"structure": structure}}))
+        if len(ops) >= batch_size:
+            written += _flush(ops, dry_run)
+            ops = []
+            click.echo(f"  {seen}/{total} scanned, {written} normalized")
+    written += _flush(ops, dry_run)
+    click.echo(f"  {seen}/{total} scanned, {written} normalized")
+
+    for course_id, err in failed:
+        click.echo(f"  ⚠️ {course_id}: unparseable structure ({err})", err=True)
+
+    if dry_run or skip_validator:
+        return
+    if failed:
+        click.echo("Validator not installed: fix the documents above and re-run.", err=True)
+        return
+    try:
+        db.command("collMod", "courses", validator=COURSE_VALIDATOR, validationLevel="moderate")
+        click.echo("✅ Course structure validator installed")
+    except OperationFailure as e:
+        click.echo(f"⚠️ Could not install validator: {e}", err=True)
+
+
+@cli.command("backfill-course-stats")
+@click.option("--batch-size", default=500, show_default=True, help="Documents per cursor batch and bulk write.")
+@click.option("--dry-run", is_flag=True, help="Report what would change without writing.")
+def backfill_course_stats(batch_size, dry_run):
+    """Store structure counts/durations (and created_at/updated_at/version) on every course."""
+    cursor = db.courses.find(
+        {}, {"structure": 1, "outline": 1, "created_at": 1, "updated_at": 1, "version": 1}
+    ).batch_size(batch_size)
+    ops, seen, written = [], 0, 0
+    for course in cursor:
+        seen += 1
+        update = {}
+        structure = course.get("outline") or course.get("structure", {})
+        if is_native_structure(structure):
+            update["stats"] = structure_stats(structure)
+        if not course.get("created_at"):
+            # Keyset pagination needs a value on every document
+            update["created_at"] = course["_id"].generation_time.replace(tzinfo=None)
+        if not course.get("updated_at"):
+            update["updated_at"] = course.get("created_at") or update["created_at"]
+        if not course.get("version"):
+            # Cache keys and ETags are derived from it
+            update["version"] = 1
+        if update:
+            ops.append(UpdateOne({"_id": course["_id"]}, {"$set": update}))
+        if len(ops) >= batch_size:
+            written += _flush(ops, dry_run)
+            ops = []
+            click.echo(f"  {seen} scanned, {written} updated")
+    written += _flush(ops, dry_run)
+    click.echo(f"{seen} scanned, {written} updated{' (dry run)' if dry_run else ''}")
+
+
+@cli.command("assign-topic-bits")
+@click.option("--batch-size", default=500, show_default=True, help="Documents per cursor batch and bulk write.")
+@click.option("--dry-run", is_flag=True, help="Report what would change without writing.")
+def assign_topic_bits_command(batch_size, dry_run):
+    """Give every course topic a topic_id and a completion bit."""
+    cursor = db.courses.find(
+        {}, {"structure": 1, "topic_bits": 1, "topic_bit_next": 1}
+    ).batch_size(batch_size)
+    ops, seen, written = [], 0, 0
+    for course in cursor:
+        seen += 1
+        structure = course.get("structure")
+        if not is_native_structure(structure):
+            continue  # run normalize-structures first
+        bits, next_bit = assign_topic_bits(
+            structure, course.get("topic_bits"), course.get("topic_bit_next", 0)
+        )
+        if bits == course.get("topic_bits") and next_bit == course.get("topic_bit_next"):
+            continue
+        ops.append(UpdateOne({"_id": course["_id"]}, {
+            "$set": {"structure": structure, "topic_bits": bits, "topic_bit_next": next_bit},
+            "$inc": {"version": 1}
+        }))
+        if len(ops) >= batch_size:
+            written += _flush(ops, dry_run)
+            ops = []
+            click.echo(f"  {seen} scanned, {written} updated")
+    written += _flush(ops, dry_run)
+    click.echo(f"{seen} scanned, {written} updated{' (dry run)' if dry_run else ''}")
+
+
+@cli.command("split-course-topics")
+@click.option("--batch-size", default=100, show_default=True, help="Documents per cursor batch.")
+@click.option("--dry-run", is_flag=True, help="Report what would change without writing.")
+def split_course_topics(batch_size, dry_run):
+    """Move embedded course structures into course_topics, leaving an outline on the course."""
+    cursor = db.courses.find(
+        {"structure": {"$exists": True}, "outline": {"$exists": False}},
+        {"structure": 1, "topic_bits": 1, "topic_bit_next": 1}
+    ).batch_size(batch_size)
+    seen, written = 0, 0
+    for course in cursor:
+        seen += 1
+        structure = course.get("structure")
+        if not is_native_structure(structure):
+            click.echo(f"  ⚠️ {course['_id']}: run normalize-structures first", err=True)
+            continue
+        bits, next_bit = assign_topic_bits(
+            structure, course.get("topic_bits"), course.get("topic_bit_next", 0)
+        )
+        if not dry_run:
+            outline = save_structure(course["_id"], structure)
+            db.courses.update_one({"_id": course["_id"]}, {
+                "$set": {"outline": outline, "topic_bits": bits, "topic_bit_next": next_bit},
+                "$unset": {"structure": ""},
+                "$inc": {"version": 1}
+            })
+        written += 1
+        if written % batch_size == 0:
+            click.echo(f"  {seen} scanned, {written} split")
+    click.echo(f"{seen} scanned, {written} split{' (dry run)' if dry_run else ''}")
+
+
+@cli.command("retry-jobs")
+@click.option("--older-than", default=15, show_default=True, help="Minutes before a queued/running job counts as abandoned.")
+def retry_jobs(older_than):
+    """Re-run background jobs that failed or were lost with their worker."""
+    retried = 0
+    for job in stale_jobs(timedelta(minutes=older_than)):
+        if job["kind"] not in JOB_HANDLERS:
+            click.echo(f"  ⚠️ {job['_id']}: no handler for {job['kind']}", err=True)
+            continue
+        click.echo(f"  retrying {job['kind']} {job['_id']}")
+        run_job(job["_id"], job["kind"], job.get("params", {}))
+        retried += 1
+    click.echo(f"{retried} job(s) retried")
+
+
+@cli.command("migrate-progress-buckets")
+@click.option("--batch-size", default=500, show_default=True, help="Documents per cursor batch and bulk write.")
+@click.option("--dry-run", is_flag=True, help="Report what would change without writing.")
+def migrate_progress_buckets(batch_size, dry_run):
+    """Fold each enrollment's progress_updates array into progress_by_day."""
+    legacy = {"progress_updates": {"$exists": True}}
+    cursor = db.enrollments.find(legacy, {"progress_updates": 1}).batch_size(batch_size)
+    ops, seen, written = [], 0, 0
+    for enrollment in cursor:
+        seen += 1
+        buckets = bucket_legacy_updates(enrollment.get("progress_updates"))
+        update = {"$unset": {"progress_updates": ""}}
+        if buckets:
+            # $inc, not $set: days already written by the new endpoint are kept
+            update["$inc"] = {
+                f"progress_by_day.{day}.topics_completed": topics
+                for day, topics in buckets.items()
+            }
+        # Matching on the array makes a re-run skip documents already folded
+        ops.append(UpdateOne({"_id": enrollment["_id"], **legacy}, update))
+        if len(ops) >= batch_size:
+            written += _flush(ops, dry_run, db.enrollments)
+            ops = []
+            click.echo(f"  {seen} scanned, {written} updated")
+    written += _flush(ops, dry_run, db.enrollments)
+    click.echo(f"{seen} scanned, {written} updated{' (dry run)' if dry_run else ''}")
+
+
+@cli.command("replay-progress-journals")
+def replay_progress_journals():
+    """Write out progress journals left by workers that died before flushing."""
+    replayed = replay_orphans()
+    click.echo(f"{replayed} buffered progress update(s) replayed from {JOURNAL_DIR}")
+
+
+@cli.command("rebuild-leaderboard")
+@click.option("--batch-size", default=500, show_default=True, help="Documents per cursor batch and bulk write.")
+def rebuild_leaderboard(batch_size):
+    """
+    Recompute every leaderboard collection from enrollments. They are kept
+    up to date incrementally; this is for the first deploy and for repairs,
+    and should run while progress writes are quiet. The new boards are
+    built beside the live ones in batches and swapped in when complete, so
+    rankings stay readable throughout; weeks past retention are left out.
+    """
+    boards = (leaderboard, leaderboard_scores, course_leaderboard, weekly_leaderboard)
+    staging = {board.name: db[f"{board.name}_rebuild"] for board in boards}
+    for name, collection in staging.items():
+        collection.drop()
+        db.create_collection(collection.name)
+        if name in INDEXES:
+            collection.create_indexes(INDEXES[name])
+
+    now = datetime.utcnow()
+    stamped = 0
+    ops = {name: [] for name in staging}
+
+    def flush():
+        for name, collection in staging.items():
+            _flush(ops[name], False, collection)
+            ops[name] = []
+
+    cursor = db.enrollments.find(
+        {}, {"user_id": 1, "course_id": 1, "progress": 1, "completed_at": 1, "progress_by_day": 1}
+    ).batch_size(batch_size)
+    for seen, e in enumerate(cursor, 1):
+        user_id, days = e.get("user_id"), e.get("progress_by_day") or {}
+        if not user_id:
+            continue
+        completed_at = e.get("completed_at")
+        if not completed_at and e.get("progress", 0) >= 100:
+            # Best guess for older completions: their last active day
+            completed_at = datetime.strptime(max(days), DAY_FORMAT) if days else now
+            db.enrollments.update_one({"_id": e["_id"]}, {"$set": {"completed_at": completed_at}})
+            stamped += 1
+        if completed_at:
+            ops[leaderboard.name].append(UpdateOne(
+                {"_id": user_id},
+                {"$inc": {"courses_completed": 1}, "$max": {"updated_at": completed_at}},
+                upsert=True
+            ))
+        per_week = {}
+        if completed_at and week_expires_at(completed_at) > now:
+            per_week[week_key(completed_at)] = [0, 1, week_expires_at(completed_at)]
+        topics = 0
+        for day, counters in days.items():
+            n = (counters or {}).get("topics_completed", 0)
+            topics += n
+            day = datetime.strptime(day, DAY_FORMAT)
+            if week_expires_at(day) > now:
+                per_week.setdefault(week_key(day), [0, 0, week_expires_at(day)])[0] += n
+        if days:
+            ops[course_leaderboard.name].append(UpdateOne(
+                {"course_id": e["course_id"], "user_id": user_id}, {"$inc": {"topics_completed": topics}}, upsert=True
+            ))
+        ops[weekly_leaderboard.name].extend(
+            UpdateOne(
+                {"week": w, "user_id": user_id},
+                {"$inc": {"topics_completed": t, "courses_completed": c}, "$setOnInsert": {"expires_at": expires_at}},
+                upsert=True
+            )
+            for w, (t, c, expires_at) in per_week.items()
+        )
+        if seen % batch_size == 0:
+            flush()
+    flush()
+
+    # Rank histogram: one document per distinct score
+    histogram = list(staging[leaderboard.name].aggregate([
+        {"$group": {"_id": "$courses_completed", "students": {"$sum": 1}}}
+    ]))
+    if histogram:
+        staging[leaderboard_scores.name].insert_many(histogram)
+
+    students = staging[leaderboard.name].count_documents({})
+    course_entries = staging[course_leaderboard.name].count_documents({})
+    week_entries = staging[weekly_leaderboard.name].count_documents({})
+    for name, collection in staging.items():
+        collection.rename(name, dropTarget=True)
+    click.echo(
+        f"{students} student(s) ranked, {stamped} completion date(s) backfilled, "
+        f"{course_entries} course and {week_entries} weekly entries"
+    )
+
+
+@cli.command("refresh-learning-stats")
+@click.option("--recompute-minutes", is_flag=True, help="Rebuild every student's learning_minutes from enrollments first.")
+@click.option("--batch-size", default=500, show_default=True, help="Documents per cursor batch and bulk write.")
+def refresh_learning_stats_command(recompute_minutes, batch_size):
+    """Refresh the class-wide learning-time figures (run from cron, or on deploy)."""
+    if recompute_minutes:
+        course_minutes = {
+            c["_id"]: (c.get("stats") or {}).get("total_minutes", 0)
+            for c in db.courses.find({}, {"stats.total_minutes": 1})
+        }
+        minutes = {}
+        cursor = db.enrollments.find({}, {"user_id": 1, "course_id": 1, "progress": 1}).batch_size(batch_size)
+        for e in cursor:
+            if e.get("user_id"):
+                minutes[e["user_id"]] = minutes.get(e["user_id"], 0) + (
+                    (e.get("progress") or 0) / 100 * course_minutes.get(e.get("course_id"), 0)
+                )
+        ops = [UpdateOne({"_id": u}, {"$set": {"learning_minutes": m}}) for u, m in minutes.items()]
+        for i in range(0, len(ops), batch_size):
+            _flush(ops[i:i + batch_size], False, db.users)
+        click.echo(f"  learning_minutes recomputed for {len(minutes)} student(s)")
+    result = refresh_learning_stats()
+    click.echo(f"Learning stats refreshed over {result['students']} student(s)")
+
+
+@cli.command("build-image-variants")
+@click.option("--force", is_flag=True, help="Rebuild images that already have variants.")
+@click.option("--dry-run", is_flag=True, help="Report what would change without writing.")
+def build_image_variants_command(force, dry_run):
+    """Generate resized WebP/JPEG copies of existing thumbnails and profile photos."""
+    for field, (collection, _) in IMAGE_FIELDS.items():
+        query = {field: {"$nin": [None, ""]}}
+        if not force:
+            query[variants_field(field)] = {"$exists": False}
+        built, failed = 0, 0
+        for doc in db[collection].find(query, {field: 1}):
+            if dry_run:
+                built += 1
+                continue
+            try:
+                result = build_image_variants(field, doc["_id"], doc[field])
+            except Exception as e:
+                failed += 1
+                click.echo(f"  ⚠️ {collection} {doc['_id']}: {e}", err=True)
+                continue
+            built += 1 if result.get("variants") else 0
+        click.echo(f"{collection}.{field}: {built} built, {failed} failed{' (dry run)' if dry_run else ''}")
+
+
+@cli.command("build-static")
+def build_static_command():
+    """Write content-hashed, precompressed copies of static/ and their manifest (run on deploy)."""
+    manifest = build_static()
+    click.echo(f"✅ {len(manifest)} static file(s) fingerprinted into static/{DIST_DIR}/")
+    if not brotli:
+        click.echo("  ℹ️ brotli isn't installed: only .gz copies were written", err=True)
+
+
+@cli.command("dedupe-enrollments")
+@click.option("--dry-run", is_flag=True, help="Report what would change without writing.")
+def dedupe_enrollments(dry_run):
+    """Keep one enrollment per (student, course), the furthest along, then add the unique index."""
+    groups = db.enrollments.aggregate([
+        {"$match": {"user_id": {"$exists": True}}},
+        {"$group": {"_id": {"u": "$user_id", "c": "$course_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    removed = 0
+    for group in groups:
+        docs = list(db.enrollments.find(
+            {"user_id": group["_id"]["u"], "course_id": group["_id"]["c"]},
+            {"progress": 1, "enrolled_at": 1}
+        ))
+        docs.sort(key=lambda e: (-(e.get("progress") or 0), e.get("enrolled_at") or datetime.max))
+        extra = [e["_id"] for e in docs[1:]]
+        if not dry_run:
+            db.enrollments.delete_many({"_id": {"$in": extra}})
+        removed += len(extra)
+    click.echo(f"{removed} duplicate enrollment(s) removed{' (dry run)' if dry_run else ''}")
+    if not dry_run and not create_indexes("enrollments", replace=True):
+        click.echo("✅ Unique (user_id, course_id) index in place")
+
+
+@cli.command("migrate-enrollment-keys")
+@click.option("--dry-run", is_flag=True, help="Report what would change without writing.")
+def migrate_enrollment_keys(dry_run):
+    """Rename the legacy `student_id` of enrollments to `user_id`."""
+    legacy = {"student_id": {"$exists": True}, "user_id": {"$exists": False}}
+    # Documents that somehow carry both keep user_id, the key every query uses
+    both = {"student_id": {"$exists": True}, "user_id": {"$exists": True}}
+    if dry_run:
+        renamed, dropped = db.enrollments.count_documents(legacy), db.enrollments.count_documents(both)
+    else:
+        renamed = db.enrollments.update_many(legacy, {"$rename": {"student_id": "user_id"}}).modified_count
+        dropped = db.enrollments.update_many(both, {"$unset": {"student_id": ""}}).modified_count
+    click.echo(f"{renamed} enrollment(s) rekeyed, {dropped} stale student_id field(s) dropped{' (dry run)' if dry_run else ''}")
+    if renamed and not dry_run:
+        click.echo("  ℹ️ Run `flask dedupe-enrollments` in case a rekeyed enrollment duplicates an existing one")
+
+
+@cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Build every registered index (run at deploy time; safe to repeat)."""
+    failed = create_indexes(replace=True)
+    create_search_index()
+    if failed:
+        raise click.ClickException(
+            f"{len(failed)} index(es) built without their unique constraint: " + ", ".join(f"{c}.{n}" for c, n in failed)
+        )
+    click.echo("✅ Indexes in place")
+
+
+@cli.command("check-query-plans")
+def check_query_plans():
+    """
+    Explain the reads behind the hot pages (services/query_plans.py) and fail
+    if any of them scans a whole collection, or if a registered index is
+    missing. Read-only: run `flask ensure-indexes` to build what's missing.
+    """
+    missing = missing_indexes()
+    for collection, name in missing:
+        click.echo(f"  ❌ missing index {collection}.{name}", err=True)
+    scans = collection_scans()
+    for description, collection, stages in scans:
+        click.echo(f"  ❌ {description} ({collection}): {' <- '.join(stages)}", err=True)
+    if missing or scans:
+        raise click.ClickException(
+            f"{len(missing)} registered index(es) missing, "
+            f"{len(scans)} hot-path read(s) would scan a collection"
+        )
+    click.echo(f"✅ All registered indexes exist and all {len(HOT_PATHS)} hot paths use them")
+
+
+ADMIN_EMAIL = "admin@ascend.com"
+
+
+def create_admin_if_not_exists():
+    if db.users.find_one({"email": ADMIN_EMAIL}, {"_id": 1}):
+        click.echo("ℹ️ Admin user already exists")
+        return
+    db.users.insert_one({
+        "fullname": "Super Admin",
+        "email": ADMIN_EMAIL,
+        "mobile": "9999999999",
+        "password": hash_password("admin123"),
+        "role": "admin",
+    })
+    click.echo("✅ Admin user created")
+
+
+@cli.command("bootstrap")
+@click.pass_context
+def bootstrap(ctx):
+    """One-off setup per deploy (not per worker): the admin account and every index."""
+    db.command("ping")
+    click.echo("✅ MongoDB connected")
+    create_admin_if_not_exists()
+    ctx.invoke(ensure_indexes_command)
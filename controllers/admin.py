@@ -1,10 +1,9 @@
 # controllers/admin.py
 from flask import session, redirect, url_for
-from app import app
+from extensions import routes
 
-def register_routes(app):
-    @app.route("/admin/dash")
-    def admin_dashboard():
-        if session.get("role") != "admin":
-            return redirect(url_for("signin_signup"))
-        return "🛠️ Welcome to the Admin Dashboard"
+@routes.route("/admin/dash")
+def admin_dashboard():
+    if session.get("role") != "admin":
+        return redirect(url_for("signin_signup"))
+    return "🛠️ Welcome to the Admin Dashboard"
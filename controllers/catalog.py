@@ -0,0 +1,43 @@
+# controllers/catalog.py
+from flask import request, jsonify
+
+from extensions import routes
+from services.catalog import catalog_cards
+from services.search import FACET_FIELDS, search_courses
+
+# ===========================
+# Public Course Search API
+# ===========================
+@routes.route("/api/courses/search")
+def api_course_search():
+    query = (request.args.get("q") or "").strip()
+    filters = {f: request.args.get(f) for f in FACET_FIELDS if request.args.get(f)}
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = int(request.args.get("per_page", 12))
+    except ValueError:
+        return jsonify({"error": "page and per_page must be integers"}), 400
+
+    try:
+        found = search_courses(query, filters, page=page, per_page=per_page, after=request.args.get("after"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    found["results"] = [
+        {
+            "id": c["_id"],
+            "title": c["title"],
+            "description": c["description"],
+            "thumbnail_url": c["thumbnail_url"],
+            "thumbnail_srcset": c["thumbnail_srcset"],
+            "instructor_name": c["instructor_name"],
+            "rating": c["rating"],
+            "category": c.get("category"),
+            "difficulty": c.get("difficulty"),
+            "language": c.get("language"),
+            "total_time_pretty": c["total_time_pretty"],
+            "topics_count": c["topics_count"],
+            "score": round(c.get("score", 0), 3),
+        }
+        for c in catalog_cards(found["results"])
+    ]
+    return jsonify(found)
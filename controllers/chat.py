@@ -6,7 +6,8 @@ from flask import request, jsonify, session
 from bson import ObjectId
 
 # IMPORTANT: keep this import as you already structured it
-from app import app, db
+from extensions import routes
+from services.repository import course_repo, enrollment_repo, user_repo
 
 
 # --------------------------------------------------
@@ -120,15 +121,15 @@ def generate_ai_response(prompt: str) -> str:
 # --------------------------------------------------
 def get_student_context(user_id: str) -> str:
     try:
-        user = db.users.find_one({"_id": ObjectId(user_id)}) or {}
-        enrollments = db.enrollments.find({"user_id": ObjectId(user_id)})
+        user = user_repo.get(ObjectId(user_id), {"fullname": 1}) or {}
+        enrollments = enrollment_repo.for_student(ObjectId(user_id), {"course_id": 1, "progress": 1})
+        titles = course_repo.titles(e.get("course_id") for e in enrollments)
 
         progress_list = []
         for e in enrollments:
-            course = db.courses.find_one({"_id": e.get("course_id")})
-            if course:
+            if e.get("course_id") in titles:
                 progress_list.append(
-                    f"- {course.get('title', 'Course')}: {e.get('progress', 0)}% completed"
+                    f"- {titles[e['course_id']] or 'Course'}: {e.get('progress', 0)}% completed"
                 )
 
         ctx = (
@@ -144,7 +145,7 @@ def get_student_context(user_id: str) -> str:
 # --------------------------------------------------
 # Route
 # --------------------------------------------------
-@app.route("/student/chat", methods=["POST"])
+@routes.route("/student/chat", methods=["POST"])
 def student_chat():
     if session.get("role") != "student":
         return jsonify({"error": "Unauthorized"}), 401
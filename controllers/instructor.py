@@ -1,19 +1,36 @@
-from flask import request, render_template, flash, redirect, url_for, session
+from flask import request, render_template, flash, redirect, url_for, session, Response, stream_with_context, jsonify
 from bson import ObjectId
 from datetime import datetime, timedelta
-import cloudinary.uploader
+import csv
+import io
 import json
-from app import app, db, courses_collection
+from extensions import routes
 from bson import ObjectId, errors as bson_errors
+from services.cache import invalidate_course
+from services.cascade import course_asset_urls, profile_asset_urls
+from services.course_structure import assign_topic_bits, coerce_structure, structure_stats
+from services.course_topics import course_stats, load_structure, save_structure
+from services.current_user import current_user
+from services.enrollments import MAX_BULK_ENROLL, enroll_many
+from services.images import discard_image, request_variants
+from services.jobs import find_job, submit_job
+from services.progress import day_key
+from services.repository import (
+    COURSE_ANALYTICS, COURSE_EDIT, COURSE_PAGE, REVIEWER, USER_PASSWORD,
+    course_repo, enrollment_repo, user_repo,
+)
+from services.roster import save_upload
+from services.storage import resource_type_for, storage
 # ========== Instructor Dashboard ===========
-@app.route('/instructor/dashboard')
+@routes.route('/instructor/dashboard')
 def instructor_dashboard():
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
     instructor_id = session.get("user_id")
-    user = db.users.find_one({"_id": ObjectId(instructor_id)})
-    courses = list(db.courses.find({"instructor_id": ObjectId(instructor_id)}))
+    user = current_user()
+    # Counts and minutes are stored on the course; the tree isn't needed here
+    courses = course_repo.by_instructor(ObjectId(instructor_id))
 
     published_courses = [c for c in courses if c.get("status") == "published"]
     draft_courses = [c for c in courses if c.get("status") == "draft"]
@@ -22,54 +39,23 @@ def instructor_dashboard():
     total_published = len(published_courses)
     total_drafts = len(draft_courses)
 
-    total_students = 0
-
-    for course in published_courses:
-        course_id = course["_id"]
-        student_count = db.users.count_documents({"enrolled_courses": course_id})
-        total_students += student_count
-
-
-    # Parse and stats
-    def compute_course_stats(course):
-        structure = course.get("structure", {})
-        if isinstance(structure, str):
-            try: structure = json.loads(structure)
-            except: structure = {}
-        modules = structure.get("modules", [])
-        if isinstance(modules, str):
-            try: modules = json.loads(modules)
-            except: modules = []
-        num_modules = len(modules)
-        num_chapters = sum(len(m.get("chapters", [])) for m in modules if isinstance(m, dict))
-        num_topics = sum(
-            len(c.get("topics", []))
-            for m in modules if isinstance(m, dict)
-            for c in m.get("chapters", []) if isinstance(c, dict)
-        )
-        total_duration = sum(
-            float(t.get("estimated_time", 0)) / 60
-            for m in modules if isinstance(m, dict)
-            for c in m.get("chapters", []) if isinstance(c, dict)
-            for t in c.get("topics", []) if isinstance(t, dict)
-        )
-        return {
-            "rating": course.get("rating", 0),
-            "students": course.get("students", 0),
-            "duration": round(total_duration, 1),
-            "num_modules": num_modules,
-            "num_chapters": num_chapters,
-            "num_topics": num_topics
-        }
+    published_ids = [c["_id"] for c in published_courses]
+    total_students = sum(enrollment_repo.counts_by_course(published_ids, analytics=True).values())
+    # One read of the published courses' enrollments feeds both charts
+    enrollments = enrollment_repo.for_courses(
+        published_ids, {"course_id": 1, "enrolled_at": 1, "progress": 1}, analytics=True
+    )
 
     for course in published_courses + draft_courses:
-        if isinstance(course.get("structure"), str):
-            try:
-                course["structure"] = json.loads(course["structure"])
-            except Exception:
-                course["structure"] = {"modules": []}
-        stats = compute_course_stats(course)
-        course.update(stats)
+        stats = course_stats(course)
+        course.update({
+            "rating": course.get("rating", 0),
+            "students": course.get("students", 0),
+            "duration": round(stats["total_minutes"] / 60, 1),
+            "num_modules": stats["num_modules"],
+            "num_chapters": stats["num_chapters"],
+            "num_topics": stats["num_topics"],
+        })
         course["_id"] = str(course["_id"])
 
     # Profile image
@@ -86,22 +72,23 @@ def instructor_dashboard():
         d = (today.replace(day=1) - timedelta(days=30 * i))
         months.append(d.strftime("%b %Y"))
     enrollments_per_month = [0]*6
-    for c in published_courses:
-        enrollments = db.enrollments.find({"course_id": ObjectId(c["_id"])})
-        for e in enrollments:
-            if "enrolled_at" in e and isinstance(e["enrolled_at"], datetime):
-                enrolled_month = e["enrolled_at"].strftime("%b %Y")
-                if enrolled_month in months:
-                    enrollments_per_month[months.index(enrolled_month)] += 1
+    for e in enrollments:
+        if "enrolled_at" in e and isinstance(e["enrolled_at"], datetime):
+            enrolled_month = e["enrolled_at"].strftime("%b %Y")
+            if enrolled_month in months:
+                enrollments_per_month[months.index(enrolled_month)] += 1
 
     # Chart 2: Course Completion Rate (for each course)
     completion_labels = [c.get("title", "Untitled") for c in published_courses]
+    by_course = {}
+    for e in enrollments:
+        by_course.setdefault(str(e["course_id"]), []).append(e)
     completion_rates = []
     for c in published_courses:
-        enrollments = list(db.enrollments.find({"course_id": ObjectId(c["_id"])}))
-        if enrollments:
-            completed = sum(1 for e in enrollments if e.get("progress", 0) >= 100)
-            rate = int((completed/len(enrollments))*100) if enrollments else 0
+        course_enrollments = by_course.get(c["_id"], [])
+        if course_enrollments:
+            completed = sum(1 for e in course_enrollments if e.get("progress", 0) >= 100)
+            rate = int((completed/len(course_enrollments))*100)
         else:
             rate = 0
         completion_rates.append(rate)
@@ -126,63 +113,19 @@ def instructor_dashboard():
     )
 
 # ========== My Courses ==========
-@app.route("/instructor/my-courses")
+@routes.route("/instructor/my-courses")
 def instructor_my_courses():
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
     instructor_id = session.get("user_id")
-    courses = list(courses_collection.find({"instructor_id": ObjectId(instructor_id)}))
-
-    def compute_course_stats(course):
-        structure = course.get("structure", {})
-        if isinstance(structure, str):
-            try:
-                structure = json.loads(structure)
-            except Exception:
-                structure = {}
-
-        modules = structure.get("modules", [])
-        if isinstance(modules, str):
-            try:
-                modules = json.loads(modules)
-            except Exception:
-                modules = []
-
-        modules = [m if isinstance(m, dict) else {} for m in modules]
-
-        num_modules = len(modules)
-        num_chapters = sum(len(m.get("chapters", [])) for m in modules)
-        num_topics = sum(
-            len(c.get("topics", []))
-            for m in modules
-            for c in m.get("chapters", []) if isinstance(c, dict)
-        )
-        total_duration = sum(
-            float(t.get("estimated_time", 0)) / 60
-            for m in modules
-            for c in m.get("chapters", []) if isinstance(c, dict)
-            for t in c.get("topics", []) if isinstance(t, dict)
-        )
-
-        return {
-            "duration": round(total_duration, 1),
-            "num_modules": num_modules,
-            "num_chapters": num_chapters,
-            "num_topics": num_topics
-        }
+    courses = course_repo.by_instructor(ObjectId(instructor_id))
+    enrollment_counts = enrollment_repo.counts_by_course([c["_id"] for c in courses])
 
     # Enrich every course object
     for course in courses:
-        # Parse structure if string
-        if isinstance(course.get("structure"), str):
-            try:
-                course["structure"] = json.loads(course["structure"])
-            except Exception:
-                course["structure"] = {"modules": []}
-
         # --- Actual enrolled students ---
-        course["enrollment_count"] = db.enrollments.count_documents({"course_id": course["_id"]})
+        course["enrollment_count"] = enrollment_counts.get(course["_id"], 0)
 
         # --- Average rating ---
         reviews = course.get("reviews", [])
@@ -195,8 +138,13 @@ def instructor_my_courses():
         course["avg_rating"] = avg_rating
 
         # --- Other stats ---
-        stats = compute_course_stats(course)
-        course.update(stats)
+        stats = course_stats(course)
+        course.update({
+            "duration": round(stats["total_minutes"] / 60, 1),
+            "num_modules": stats["num_modules"],
+            "num_chapters": stats["num_chapters"],
+            "num_topics": stats["num_topics"],
+        })
 
         # Ensure _id is str for Jinja usage
         course["_id"] = str(course["_id"])
@@ -204,7 +152,7 @@ def instructor_my_courses():
     return render_template("instructor/my_courses.html", courses=courses, page="courses")
 
 # ========== Create Course ==========
-@app.route('/instructor/create-course', methods=['GET', 'POST'])
+@routes.route('/instructor/create-course', methods=['GET', 'POST'])
 def create_course():
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
@@ -229,12 +177,12 @@ def create_course():
 
             if not structure_json:
                 raise Exception("Structure data is missing.")
-            structure_data = json.loads(structure_json)
+            structure_data = coerce_structure(json.loads(structure_json))
+            topic_bits, topic_bit_next = assign_topic_bits(structure_data)
 
             thumbnail_url = ""
             if thumbnail:
-                upload_result = cloudinary.uploader.upload(thumbnail)
-                thumbnail_url = upload_result.get("secure_url")
+                thumbnail_url = storage().save(thumbnail, "image", folder="thumbnails")
 
             for module in structure_data.get("modules", []):
                 for chapter in module.get("chapters", []):
@@ -247,23 +195,20 @@ def create_course():
                         if content_type == "link":
                             topic["content_url"] = topic.get("content", "")
                         elif uploaded_file:
-                            if content_type == 'video':
-                                resource_type = 'video'
-                            elif content_type in ['pdf', 'zip', 'other']:
-                                resource_type = 'raw'
-                            elif content_type == 'image':
-                                resource_type = 'image'
-                            else:
-                                resource_type = 'auto'
-
-                            upload_result = cloudinary.uploader.upload(uploaded_file, resource_type=resource_type)
-                            topic["content_url"] = upload_result.get("secure_url")
+                            topic["content_url"] = storage().save(
+                                uploaded_file, resource_type_for(content_type), folder="topics"
+                            )
                         else:
                             topic["content_url"] = ""
 
                         topic.pop("content", None)
 
+            # Topics go to their own collection; the course keeps the outline
+            course_obj_id = ObjectId()
+            outline = save_structure(course_obj_id, structure_data)
+
             course_data = {
+                "_id": course_obj_id,
                 "title": title,
                 "description": description,
                 "difficulty": difficulty,
@@ -275,13 +220,19 @@ def create_course():
                 "rating": 0,
                 "students": 0,
                 "thumbnail_url": thumbnail_url,
-                "structure": structure_data,
+                "outline": outline,
+                "stats": structure_stats(structure_data),
+                "topic_bits": topic_bits,
+                "topic_bit_next": topic_bit_next,
                 "instructor_id": ObjectId(user_id),
                 "status": "draft" if submit_type == "draft" else "published",
-                "created_at": datetime.utcnow()
+                "version": 1,
+                "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
             }
 
-            courses_collection.insert_one(course_data)
+            course_repo.insert(course_data)
+            request_variants("thumbnail_url", course_obj_id, thumbnail_url)
             return redirect(url_for('instructor_my_courses'))
 
         except Exception as e:
@@ -291,12 +242,12 @@ def create_course():
     return render_template('instructor/create_course.html', page="create")
 
 # ========== View Course ==========
-@app.route("/instructor/course/<course_id>")
+@routes.route("/instructor/course/<course_id>")
 def view_course(course_id):
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
-    course = courses_collection.find_one({"_id": ObjectId(course_id)})
+    course = course_repo.get(ObjectId(course_id), {"status": 1})
     if not course:
         return "Course not found", 404
 
@@ -308,29 +259,16 @@ def view_course(course_id):
         return "Invalid course status", 400
 
 # ========== View Draft Course ==========
-@app.route("/instructor/course/<course_id>/draft")
+@routes.route("/instructor/course/<course_id>/draft")
 def view_draft_course(course_id):
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
-    course = courses_collection.find_one({"_id": ObjectId(course_id)})
+    course = course_repo.get(ObjectId(course_id), COURSE_PAGE)
     if not course or course.get("status") != "draft":
         return "Draft course not found", 404
 
-    # Parse structure
-    structure = course.get("structure", {})
-    if isinstance(structure, str):
-        try:
-            structure = json.loads(structure)
-        except Exception:
-            structure = {}
-
-    modules = structure.get("modules", [])
-    if isinstance(modules, str):
-        try:
-            modules = json.loads(modules)
-        except Exception:
-            modules = []
+    modules = load_structure(course).get("modules", [])
 
     # Normalize modules
     for module in modules:
@@ -345,23 +283,16 @@ def view_draft_course(course_id):
                 topic.setdefault("content_url", "")  # ✅ ensure content_url exists
 
     # Stats
-    num_modules = len(modules)
-    num_chapters = sum(len(m["chapters"]) for m in modules)
-    num_topics = sum(len(c["topics"]) for m in modules for c in m["chapters"])
-    total_duration = round(sum(
-        float(t.get("estimated_time", 0)) / 60
-        for m in modules for c in m["chapters"] for t in c["topics"]
-    ), 1)
-
+    stats = structure_stats({"modules": modules})
     course["structure"] = {"modules": modules}
-    course["num_modules"] = num_modules
-    course["num_chapters"] = num_chapters
-    course["num_topics"] = num_topics
-    course["total_duration"] = total_duration
+    course["num_modules"] = stats["num_modules"]
+    course["num_chapters"] = stats["num_chapters"]
+    course["num_topics"] = stats["num_topics"]
+    course["total_duration"] = round(stats["total_minutes"] / 60, 1)
     course["_id"] = str(course["_id"])
     course["instructor_id"] = str(course.get("instructor_id"))
 
-    user = db.users.find_one({"_id": ObjectId(course["instructor_id"])})
+    user = user_repo.get(ObjectId(course["instructor_id"]))
 
     return render_template(
         "instructor/view_draft_courses.html",
@@ -373,17 +304,20 @@ def view_draft_course(course_id):
 # ========== View Published Course ==========
 from collections import Counter
 
-@app.route("/instructor/course/<course_id>/published")
+@routes.route("/instructor/course/<course_id>/published")
 def view_published_course(course_id):
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
-    course = db.courses.find_one({"_id": ObjectId(course_id)})
+    course = course_repo.get(ObjectId(course_id), COURSE_PAGE)
     if not course or course.get("status") != "published":
         return "Published course not found", 404
 
-    # Normalize reviews
+    # Normalize reviews; reviewers' current names and photos in one query
     reviews = [r for r in course.get("reviews", []) if isinstance(r, dict)]
+    reviewers = user_repo.by_ids(
+        {ObjectId(r["user_id"]) for r in reviews if ObjectId.is_valid(r.get("user_id") or "")}, REVIEWER
+    )
     for r in reviews:
         r["stars"] = int(r.get("stars", 0))
         r["name"] = r.get("name") or "Anonymous"
@@ -404,15 +338,11 @@ def view_published_course(course_id):
         # Fetch profile image from users collection if user_id present
         r["profile_image"] = "/static/images/default_user.png"
         user_id_str = r.get("user_id")
-        if user_id_str:
-            try:
-                user = db.users.find_one({"_id": ObjectId(user_id_str)})
-                if user and user.get("profile_image"):
-                    r["profile_image"] = user["profile_image"]
-                if user and user.get("fullname"):
-                    r["name"] = user["fullname"]  # overwrite name with updated fullname
-            except Exception:
-                pass
+        user = reviewers.get(ObjectId(user_id_str)) if ObjectId.is_valid(user_id_str or "") else None
+        if user and user.get("profile_image"):
+            r["profile_image"] = user["profile_image"]
+        if user and user.get("fullname"):
+            r["name"] = user["fullname"]  # overwrite name with updated fullname
 
     # Ratings distribution for chart (1 to 5 stars)
     star_counts = Counter(r["stars"] for r in reviews if 1 <= r["stars"] <= 5)
@@ -428,30 +358,16 @@ def view_published_course(course_id):
         completion.get("in_progress", 0)
     ]
 
-    # Parse structure for stats
-    structure = course.get("structure", {})
-    if isinstance(structure, str):
-        import json
-        try:
-            structure = json.loads(structure)
-        except:
-            structure = {}
-
-    course["structure"] = structure
-    modules = structure.get("modules", [])
-    num_chapters = sum(len(m.get("chapters", [])) for m in modules)
-    num_topics = sum(len(c.get("topics", [])) for m in modules for c in m.get("chapters", []))
-    total_duration = round(sum(
-        float(t.get("estimated_time", 0)) / 60
-        for m in modules for c in m.get("chapters", []) for t in c.get("topics", [])
-    ), 1)
+    # Structure stats
+    course["structure"] = load_structure(course)
+    stats = course_stats(course)
 
     course.update({
         "_id": str(course["_id"]),
-        "num_modules": len(modules),
-        "num_chapters": num_chapters,
-        "num_topics": num_topics,
-        "total_duration": total_duration,
+        "num_modules": stats["num_modules"],
+        "num_chapters": stats["num_chapters"],
+        "num_topics": stats["num_topics"],
+        "total_duration": round(stats["total_minutes"] / 60, 1),
         "rating_data": rating_data,
         "completion_data": completion_data,
         "avg_rating": avg_rating,
@@ -465,7 +381,7 @@ def view_published_course(course_id):
         page="courses"
     )
 
-@app.route('/instructor/update-course/<course_id>', methods=['GET', 'POST'])
+@routes.route('/instructor/update-course/<course_id>', methods=['GET', 'POST'])
 def update_course(course_id):
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
@@ -476,7 +392,7 @@ def update_course(course_id):
         flash("Invalid course ID.", "danger")
         return redirect(url_for("instructor_dashboard"))
 
-    course = courses_collection.find_one({"_id": course_obj_id})
+    course = course_repo.get(course_obj_id, COURSE_EDIT)
     if not course or str(course.get("instructor_id")) != session.get("user_id"):
         flash("Unauthorized access or course not found.", "danger")
         return redirect(url_for("instructor_dashboard"))
@@ -497,14 +413,17 @@ def update_course(course_id):
                 flash("Missing structure data.", "danger")
                 return redirect(request.url)
 
-            structure = json.loads(structure_json)
+            structure = coerce_structure(json.loads(structure_json))
+            # Existing topics keep their completion bits, new ones get fresh bits
+            topic_bits, topic_bit_next = assign_topic_bits(
+                structure, course.get("topic_bits"), course.get("topic_bit_next", 0)
+            )
             thumbnail_url = course.get("thumbnail_url", "")
             if thumbnail:
-                upload_result = cloudinary.uploader.upload(thumbnail)
-                thumbnail_url = upload_result.get("secure_url")
+                thumbnail_url = storage().save(thumbnail, "image", folder="thumbnails")
 
             # Build a dict of original content_urls from existing course
-            old_structure = course.get("structure", {"modules": []})
+            old_structure = load_structure(course)
             original_urls = {}
             for mod in old_structure.get("modules", []):
                 for chap in mod.get("chapters", []):
@@ -524,35 +443,35 @@ def update_course(course_id):
                             continue  # content_url should be passed from form
 
                         elif uploaded_file:
-                            resource_type = "auto"
-                            if content_type == "video":
-                                resource_type = "video"
-                            elif content_type in ["pdf", "zip", "other"]:
-                                resource_type = "raw"
-                            elif content_type == "image":
-                                resource_type = "image"
-
-                            upload_result = cloudinary.uploader.upload(uploaded_file, resource_type=resource_type)
-                            topic["content_url"] = upload_result.get("secure_url")
+                            topic["content_url"] = storage().save(
+                                uploaded_file, resource_type_for(content_type), folder="topics"
+                            )
                         else:
                             # Fallback: use existing content_url if not re-uploaded
                             topic["content_url"] = original_urls.get(topic_id, "")
 
-            # Update course document
-            courses_collection.update_one(
-                {"_id": course_obj_id},
-                {"$set": {
-                    "title": title,
-                    "description": description,
-                    "category": category,
-                    "language": language,
-                    "difficulty": difficulty,
-                    "prerequisites": prerequisites,
-                    "learning_objectives": learning_objectives,
-                    "structure": structure,
-                    "thumbnail_url": thumbnail_url
-                }}
-            )
+            # Update course document; a new thumbnail drops the old one's variants
+            unset = ["structure"]
+            if thumbnail:
+                unset.append("thumbnail_variants")
+            previous = course_repo.update(course_obj_id, {
+                "title": title,
+                "description": description,
+                "category": category,
+                "language": language,
+                "difficulty": difficulty,
+                "prerequisites": prerequisites,
+                "learning_objectives": learning_objectives,
+                "outline": save_structure(course_obj_id, structure),
+                "stats": structure_stats(structure),
+                "topic_bits": topic_bits,
+                "topic_bit_next": topic_bit_next,
+                "thumbnail_url": thumbnail_url,
+            }, unset=unset)
+            invalidate_course(course_id)
+            if thumbnail:
+                discard_image("thumbnail_url", previous)
+                request_variants("thumbnail_url", course_obj_id, thumbnail_url)
 
             flash("Course updated successfully!", "success")
             return redirect(url_for("view_draft_course", course_id=course_id,page="courses"))
@@ -564,56 +483,254 @@ def update_course(course_id):
     # Preload structure for JS
     course["_id"] = str(course["_id"])
     course["instructor_id"] = str(course["instructor_id"])
-    course["structure"] = course.get("structure", {"modules": []})
+    course["structure"] = load_structure(course)
 
     return render_template("instructor/edit_course.html", course=course,page="courses")
 
 # PUBLISH
-@app.route("/instructor/course/<course_id>/publish", methods=["POST"])
+@routes.route("/instructor/course/<course_id>/publish", methods=["POST"])
 def publish_course(course_id):
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
-    courses_collection.update_one(
-        {"_id": ObjectId(course_id)},
-        {"$set": {"status": "published"}}
-    )
+    course_repo.set_status(ObjectId(course_id), "published")
+    invalidate_course(course_id)
     flash("Course published successfully!", "success")
     return redirect(url_for("instructor_my_courses"))
 
 # UNPUBLISH
-@app.route("/instructor/course/<course_id>/unpublish", methods=["POST"])
+@routes.route("/instructor/course/<course_id>/unpublish", methods=["POST"])
 def unpublish_course(course_id):
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
-    courses_collection.update_one(
-        {"_id": ObjectId(course_id)},
-        {"$set": {"status": "draft"}}
-    )
+    course_repo.set_status(ObjectId(course_id), "draft")
+    invalidate_course(course_id)
     flash("Course unpublished successfully!", "success")
     return redirect(url_for("instructor_my_courses"))
 
 # DELETE
-@app.route("/instructor/course/<course_id>/delete", methods=["POST"])
+@routes.route("/instructor/course/<course_id>/delete", methods=["POST"])
 def delete_course(course_id):
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
     
-    result = courses_collection.delete_one({"_id": ObjectId(course_id)})
-    if result.deleted_count == 1:
+    course = course_repo.delete_owned(ObjectId(course_id), ObjectId(session["user_id"]))
+    if course:
+        invalidate_course(course_id)
+        # Enrollments, enrolled_courses entries and files are cleaned up off the request path
+        submit_job(
+            "cascade_delete_course",
+            course_id=course["_id"],
+            asset_urls=course_asset_urls(course)
+        )
         flash("Course deleted successfully!", "success")
     else:
         flash("Failed to delete course.", "danger")
     return redirect(url_for("instructor_my_courses"))
 
+# ========== Bulk Enrollment ==========
+@routes.route("/instructor/course/<course_id>/enroll", methods=["POST"])
+def bulk_enroll_course(course_id):
+    """
+    Enroll a cohort: JSON {"student_ids": [...]} and/or {"emails": [...]}.
+    Instructors can enroll into their own courses, admins into any.
+    """
+    role = session.get("role")
+    if role not in ("instructor", "admin"):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    try:
+        course_oid = ObjectId(course_id)
+    except bson_errors.InvalidId:
+        return jsonify({"success": False, "message": "Course not found"}), 404
+    owner = ObjectId(session["user_id"]) if role == "instructor" else None
+    if not course_repo.owned(course_oid, owner, {"_id": 1}):
+        return jsonify({"success": False, "message": "Course not found"}), 404
+
+    data = request.get_json(silent=True) or {}
+    emails = [str(e).strip().lower() for e in data.get("emails") or [] if str(e).strip()]
+    ids = [ObjectId(i) for i in data.get("student_ids") or [] if ObjectId.is_valid(i)]
+    if not emails and not ids:
+        return jsonify({"success": False, "message": "No students given"}), 400
+    if len(emails) + len(ids) > MAX_BULK_ENROLL:
+        return jsonify({"success": False, "message": f"At most {MAX_BULK_ENROLL} students per request"}), 400
+
+    students = user_repo.students_matching(ids, emails)
+    found_ids = {s["_id"] for s in students}
+    found_emails = {s.get("email") for s in students}
+    not_found = [str(i) for i in ids if i not in found_ids] + [e for e in emails if e not in found_emails]
+
+    result = enroll_many([s["_id"] for s in students], course_oid)
+    return jsonify({"success": True, **result, "not_found": not_found})
+
+# ========== Roster Import ==========
+@routes.route("/instructor/roster/import", methods=["POST"])
+def import_roster_csv():
+    """
+    Create accounts from an uploaded CSV roster ("roster" file field) and
+    enroll them into the row's course_id or the form's course_id.
+    Instructors import students into their own courses; admins may also
+    import instructors and use any course. Hashing thousands of passwords
+    takes a while, so the import runs as a job: poll the returned status_url
+    for its report.
+    """
+    role = session.get("role")
+    if role not in ("instructor", "admin"):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    roster = request.files.get("roster")
+    if not roster:
+        return jsonify({"success": False, "message": "No roster file uploaded"}), 400
+
+    user_id = ObjectId(session["user_id"])
+    default_course = None
+    if request.form.get("course_id"):
+        allowed_courses = course_repo.ids(None if role == "admin" else user_id)
+        if not ObjectId.is_valid(request.form["course_id"]) or ObjectId(request.form["course_id"]) not in allowed_courses:
+            return jsonify({"success": False, "message": "Course not found"}), 404
+        default_course = ObjectId(request.form["course_id"])
+
+    try:
+        path = save_upload(roster.stream)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"success": False, "message": f"Unreadable roster: {e}"}), 400
+    job_id = submit_job("import_roster", path=path, requested_by=user_id, role=role, default_course=default_course)
+    return jsonify({
+        "success": True,
+        "job_id": str(job_id),
+        "status": "queued",
+        "status_url": url_for("roster_import_status", job_id=str(job_id)),
+    }), 202
+
+
+@routes.route("/instructor/roster/import/<job_id>")
+def roster_import_status(job_id):
+    """Status of a roster import; once done, its counts and per-row error report."""
+    role = session.get("role")
+    if role not in ("instructor", "admin"):
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    owner = {} if role == "admin" else {"requested_by": ObjectId(session["user_id"])}
+    job = find_job(job_id, "import_roster", **owner)
+    if not job:
+        return jsonify({"success": False, "message": "Import not found"}), 404
+    response = {"success": True, "job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        response.update(job["result"])
+    elif job["status"] == "failed":
+        response["message"] = job.get("error")
+    return jsonify(response)
+
+# ========== Export Course Analytics ==========
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = [
+    "student_id", "student_name", "student_email", "enrolled_at",
+    "progress", "update_date", "topics_completed",
+]
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else (value or "")
+
+def _parse_export_date(value):
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d")
+
+@routes.route("/instructor/course/<course_id>/export")
+def export_course_analytics(course_id):
+    """
+    Stream a course's enrollments as CSV (one row per active day) or
+    NDJSON (one object per enrollment). Enrollments made before the end of
+    the range are included; their daily progress is limited to the range.
+    """
+    if session.get("role") != "instructor":
+        return redirect(url_for("signin_signup"))
+
+    try:
+        course_obj_id = ObjectId(course_id)
+    except bson_errors.InvalidId:
+        return "Invalid course ID", 400
+
+    course = course_repo.owned(course_obj_id, ObjectId(session["user_id"]), {"title": 1})
+    if not course:
+        return "Course not found", 404
+
+    export_format = (request.args.get("format") or "csv").lower()
+    if export_format not in ("csv", "ndjson"):
+        return "Unsupported export format", 400
+
+    try:
+        date_from = _parse_export_date(request.args.get("from"))
+        date_to = _parse_export_date(request.args.get("to"))
+    except ValueError:
+        return "Dates must be YYYY-MM-DD", 400
+    if date_to:
+        date_to += timedelta(days=1)  # inclusive end day
+
+    cursor = enrollment_repo.export_rows(
+        course_obj_id,
+        enrolled_before=date_to,
+        first_day=day_key(date_from) if date_from else None,
+        end_day=day_key(date_to) if date_to else None,
+        batch_size=EXPORT_BATCH_SIZE,
+    )
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush():
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return data
+
+        writer.writerow(EXPORT_COLUMNS)
+        yield flush()
+        for e in cursor:
+            base = [
+                str(e.get("user_id", "")),
+                e.get("student_name") or "",
+                e.get("student_email") or "",
+                _iso(e.get("enrolled_at")),
+                e.get("progress", 0),
+            ]
+            days = e.get("progress_days") or [{"v": {}}]
+            for u in days:
+                writer.writerow(base + [u.get("k", ""), (u["v"] or {}).get("topics_completed", "")])
+            yield flush()
+
+    def generate_ndjson():
+        for e in cursor:
+            yield json.dumps({
+                "student_id": str(e.get("user_id", "")),
+                "student_name": e.get("student_name"),
+                "student_email": e.get("student_email"),
+                "enrolled_at": _iso(e.get("enrolled_at")) or None,
+                "progress": e.get("progress", 0),
+                "progress_updates": [
+                    {"date": u["k"], "topics_completed": (u["v"] or {}).get("topics_completed", 0)}
+                    for u in e.get("progress_days") or []
+                ],
+            }) + "\n"
+
+    if export_format == "csv":
+        body, mimetype = generate_csv(), "text/csv"
+    else:
+        body, mimetype = generate_ndjson(), "application/x-ndjson"
+
+    filename = f"course_{course_id}_analytics.{export_format}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # ========== Instructor Profile ==========
-@app.route("/instructor/profile")
+@routes.route("/instructor/profile")
 def instructor_profile():
     if "user_id" not in session or session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
-    user = db.users.find_one({"_id": ObjectId(session["user_id"])})
+    user = current_user()
 
     # 🔥 Fix: Parse `createdAt` to datetime if it exists
     if user and "createdAt" in user and isinstance(user["createdAt"], dict) and "$date" in user["createdAt"]:
@@ -629,13 +746,13 @@ from bson import ObjectId
 from collections import Counter
 from datetime import datetime
 
-@app.route('/instructor/analytics')
+@routes.route('/instructor/analytics')
 def instructor_analytics():
     if session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
     instructor_id = ObjectId(session["user_id"])
-    courses = list(db.courses.find({"instructor_id": instructor_id}))
+    courses = course_repo.by_instructor(instructor_id, COURSE_ANALYTICS, analytics=True)
 
     # --- Chart 1: Average Ratings ---
     rating_labels = []
@@ -659,7 +776,9 @@ def instructor_analytics():
     # --- Chart 3: Completion Rate (by month) ---
     # Collect all enrollments for this instructor's courses
     course_ids = [c["_id"] for c in courses]
-    enrollments = list(db.enrollments.find({"course_id": {"$in": course_ids}}))
+    enrollments = enrollment_repo.for_courses(
+        course_ids, {"progress": 1, "progress_by_day": 1}, completed=True, analytics=True
+    )
     # Calculate completions per month (last 6 months)
     now = datetime.utcnow()
     months = [(now.year, now.month - i if now.month - i > 0 else now.month - i + 12) for i in reversed(range(6))]
@@ -668,25 +787,20 @@ def instructor_analytics():
     for y, m in months:
         label = datetime(y, m, 1).strftime("%b %Y")
         month_labels.append(label)
+        month_prefix = f"{y:04d}-{m:02d}-"
         completions = 0
         for e in enrollments:
-            if e.get("progress", 0) >= 100:
-                completed = e.get("progress_updates", [])
-                # Find last update in this month
-                for u in completed:
-                    date = u.get("date")
-                    if date and isinstance(date, datetime):
-                        if date.year == y and date.month == m:
-                            completions += 1
-                            break
+            # Any activity in this month
+            if any(day.startswith(month_prefix) for day in e.get("progress_by_day") or {}):
+                completions += 1
         month_completions.append(completions)
 
     # --- Chart 4: Enrollments by Language ---
     lang_counter = Counter()
+    enrollment_counts = enrollment_repo.counts_by_course(course_ids, analytics=True)
     for c in courses:
         lang = c.get("language", "Unknown")
-        course_enrolls = db.enrollments.count_documents({"course_id": c["_id"]})
-        lang_counter[lang] += course_enrolls
+        lang_counter[lang] += enrollment_counts.get(c["_id"], 0)
     language_labels = list(lang_counter.keys())
     language_data = list(lang_counter.values())
     language_colors = ["#3b82f6", "#facc15", "#f87171", "#22d3ee", "#a78bfa", "#fb7185"] * 3
@@ -705,23 +819,23 @@ def instructor_analytics():
     )
 
 
-@app.route("/instructor/settings")
+@routes.route("/instructor/settings")
 def instructor_settings():
     if "user_id" not in session or session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
-    user = db.users.find_one({"_id": ObjectId(session["user_id"])})
+    user = current_user()
     return render_template("instructor/settings.html", page="settings",user=user)
 
-@app.route("/toggle-theme", methods=["POST"])
+@routes.route("/toggle-theme", methods=["POST"])
 def toggle_theme():
     current = request.cookies.get('theme', 'light')
     resp = redirect(request.referrer or url_for("instructor_dashboard"))
     resp.set_cookie('theme', 'dark' if current == 'light' else 'light', max_age=30*24*60*60)
     return resp
-import bcrypt
+from services.passwords import check_password, hash_password
 
-@app.route("/instructor/change-password", methods=["POST"])
+@routes.route("/instructor/change-password", methods=["POST"])
 def change_password():
     if session.get("role") != "instructor":
         flash("Unauthorized access. Please sign in.", "danger")
@@ -735,12 +849,12 @@ def change_password():
         flash("All fields are required.", "warning")
         return redirect(url_for("instructor_settings"))
 
-    user = db.users.find_one({"_id": ObjectId(session["user_id"])})
+    user = user_repo.get(ObjectId(session["user_id"]), USER_PASSWORD)
     if not user:
         flash("User not found.", "danger")
         return redirect(url_for("signin_signup"))
 
-    if not bcrypt.checkpw(current_password.encode('utf-8'), user["password"].encode('utf-8')):
+    if not check_password(current_password, user.get("password")):
         flash("Current password is incorrect.", "danger")
         return redirect(url_for("instructor_settings"))
 
@@ -748,13 +862,12 @@ def change_password():
         flash("New password and confirmation do not match.", "warning")
         return redirect(url_for("instructor_settings"))
 
-    hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    db.users.update_one({"_id": user["_id"]}, {"$set": {"password": hashed_password}})
+    user_repo.set_password(user["_id"], hash_password(new_password))
     flash("Password changed successfully!", "success")
 
     return redirect(url_for("instructor_settings"))
 
-@app.route("/instructor/update-profile", methods=["POST"])
+@routes.route("/instructor/update-profile", methods=["POST"])
 def update_profile():
     if "user_id" not in session or session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
@@ -773,19 +886,35 @@ def update_profile():
     if "profile_image" in request.files:
         image_file = request.files["profile_image"]
         if image_file and image_file.filename:
-            upload_result = cloudinary.uploader.upload(image_file, folder="ascend/profiles")
-            update_data["profile_image"] = upload_result["secure_url"]
-
-    db.users.update_one({"_id": user_id}, {"$set": update_data})
+            try:
+                update_data["profile_image"] = storage().save(image_file, "image", folder="profiles")
+            except ValueError as e:
+                flash(str(e), "danger")
+                return redirect(url_for("instructor_profile"))
+
+    unset = ["profile_image_variants"] if "profile_image" in update_data else None
+    previous = user_repo.update_profile(user_id, update_data, unset=unset)
+    if "profile_image" in update_data:
+        discard_image("profile_image", previous)
+        request_variants("profile_image", user_id, update_data["profile_image"])
+    # Course pages and cards show the instructor's name and photo
+    for course_id in course_repo.bump_instructor(user_id):
+        invalidate_course(course_id)
     flash("Profile updated successfully", "success")
     return redirect(url_for("instructor_profile"))
 
-@app.route("/instructor/delete-account", methods=["POST"])
+@routes.route("/instructor/delete-account", methods=["POST"])
 def delete_account():
     if "user_id" not in session or session.get("role") != "instructor":
         return redirect(url_for("signin_signup"))
 
-    result = db.users.delete_one({"_id": ObjectId(session["user_id"])})
+    user = user_repo.delete(ObjectId(session["user_id"]))
+    if user:
+        submit_job(
+            "cascade_delete_instructor",
+            user_id=user["_id"],
+            asset_urls=profile_asset_urls(user)
+        )
     session.clear()
     flash("Your account has been deleted permanently.", "info")
     return redirect(url_for("home"))  # or url_for("signin_signup")
@@ -0,0 +1,34 @@
+# controllers/media.py
+import os
+
+from flask import send_from_directory
+
+from extensions import routes
+from services.storage import MEDIA_ROOT
+
+# Stored names are random and never overwritten, so clients may keep them
+MEDIA_MAX_AGE = int((os.getenv("MEDIA_MAX_AGE") or str(365 * 24 * 3600)).strip())
+# Shown in the browser; anything else is downloaded
+INLINE_TYPES = ("image/", "video/", "application/pdf")
+
+
+# ===========================
+# Local Storage Media
+# ===========================
+@routes.route("/media/<path:key>")
+def media_file(key):
+    """
+    Files kept by the local storage driver. Range requests get 206 partial
+    responses (video seeking, PDF viewers), revisits get 304s from the
+    ETag/Last-Modified, and full responses go through the server's
+    wsgi.file_wrapper, which gunicorn sends with sendfile(). Uploads come
+    from users and share the app's origin, so they are never sniffed into
+    another type, run sandboxed, and only media types are shown inline.
+    """
+    response = send_from_directory(MEDIA_ROOT, key, conditional=True, max_age=MEDIA_MAX_AGE)
+    response.cache_control.immutable = True
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.headers["Content-Security-Policy"] = "sandbox"
+    if not (response.mimetype or "").startswith(INLINE_TYPES):
+        response.headers["Content-Disposition"] = "attachment"
+    return response
@@ -1,46 +1,64 @@
 from flask import request, render_template, redirect, url_for, session , abort ,current_app
 from bson import ObjectId
-from app import app, db ,enrollments_collection,users_collection 
-courses_collection = db.courses
-from datetime import datetime
+from extensions import routes
+from services.jobs import submit_job
+from services.progress import completed_topic_ids, day_key
+from services.progress_buffer import progress_buffer
+from services.leaderboard import forget_enrollment, student_rank, top_in_course, top_students, top_this_week
+from services.learning_stats import learning_stats
+from services.course_topics import course_outline, load_topics
+from services.enrollments import enroll
+from services.images import discard_image, request_variants
+from services.storage import storage
+import services.cascade  # registers the cascade_delete_* job handlers
+from services.cascade import profile_asset_urls
+from services.current_user import current_user
+from services.repository import (
+    COURSE_CARD, COURSE_PAGE, COURSE_PLAYER, INSTRUCTOR_CARD,
+    USER_ANALYTICS, USER_PASSWORD,
+    course_repo, enrollment_repo, user_repo,
+)
+from datetime import datetime, timedelta
 from flask import flash
 
 # ===========================
 # Student Dashboard
 # ===========================
-@app.route("/student/dashboard")
+@routes.route("/student/dashboard")
 def student_dashboard():
     if session.get("role") != "student":
         return redirect(url_for("signin_signup"))
 
-    student_id = session.get("user_id")
-    user = db.users.find_one({"_id": ObjectId(student_id)})
-    enrollments = list(db.enrollments.find({"user_id": ObjectId(student_id)}))
+    student_id = ObjectId(session.get("user_id"))
+    user = current_user()
 
-    enrolled_courses = []
-    for enroll in enrollments:
-        course = db.courses.find_one({"_id": enroll["course_id"]})
-        if course:
-            enrolled_courses.append({
-                "id": str(course["_id"]),
-                "title": course.get("title", "Untitled"),
-                "desc": course.get("description", ""),
-                "image": course.get("thumbnail_url", "/static/images/default.jpg"),
-                "progress": enroll.get("progress", 0)
-            })
+    # Cards, totals and the last 7 days of activity in one round trip
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    week_days = [today - timedelta(days=i) for i in range(6, -1, -1)]
+    result = enrollment_repo.student_overview(student_id, day_key(week_days[0]))
+
+    enrolled_courses = [{
+        "id": str(e["course"]["_id"]),
+        "title": e["course"].get("title", "Untitled"),
+        "desc": e["course"].get("description", ""),
+        "image": e["course"].get("thumbnail_url", "/static/images/default.jpg"),
+        "progress": e.get("progress", 0)
+    } for e in result.get("cards", [])]
+
+    totals = (result.get("totals") or [{}])[0]
+    weekly = {d["_id"]: d["topics"] for d in result.get("weekly", [])}
 
     stats = {
         "courses_enrolled": len(enrolled_courses),
-        "courses_completed": sum(1 for e in enrollments if e.get("progress", 0) >= 100),
-        "assignments": 7,
-        "topics_covered": 45
+        "courses_completed": totals.get("completed", 0),
+        "topics_covered": totals.get("topics", 0)
     }
 
     chart_data = {
         "course_labels": [c["title"] for c in enrolled_courses],
         "course_progress": [c["progress"] for c in enrolled_courses],
-        "weekly_days": ['Mon', 'Tue', 'Wed', 'Thu', 'Fri'],
-        "weekly_minutes": [30, 45, 25, 60, 50]
+        "weekly_days": [d.strftime("%a") for d in week_days],
+        "weekly_topics": [weekly.get(day_key(d), 0) for d in week_days]
     }
 
     return render_template("student/student-dashboard.html",
@@ -53,34 +71,35 @@ def student_dashboard():
 # ===========================
 # My Courses
 # ===========================
-@app.route("/student/my-courses")
+@routes.route("/student/my-courses")
 def student_my_courses():
     if session.get("role") != "student":
         return redirect(url_for("signin_signup"))
 
     user_id = session.get("user_id")
-    user = db.users.find_one({"_id": ObjectId(user_id)})
+    user = current_user()
 
     # Get user's enrollments (assuming enrollment doc has course_id as ObjectId or str)
-    enrollments = list(db.enrollments.find({"user_id": ObjectId(user_id)}))
+    enrollments = enrollment_repo.for_student(ObjectId(user_id), {"course_id": 1, "progress": 1})
 
     # Safe ObjectId conversion (if your course_id is stored as string)
     course_ids = [ObjectId(e["course_id"]) if not isinstance(e["course_id"], ObjectId) else e["course_id"] for e in enrollments]
     progress_lookup = {str(e["course_id"]): e.get("progress", 0) for e in enrollments}
 
-    # Fetch only published courses
-    courses_cursor = db.courses.find({"_id": {"$in": course_ids}, "status": "published"})
+    # Fetch only published courses, and their instructors' names in one query
+    published = course_repo.published_in(course_ids, COURSE_CARD)
+    instructor_names = user_repo.names({c["instructor_id"] for c in published if c.get("instructor_id")})
     courses = []
-    for course in courses_cursor:
+    for course in published:
         course_id_str = str(course["_id"])
-        instructor = db.users.find_one({"_id": ObjectId(course.get("instructor_id"))}) if course.get("instructor_id") else None
+        instructor_name = instructor_names.get(course.get("instructor_id"))
         courses.append({
             "_id": course_id_str,
             "title": course["title"],
             "description": course.get("description", ""),
             "image_url": course.get("thumbnail_url", "/static/images/placeholder.jpg"),
             "progress": progress_lookup.get(course_id_str, 0),
-            "instructor_name": instructor.get("fullname") if instructor else "Unknown Instructor",
+            "instructor_name": instructor_name or "Unknown Instructor",
             "rating": course.get("rating", 0),
             "slug": course.get("slug") or course_id_str,
         })
@@ -89,70 +108,63 @@ def student_my_courses():
 # ===========================
 # All Courses (Browse)
 # ===========================
-from bson import ObjectId
+from services.cache import CATALOG_LIST_TTL, course_fragment_key, fragment_cache, invalidate_course
+from services.catalog import CATALOG_SORTS, render_course_cards
+from services.search import FACET_FIELDS, search_courses
+from services.http_cache import course_etag, not_modified, private_response
 
-@app.route("/student/all-courses")
+CATALOG_PAGE_SIZE = 24
+
+@routes.route("/student/all-courses")
 def student_all_courses():
     if session.get("role") != "student":
         return redirect(url_for("signin_signup"))
 
-    user = db.users.find_one({"_id": ObjectId(session["user_id"])})
-    all_courses = list(db.courses.find({"status": "published"}))
-
-    for course in all_courses:
-        course["_id"] = str(course["_id"])
-        course["title"] = course.get("title", "No Title")
-        course["description"] = course.get("description", "No description available.")
-        course["rating"] = round(float(course.get("rating", 0)), 1)
-        course["thumbnail_url"] = course.get("thumbnail_url", "/static/images/placeholder.jpg")
-
-        # Structure and counts
-        structure = course.get("structure", {})
-        modules = structure.get("modules", [])
-        course["modules_count"] = len(modules)
-        course["chapters_count"] = sum(len(m.get("chapters", [])) for m in modules)
-        course["topics_count"] = sum(
-            len(ch.get("topics", [])) for m in modules for ch in m.get("chapters", [])
-        )
-
-        # ----- Calculate total expected time (sum of all topics' estimated_time, in minutes) -----
-        total_time = 0  # in minutes
-        for module in modules:
-            for chapter in module.get("chapters", []):
-                for topic in chapter.get("topics", []):
-                    try:
-                        est = float(topic.get("estimated_time", 0))
-                    except Exception:
-                        est = 0
-                    total_time += est
-
-        course["total_time"] = int(round(total_time))
-        # Pretty print: "X hrs Y min" or "Y min"
-        if total_time >= 60:
-            hours = int(total_time // 60)
-            minutes = int(total_time % 60)
-            if minutes > 0:
-                course["total_time_pretty"] = f"{hours} hrs {minutes} min"
-            else:
-                course["total_time_pretty"] = f"{hours} hrs"
-        else:
-            course["total_time_pretty"] = f"{int(total_time)} min"
-
-        # Instructor name
-        instructor = None
-        if course.get("instructor_id"):
-            try:
-                instructor = db.users.find_one({"_id": ObjectId(course.get("instructor_id"))})
-            except Exception:
-                instructor = None
-        course["instructor_name"] = instructor.get("fullname") if instructor else "Unknown Instructor"
+    user = current_user()
 
-        # Created at for sorting (safe fallback)
-        course["created_at"] = str(course.get("created_at", "2023-01-01T00:00:00"))
+    query = (request.args.get("q") or "").strip()
+    filters = {f: request.args.get(f) for f in FACET_FIELDS if request.args.get(f)}
+    if query or filters:
+        # Ranked text matches paged by number, or the filtered catalog paged by token
+        try:
+            page_num = int(request.args.get("page", 1))
+        except ValueError:
+            page_num = 1
+        try:
+            found = search_courses(query, filters, page=page_num, per_page=CATALOG_PAGE_SIZE,
+                                   after=request.args.get("after"))
+        except ValueError:
+            return redirect(url_for("student_all_courses", **filters))
+        return render_template("student/stallcourse.html",
+                               user=user,
+                               cards=render_course_cards(found["results"]),
+                               search=found,
+                               query=query,
+                               filters=filters,
+                               first_page=not request.args.get("after"),
+                               page="all-courses")
+
+    sort = request.args.get("sort", "newest")
+    if sort not in CATALOG_SORTS:
+        sort = "newest"
+    field, direction = CATALOG_SORTS[sort]
+    after = request.args.get("after")
+    list_key = f"catalog:{sort}:{after or ''}"
+    listing = fragment_cache.get(list_key)
+    if listing is None:
+        try:
+            listing = course_repo.catalog_page(field, direction, CATALOG_PAGE_SIZE, after=after)
+        except ValueError:
+            return redirect(url_for("student_all_courses", sort=sort))
+        fragment_cache.set(list_key, listing, ttl=CATALOG_LIST_TTL)
+    all_courses, next_cursor = listing
 
     return render_template("student/stallcourse.html",
                            user=user,
-                           courses=all_courses,
+                           cards=render_course_cards(all_courses),
+                           sort=sort,
+                           next_cursor=next_cursor,
+                           first_page=not request.args.get("after"),
                            page="all-courses")
 
 from flask import abort, session
@@ -160,25 +172,57 @@ from flask import abort, session
 from flask import render_template, redirect, url_for, session
 from bson import ObjectId
 
-@app.route('/student/course/<course_id>')
+@routes.route('/student/course/<course_id>')
 def student_view_course(course_id):
     # Require login
     if "user_id" not in session or session.get("role") != "student":
         return redirect(url_for("signin_signup"))
 
-    # Fetch course (must be published)
-    course = db.courses.find_one({
-        "_id": ObjectId(course_id),
-        "status": "published"
-    })
+    try:
+        course_oid = ObjectId(course_id)
+    except Exception:
+        return "Course not found", 404
+
+    # Only the version is needed to serve the shared body from cache
+    course = course_repo.get(course_oid, {"title": 1, "thumbnail_url": 1, "version": 1}, published=True)
     if not course:
         return "Course not found", 404
 
+    # Per-student part, rendered around the cached body
+    enrolled = enrollment_repo.is_enrolled(ObjectId(session["user_id"]), course_oid)
+
+    etag = course_etag("view", course, session["user_id"], enrolled)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    cache_key = course_fragment_key("detail", course_id, course.get("version"))
+    course_body = fragment_cache.get(cache_key)
+    if course_body is None:
+        course_body = render_template(
+            "student/course_detail_body.html",
+            course=_course_detail(course_oid)
+        )
+        fragment_cache.set(cache_key, course_body)
+
+    course["_id"] = course_id
+    course["thumbnail_url"] = course.get("thumbnail_url", "/static/images/placeholder.jpg")
+    return private_response(render_template(
+        "student/view_course.html",
+        course=course,
+        course_body=course_body,
+        enrolled=enrolled
+    ), etag)
+
+def _course_detail(course_oid):
+    """Full course document prepared for the shared course detail body."""
+    course = course_repo.get(course_oid, COURSE_PAGE)
+
     # Fetch instructor info
     instructor = None
     if course.get("instructor_id"):
         try:
-            instructor = db.users.find_one({"_id": ObjectId(course["instructor_id"])})
+            instructor = user_repo.get(ObjectId(course["instructor_id"]), INSTRUCTOR_CARD)
         except Exception:
             instructor = None
 
@@ -202,7 +246,8 @@ def student_view_course(course_id):
         course["learning_objectives"] = course.get("learning_objectives", "")
 
     # ---- STRUCTURE: normalize modules/chapters/topics ----
-    structure = course.get("structure", {})
+    # The outline has everything the detail page shows (titles, types, minutes)
+    structure = course_outline(course)
     modules = structure.get("modules", [])
     # Count for sidebar (premium stat)
     modules_count = len(modules)
@@ -254,82 +299,124 @@ def student_view_course(course_id):
     else:
         course["total_time_pretty"] = "-"
 
-    return render_template("student/view_course.html", course=course)
+    return course
 
 from flask import jsonify
 from datetime import datetime
 
-@app.route("/student/enroll/<course_id>", methods=["POST"])
+@routes.route("/student/enroll/<course_id>", methods=["POST"])
 def student_enroll_course(course_id):
     if "user_id" not in session or session.get("role") != "student":
         return jsonify({"success": False, "message": "Unauthorized"}), 401
 
-    user_id = session["user_id"]
-    user = db.users.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        return jsonify({"success": False, "message": "User not found"}), 404
-
-    course = db.courses.find_one({"_id": ObjectId(course_id), "status": "published"})
-    if not course:
+    try:
+        course_oid = ObjectId(course_id)
+    except Exception:
+        return jsonify({"success": False, "message": "Course not found"}), 404
+    if not course_repo.get(course_oid, {"_id": 1}, published=True):
         return jsonify({"success": False, "message": "Course not found"}), 404
 
-    # Already enrolled? (Check both: user & enrollments)
-    already_user = user.get("enrolled_courses", [])
-    already_enroll = db.enrollments.find_one({"user_id": ObjectId(user_id), "course_id": ObjectId(course_id)})
-
-    if ObjectId(course_id) in [ObjectId(cid) for cid in already_user] or already_enroll:
+    # The unique enrollment index does the duplicate check
+    if not enroll(ObjectId(session["user_id"]), course_oid):
         return jsonify({"success": False, "message": "Already enrolled in this course."}), 400
 
-    # Add course to user
-    db.users.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$addToSet": {"enrolled_courses": ObjectId(course_id)}}
-    )
-    # Add to enrollments
-    db.enrollments.insert_one({
-        "user_id": ObjectId(user_id),
-        "course_id": ObjectId(course_id),
-        "progress": 0,
-        "enrolled_at": datetime.utcnow()
-    })
-
     return jsonify({"success": True, "message": "Successfully enrolled in this course!"})
 
 
-@app.route("/student/course-player/<course_id>")
+@routes.route("/student/course-player/<course_id>")
 def student_course_player(course_id):
-    user = db.users.find_one({"_id": ObjectId(session["user_id"])})
     # 1. Require student login (your session convention)
     if "user_id" not in session or session.get("role") != "student":
         return redirect(url_for("signin_signup"))
 
-    # 2. Find course by ObjectId
-    course = db.courses.find_one({"_id": ObjectId(course_id)})
+    try:
+        course_oid = ObjectId(course_id)
+    except Exception:
+        abort(404)
+
+    # 2. Answer revisits from the version and the student's own state,
+    #    before loading the structure
+    head = course_repo.get(course_oid, {"version": 1})
+    if not head:
+        abort(404)
+    user = current_user()
+    enrollment = enrollment_repo.get(
+        ObjectId(session["user_id"]), course_oid, {"completed_bits": 1, "last_position": 1}
+    ) or {}
+    completed_bits = enrollment.get("completed_bits") or {}
+    last_position = enrollment.get("last_position")
+    user_parts = [user.get(f) for f in ("fullname", "profile_image", "photo_url")] if user else []
+    etag = course_etag(
+        "player", head, session["user_id"], *user_parts,
+        sorted(completed_bits.items()), (last_position or {}).get("updated_at")
+    )
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Topic bodies aren't rendered; the player fetches them per module
+    course = course_repo.get(course_oid, COURSE_PLAYER)
     if not course:
         abort(404)
+    course["structure"] = course_outline(course)
 
     # 3. Find instructor name, fallback to 'Unknown'
     instructor_name = "Unknown"
     if course.get("instructor_id"):
-        instructor = db.users.find_one({"_id": course["instructor_id"]})
+        instructor = user_repo.get(course["instructor_id"], {"fullname": 1})
         if instructor and instructor.get("fullname"):
             instructor_name = instructor["fullname"]
     course["instructor_name"] = instructor_name
 
     # 4. Render the Jinja2 template
-    return render_template(
+    return private_response(render_template(
         "student/course_player.html",
-        course=course,user =user
-    )
+        course=course,user =user,
+        completed_topics=completed_topic_ids(completed_bits, course.get("topic_bits")),
+        last_position=last_position
+    ), etag)
 
 
-@app.route("/student/course/<course_id>/review", methods=["POST"])
+@routes.route("/student/course/<course_id>/module/<int:module_index>")
+def student_course_module(course_id, module_index):
+    """Topic bodies of one module (or ?chapter=N of it) for the course player."""
+    if "user_id" not in session or session.get("role") != "student":
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    try:
+        course_oid = ObjectId(course_id)
+        chapter_index = request.args.get("chapter", type=int)
+    except Exception:
+        return jsonify({"success": False, "message": "Course not found"}), 404
+
+    head = course_repo.get(course_oid, {"version": 1, "outline.modules.title": 1})
+    if not head:
+        return jsonify({"success": False, "message": "Course not found"}), 404
+    etag = course_etag("module", head, module_index, chapter_index)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    if "outline" not in head:
+        # Not split yet: the topics are still embedded in the course
+        head = course_repo.get(course_oid, {"structure": 1})
+    topics = [
+        {f: t.get(f) for f in ("topic_id", "title", "description", "content_type", "content_url", "chapter")}
+        for t in load_topics(head, module_index, chapter_index)
+    ]
+    return private_response(jsonify({"success": True, "module": module_index, "topics": topics}), etag)
+
+
+@routes.route("/student/course/<course_id>/review", methods=["POST"])
 def student_course_review(course_id):
     # Only allow students
     if session.get("role") != "student":
         return jsonify({"success": False, "msg": "Login required."}), 401
 
-    course = db.courses.find_one({"_id": ObjectId(course_id), "status": "published"})
+    try:
+        course_oid = ObjectId(course_id)
+    except Exception:
+        return jsonify({"success": False, "msg": "Course not found."}), 404
+    course = course_repo.get(course_oid, {"reviews.email": 1}, published=True)
     if not course:
         return jsonify({"success": False, "msg": "Course not found."}), 404
 
@@ -356,10 +443,8 @@ def student_course_review(course_id):
         "date": datetime.utcnow()
     }
 
-    db.courses.update_one(
-        {"_id": ObjectId(course_id)},
-        {"$push": {"reviews": review}}
-    )
+    course_repo.add_review(course_oid, review)
+    invalidate_course(course_id)
 
     return jsonify({"success": True, "msg": "Review submitted!"}), 200
 
@@ -367,82 +452,87 @@ from flask import jsonify, request
 
 from datetime import datetime
 
-@app.route("/student/update-progress/<course_id>", methods=["POST"])
+def _progress_event(user_id, course_id, data):
+    """
+    (user_id, course_id, completed_topic_id, position) from a posted event:
+    {"topic_id", "completed": bool, "position": seconds/page into the topic}.
+    The percentage is derived server-side, so a client "progress" is ignored.
+    """
+    topic_id = data.get("topic_id")
+    if topic_id is not None and (not isinstance(topic_id, str) or len(topic_id) > 100):
+        raise ValueError("Invalid topic_id")
+    completed = topic_id if topic_id and data.get("completed") else None
+    position = None
+    if topic_id and data.get("position") is not None:
+        position = {
+            "topic_id": topic_id,
+            "position": max(float(data["position"]), 0.0),
+            "updated_at": datetime.utcnow()
+        }
+    return (user_id, ObjectId(course_id), completed, position)
+
+
+@routes.route("/student/update-progress/<course_id>", methods=["POST"])
 def update_student_progress(course_id):
     if "user_id" not in session or session.get("role") != "student":
         return "Unauthorized", 401
     user_id = ObjectId(session["user_id"])
     try:
         data = request.get_json(force=True)
-        percent = int(data.get("progress", 0))
-        topics_completed = int(data.get("topics_completed", 1))  # Default to 1 if not passed
-
-        # Always update progress
-        db.enrollments.update_one(
-            {"user_id": user_id, "course_id": ObjectId(course_id)},
-            {"$set": {"progress": percent}}
-        )
-
-        # Log progress update (append for every call, or, if you want, only one log per day)
-        today = datetime.utcnow().date()
-        # Check if an update for today exists:
-        enrollment = db.enrollments.find_one({"user_id": user_id, "course_id": ObjectId(course_id)})
-        found = False
-        if enrollment and "progress_updates" in enrollment:
-            for upd in enrollment["progress_updates"]:
-                # If date is a datetime object, compare just date portion:
-                if isinstance(upd.get("date"), datetime):
-                    upd_date = upd["date"].date()
-                else:
-                    try:
-                        upd_date = datetime.strptime(str(upd.get("date"))[:10], "%Y-%m-%d").date()
-                    except Exception:
-                        continue
-                if upd_date == today:
-                    found = True
-                    # Optionally, increment topics_completed for today instead of appending a new log
-                    db.enrollments.update_one(
-                        {
-                            "user_id": user_id,
-                            "course_id": ObjectId(course_id),
-                            "progress_updates.date": upd["date"]
-                        },
-                        {"$inc": {"progress_updates.$.topics_completed": topics_completed}}
-                    )
-                    break
-
-        if not found:
-            # Add a new log for today
-            db.enrollments.update_one(
-                {"user_id": user_id, "course_id": ObjectId(course_id)},
-                {"$push": {
-                    "progress_updates": {
-                        "date": datetime.utcnow(),
-                        "topics_completed": topics_completed
-                    }
-                }}
-            )
+        # Acknowledged once journaled; written to Mongo by the next flush
+        progress_buffer().add([_progress_event(user_id, course_id, data)])
 
         return "ok"
     except Exception as e:
         return str(e), 400
 
 
+MAX_PROGRESS_BATCH = 200
+
+@routes.route("/student/progress/batch", methods=["POST"])
+def student_progress_batch():
+    """
+    Accepts {"events": [{"course_id", "topic_id", "completed", "position"}, ...]}
+    across any of the student's courses. The whole batch is journaled before
+    the response is sent, so a 200 means none of it can be lost.
+    """
+    if "user_id" not in session or session.get("role") != "student":
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    user_id = ObjectId(session["user_id"])
+
+    data = request.get_json(force=True, silent=True) or {}
+    raw_events = data.get("events")
+    if not isinstance(raw_events, list) or not raw_events:
+        return jsonify({"success": False, "message": "events must be a non-empty list"}), 400
+    if len(raw_events) > MAX_PROGRESS_BATCH:
+        return jsonify({"success": False, "message": f"At most {MAX_PROGRESS_BATCH} events per batch"}), 400
+
+    try:
+        events = [_progress_event(user_id, e["course_id"], e) for e in raw_events]
+    except Exception:
+        return jsonify({"success": False, "message": "Invalid progress event"}), 400
+
+    progress_buffer().add(events)
+    return jsonify({"success": True, "accepted": len(events)})
+
+
 # ===========================
 # Student Analytics
 # ===========================
 from datetime import datetime, timedelta
-@app.route("/student/analytics")
+@routes.route("/student/analytics")
 def student_analytics():
     if session.get("role") != "student":
         return redirect(url_for("signin_signup"))
 
     user_id = ObjectId(session["user_id"])
-    user = db.users.find_one({"_id": user_id}) or {}
+    user = user_repo.get(user_id, USER_ANALYTICS) or {}
 
     # --- 1. Courses Overview ---
-    total_courses = db.courses.count_documents({"status": "published"}) or 0
-    enrollments = list(db.enrollments.find({"user_id": user_id}))
+    total_courses = course_repo.count_published() or 0
+    enrollments = enrollment_repo.for_student(
+        user_id, {"course_id": 1, "progress": 1, "progress_by_day": 1}, analytics=True
+    )
     enrolled_count = len(enrollments)
     completed_count = sum(1 for e in enrollments if e.get("progress", 0) >= 100)
     courses_overview = {
@@ -455,37 +545,31 @@ def student_analytics():
     }
 
     # --- 2. Student Leaderboard (Top 5 by completed courses, always show self) ---
-    pipeline = [
-        {"$match": {"role": "student"}},
-        {"$lookup": {
-            "from": "enrollments",
-            "localField": "_id",
-            "foreignField": "user_id",
-            "as": "my_enrollments"
-        }},
-        {"$addFields": {
-            "courses_completed": {
-                "$size": {
-                    "$filter": {
-                        "input": "$my_enrollments",
-                        "as": "e",
-                        "cond": {"$gte": ["$$e.progress", 100]}
-                    }
-                }
-            }
-        }},
-        {"$sort": {"courses_completed": -1}},
-        {"$limit": 5},
-        {"$project": {"fullname": 1, "courses_completed": 1}}
-    ]
-    leaderboard = list(db.users.aggregate(pipeline))
-    leader_labels = [u.get("fullname", "Student") for u in leaderboard]
-    leader_data = [u.get("courses_completed", 0) for u in leaderboard]
+    leaderboard = top_students(5)
+    # ...and this week's and one enrolled course's top 5 by topics completed;
+    # the course defaults to the one with the latest activity
+    week_board = top_this_week(5)
+    course_titles = course_repo.titles(e["course_id"] for e in enrollments if e.get("course_id"))
+    board_course = request.args.get("course")
+    if board_course not in {str(c) for c in course_titles}:
+        latest = max(
+            (e for e in enrollments if e.get("course_id") in course_titles),
+            key=lambda e: max(e.get("progress_by_day") or {"": None}),
+            default=None
+        )
+        board_course = str(latest["course_id"]) if latest else None
+    course_board = top_in_course(ObjectId(board_course), 5) if board_course else []
+    names = user_repo.names(
+        {l["_id"] for l in leaderboard} | {l["user_id"] for l in week_board + course_board}
+    )
+    leader_labels = [names.get(l["_id"]) or "Student" for l in leaderboard]
+    leader_data = [l.get("courses_completed", 0) for l in leaderboard]
     # Ensure current student is shown even if not top 5:
     user_name = user.get("fullname", "You")
-    if user_name not in leader_labels:
-        leader_labels.append(user_name)
-        leader_data.append(completed_count)
+    if user_id not in [l["_id"] for l in leaderboard]:
+        my_rank, my_score = student_rank(user_id)
+        leader_labels.append(f"{user_name} (#{my_rank})")
+        leader_data.append(my_score)
     leaderboard_chart = {
         "labels": leader_labels if leader_labels else ["You"],
         "datasets": [{
@@ -495,101 +579,34 @@ def student_analytics():
         }]
     }
 
+    def topics_chart(board, color):
+        return {
+            "labels": [names.get(l["user_id"]) or "Student" for l in board],
+            "datasets": [{
+                "label": "Topics Completed",
+                "data": [l.get("topics_completed", 0) for l in board],
+                "backgroundColor": color
+            }]
+        }
+
+    week_leaderboard_chart = topics_chart(week_board, "#10b981")
+    course_leaderboard_chart = topics_chart(course_board, "#a78bfa")
+
     # --- 3. Learning Time Comparison (min) ---
-    my_minutes = 0
-    course_ids = [e.get("course_id") for e in enrollments if e.get("course_id")]
-    my_courses = db.courses.find({"_id": {"$in": course_ids}}) if course_ids else []
-    for course in my_courses:
-        structure = course.get("structure", {})
-        total_time = 0
-        for m in structure.get("modules", []):
-            for ch in m.get("chapters", []):
-                for t in ch.get("topics", []):
-                    try:
-                        total_time += float(t.get("estimated_time", 0))
-                    except Exception:
-                        pass
-        enroll = next((e for e in enrollments if e.get("course_id") == course["_id"]), None)
-        percent = enroll.get("progress", 0) if enroll else 0
-        my_minutes += int((percent / 100) * total_time) if total_time else 0
-
-    # Aggregate average/top for all students
-    pipeline_time = [
-        {"$match": {"role": "student"}},
-        {"$lookup": {
-            "from": "enrollments",
-            "localField": "_id",
-            "foreignField": "user_id",
-            "as": "my_enrollments"
-        }},
-        {"$unwind": {"path": "$my_enrollments", "preserveNullAndEmptyArrays": True}},
-        {"$lookup": {
-            "from": "courses",
-            "localField": "my_enrollments.course_id",
-            "foreignField": "_id",
-            "as": "the_course"
-        }},
-        {"$unwind": {"path": "$the_course", "preserveNullAndEmptyArrays": True}},
-        {"$addFields": {
-            "course_time": {
-                "$reduce": {
-                    "input": {
-                        "$map": {
-                            "input": {
-                                "$ifNull": [
-                                    {"$getField": {"field": "modules", "input": "$the_course.structure"}}, []
-                                ]
-                            },
-                            "as": "m",
-                            "in": {
-                                "$sum": {
-                                    "$map": {
-                                        "input": {"$ifNull": ["$$m.chapters", []]},
-                                        "as": "ch",
-                                        "in": {
-                                            "$sum": {
-                                                "$map": {
-                                                    "input": {"$ifNull": ["$$ch.topics", []]},
-                                                    "as": "t",
-                                                    "in": {"$toDouble": {"$ifNull": ["$$t.estimated_time", 0]}}
-                                                }
-                                            }
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "initialValue": 0,
-                    "in": {"$add": ["$$value", "$$this"]}
-                }
-            }
-        }},
-        {"$addFields": {
-            "actual_time": {
-                "$multiply": [
-                    {"$divide": [{"$ifNull": ["$my_enrollments.progress", 0]}, 100]},
-                    {"$ifNull": ["$course_time", 0]}
-                ]
-            }
-        }},
-        {"$group": {
-            "_id": "$_id",
-            "fullname": {"$first": "$fullname"},
-            "total_time": {"$sum": "$actual_time"}
-        }},
-        {"$sort": {"total_time": -1}}
-    ]
-    student_time_stats = list(db.users.aggregate(pipeline_time))
-    all_times = [s.get("total_time", 0) for s in student_time_stats if s.get("total_time", 0) > 0]
-    avg_time = round(sum(all_times) / len(all_times), 1) if all_times else 0
-    top_time = round(max(all_times), 1) if all_times else 0
+    # Running total kept by progress writes; class figures refreshed periodically
+    my_minutes = float(user.get("learning_minutes") or 0)
+    class_stats = learning_stats()
     time_comparison_chart = {
-        "labels": [user_name, "Average", "Top Student"],
+        "labels": [user_name, "Average", "Median", "Top Student"],
         "datasets": [{
             "label": "Learning Time (min)",
-            "data": [round(my_minutes, 1), avg_time, top_time],
-            "backgroundColor": ["#3b82f6", "#10b981", "#f59e42"]
+            "data": [
+                round(my_minutes, 1),
+                class_stats.get("average", 0),
+                (class_stats.get("percentiles") or {}).get("p50", 0),
+                class_stats.get("top", 0)
+            ],
+            "backgroundColor": ["#3b82f6", "#10b981", "#a78bfa", "#f59e42"]
         }]
     }
 
@@ -598,14 +615,11 @@ def student_analytics():
     last_week = [today - timedelta(days=i) for i in range(6, -1, -1)]
     week_labels = [d.strftime("%a") for d in last_week]
     daily_counts = [0 for _ in range(7)]
+    week_index = {day_key(dt): idx for idx, dt in enumerate(last_week)}
     for enroll in enrollments:
-        if "progress_updates" in enroll and enroll["progress_updates"]:
-            for update in enroll["progress_updates"]:
-                upd_day = update.get("date")
-                if isinstance(upd_day, datetime):
-                    for idx, dt in enumerate(last_week):
-                        if upd_day.date() == dt.date():
-                            daily_counts[idx] += update.get("topics_completed", 0)
+        for day, counters in (enroll.get("progress_by_day") or {}).items():
+            if day in week_index:
+                daily_counts[week_index[day]] += (counters or {}).get("topics_completed", 0)
     weekly_activity_chart = {
         "labels": week_labels,
         "datasets": [{
@@ -624,7 +638,9 @@ def student_analytics():
 
     courses_overview = ensure_chart(courses_overview, ["Total Published", "Enrolled", "Completed"])
     leaderboard_chart = ensure_chart(leaderboard_chart, ["You"])
-    time_comparison_chart = ensure_chart(time_comparison_chart, ["You", "Average", "Top Student"])
+    week_leaderboard_chart = ensure_chart(week_leaderboard_chart, [user_name])
+    course_leaderboard_chart = ensure_chart(course_leaderboard_chart, [user_name])
+    time_comparison_chart = ensure_chart(time_comparison_chart, ["You", "Average", "Median", "Top Student"])
     weekly_activity_chart = ensure_chart(weekly_activity_chart, week_labels)
 
     return render_template(
@@ -632,6 +648,10 @@ def student_analytics():
         user=user,
         courses_overview=courses_overview,
         leaderboard_chart=leaderboard_chart,
+        week_leaderboard_chart=week_leaderboard_chart,
+        course_leaderboard_chart=course_leaderboard_chart,
+        course_titles={str(c): t for c, t in course_titles.items()},
+        board_course=board_course,
         time_comparison_chart=time_comparison_chart,
         weekly_activity_chart=weekly_activity_chart,
         page="analytics"
@@ -642,14 +662,14 @@ def student_analytics():
 # ===========================
 import os
 
-@app.route('/student/profile', methods=['GET', 'POST'])
+@routes.route('/student/profile', methods=['GET', 'POST'])
 def student_profile():
     # Ensure user is logged in as student
     if session.get("role") != "student":
         return redirect(url_for("signin_signup"))
 
     user_id = ObjectId(session["user_id"])
-    user = db.users.find_one({"_id": user_id})
+    user = current_user()
 
     if not user:
         flash("User not found!", "danger")
@@ -658,7 +678,7 @@ def student_profile():
     if request.method == "POST":
         # Remove photo
         if request.form.get("remove_photo") == "1":
-            db.users.update_one({"_id": user_id}, {"$unset": {"profile_image": ""}})
+            discard_image("profile_image", user_repo.remove_photo(user_id))
             flash("Profile photo removed.", "success")
             return redirect(url_for('student_profile'))
 
@@ -682,15 +702,18 @@ def student_profile():
         # Handle profile image upload
         file = request.files.get("profile_image")
         if file and file.filename:
-            filename = f"student_{str(user_id)}_{file.filename}"
-            upload_dir = os.path.join(current_app.root_path, 'static', 'uploads')
-            os.makedirs(upload_dir, exist_ok=True)
-            file_path = os.path.join(upload_dir, filename)
-            file.save(file_path)
-            profile_image_url = f"/static/uploads/{filename}"
-            update_data["profile_image"] = profile_image_url
-
-        db.users.update_one({"_id": user_id}, {"$set": update_data})
+            try:
+                update_data["profile_image"] = storage().save(file, "image", folder="profiles")
+            except ValueError as e:
+                flash(str(e), "danger")
+                return redirect(url_for('student_profile'))
+
+        # A new photo drops the old one's variants
+        unset = ["profile_image_variants"] if "profile_image" in update_data else None
+        previous = user_repo.update_profile(user_id, update_data, unset=unset)
+        if "profile_image" in update_data:
+            discard_image("profile_image", previous)
+            request_variants("profile_image", user_id, update_data["profile_image"])
         session["fullname"] = fullname
         flash("Profile updated!", "success")
         return redirect(url_for('student_profile'))
@@ -702,10 +725,10 @@ def student_profile():
 # ===========================
 from flask import request, redirect, url_for, flash, session, render_template
 from bson import ObjectId
-import bcrypt
+from services.passwords import check_password, hash_password
 
 
-@app.route("/student/settings", methods=["GET"])
+@routes.route("/student/settings", methods=["GET"])
 def student_settings():
     if session.get("role") != "student":
         return redirect(url_for("signin_signup"))
@@ -714,20 +737,13 @@ def student_settings():
     if not user_id:
         return redirect(url_for("signin_signup"))
 
-    # Fetch user from DB - adjust to your user collection
-    user = db.users.find_one({"_id": ObjectId(user_id)})
+    user = current_user()
     if not user:
         return redirect(url_for("signin_signup"))
 
-    # Get enrolled courses for this student
-    enrolled = enrollments_collection.find({"student_id": ObjectId(user_id)})
-    enrolled_course_ids = [e.get("course_id") for e in enrolled]
-
-    # Fetch course details for enrolled courses
-    enrolled_courses = list(courses_collection.find({
-        "_id": {"$in": enrolled_course_ids},
-        "status": "published"
-    }))
+    # Published courses the student is enrolled in (for the unenroll picker)
+    enrolled = enrollment_repo.for_student(ObjectId(user_id), {"course_id": 1})
+    enrolled_courses = course_repo.published_in([e.get("course_id") for e in enrolled], {"title": 1})
 
     return render_template(
         "student/settings.html",
@@ -737,7 +753,7 @@ def student_settings():
     )
 
 
-@app.route("/student/unenroll", methods=["POST"])
+@routes.route("/student/unenroll", methods=["POST"])
 def student_unenroll():
     if session.get("role") != "student":
         return jsonify({"success": False, "msg": "Login required."}), 401
@@ -757,20 +773,15 @@ def student_unenroll():
     except Exception:
         return jsonify({"success": False, "msg": "Invalid Course ID."}), 400
 
-    enrollment = enrollments_collection.find_one({
-        "student_id": ObjectId(user_id),
-        "course_id": course_oid
-    })
+    enrollment = enrollment_repo.remove(ObjectId(user_id), course_oid)
     if not enrollment:
         return jsonify({"success": False, "msg": "You are not enrolled in this course."}), 400
-
-    # Delete enrollment record to unenroll
-    enrollments_collection.delete_one({"_id": enrollment["_id"]})
+    forget_enrollment(ObjectId(user_id), course_oid, enrollment)
 
     return jsonify({"success": True, "msg": "Unenrolled from course successfully."})
 
 
-@app.route("/student/change-password", methods=["POST"])
+@routes.route("/student/change-password", methods=["POST"])
 def student_change_password():
     if session.get("role") != "student":
         return jsonify({"success": False, "msg": "Login required."}), 401
@@ -779,7 +790,7 @@ def student_change_password():
     if not user_id:
         return jsonify({"success": False, "msg": "Login required."}), 401
 
-    user = users_collection.find_one({"_id": ObjectId(user_id)})
+    user = user_repo.get(ObjectId(user_id), USER_PASSWORD)
     if not user:
         return jsonify({"success": False, "msg": "User not found."}), 404
 
@@ -794,17 +805,16 @@ def student_change_password():
     if new_password != confirm_password:
         return jsonify({"success": False, "msg": "New password and confirmation do not match."}), 400
 
-    if not check_password_hash(user["password"], old_password):
+    if not check_password(old_password, user.get("password")):
         return jsonify({"success": False, "msg": "Current password is incorrect."}), 400
 
-    new_password_hash = generate_password_hash(new_password)
-    users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": {"password": new_password_hash}})
+    user_repo.set_password(ObjectId(user_id), hash_password(new_password))
 
     return jsonify({"success": True, "msg": "Password updated successfully."})
 
 
 
-@app.route("/student/delete-account", methods=["POST"])
+@routes.route("/student/delete-account", methods=["POST"])
 def student_delete_account():
     if session.get("role") != "student":
         return jsonify({"success": False, "msg": "Login required."}), 401
@@ -813,11 +823,14 @@ def student_delete_account():
     if not user_id:
         return jsonify({"success": False, "msg": "Login required."}), 401
 
-    # Delete enrollments of the user
-    enrollments_collection.delete_many({"student_id": ObjectId(user_id)})
-
-    # Delete user document
-    users_collection.delete_one({"_id": ObjectId(user_id)})
+    # Delete user document; enrollments and uploads are removed in the background
+    user = user_repo.delete(ObjectId(user_id))
+    if user:
+        submit_job(
+            "cascade_delete_student",
+            user_id=user["_id"],
+            asset_urls=profile_asset_urls(user)
+        )
 
     # Clear session
     session.clear()
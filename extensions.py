@@ -0,0 +1,167 @@
+# extensions.py
+import os
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.read_preferences import SecondaryPreferred
+
+load_dotenv()
+
+# What controllers and services share, importable without building the app
+# or touching the network: the route collector, paths, and Mongo handles
+# that connect on first use. The client is created once per process (and
+# again after a fork), so gunicorn --preload workers never share sockets
+# with the parent.
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+INSTANCE_PATH = os.path.join(ROOT_PATH, "instance")
+STATIC_FOLDER = os.path.join(ROOT_PATH, "static")
+
+# ---------------- MONGO ----------------
+MONGO_URI = (os.getenv("MONGO_URI") or "").strip()   # ✅ STRIP NEWLINES/SPACES
+DB_NAME = (os.getenv("DB_NAME") or "Ascend").strip()
+
+if not MONGO_URI:
+    raise RuntimeError("❌ MONGO_URI is missing in Render env vars")
+
+# Ensure standard options exist (and no newline issues)
+if "retryWrites=" not in MONGO_URI:
+    joiner = "&" if "?" in MONGO_URI else "?"
+    MONGO_URI = f"{MONGO_URI}{joiner}retryWrites=true"
+
+if "w=" not in MONGO_URI:
+    MONGO_URI = f"{MONGO_URI}&w=majority" if "?" in MONGO_URI else f"{MONGO_URI}?w=majority"
+
+
+def _env_int(name, default):
+    return int((os.getenv(name) or str(default)).strip())
+
+
+# Pool sizing is per process: each gunicorn worker has its own client
+MONGO_OPTIONS = {
+    "serverSelectionTimeoutMS": 8000,
+    "connectTimeoutMS": 8000,
+    "socketTimeoutMS": 8000,
+    "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+    "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+    "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+}
+
+# Analytics, catalog and leaderboard reads go to a secondary when one is
+# fresh enough (max staleness is at least 90s), keeping the primary free for
+# progress writes and sign-ins; a standalone server or a replica set without
+# a usable secondary just serves them from the primary.
+ANALYTICS_MAX_STALENESS_S = _env_int("MONGO_ANALYTICS_MAX_STALENESS_S", 120)
+ANALYTICS_READ_PREFERENCE = SecondaryPreferred(max_staleness=ANALYTICS_MAX_STALENESS_S)
+# Server-side limit for aggregations run while a request waits on them
+AGGREGATION_MAX_TIME_MS = _env_int("MONGO_AGGREGATION_MAX_TIME_MS", 10000)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """This process's MongoClient (created lazily; pymongo clients aren't fork-safe)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = MongoClient(MONGO_URI, **MONGO_OPTIONS)
+                _client_pid = os.getpid()
+    return _client
+
+
+@contextmanager
+def listening_client(*listeners):
+    """
+    Send this process's Mongo calls through a client that reports every
+    command to `listeners` (pymongo.monitoring) until the block ends. The
+    swap is process-wide, so it is for single-threaded CLI tools only.
+    """
+    global _client, _client_pid
+    listening = MongoClient(MONGO_URI, event_listeners=list(listeners), **MONGO_OPTIONS)
+    with _client_lock:
+        saved = _client, _client_pid
+        _client, _client_pid = listening, os.getpid()
+    try:
+        yield listening
+    finally:
+        with _client_lock:
+            _client, _client_pid = saved
+        listening.close()
+
+
+class _LazyClient:
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+
+def _database(read_preference=None):
+    if read_preference is None:
+        return get_client()[DB_NAME]
+    return get_client().get_database(DB_NAME, read_preference=read_preference)
+
+
+class _LazyCollection:
+    """A collection handle that can be kept at import time; resolves per call."""
+
+    def __init__(self, name, read_preference=None):
+        self.name = name
+        self._read_preference = read_preference
+
+    def __getattr__(self, attr):
+        return getattr(_database(self._read_preference)[self.name], attr)
+
+    def __repr__(self):
+        return f"<lazy collection {DB_NAME}.{self.name}>"
+
+
+class _LazyDatabase:
+    """db.users / db["users"] give lazy collections; Database methods are passed through."""
+
+    name = DB_NAME
+
+    def __init__(self, read_preference=None):
+        self._read_preference = read_preference
+
+    def __getattr__(self, name):
+        if name.startswith("_") or hasattr(Database, name):
+            return getattr(_database(self._read_preference), name)
+        return _LazyCollection(name, self._read_preference)
+
+    def __getitem__(self, name):
+        return _LazyCollection(name, self._read_preference)
+
+
+client = _LazyClient()
+db = _LazyDatabase()
+analytics_db = _LazyDatabase(ANALYTICS_READ_PREFERENCE)
+
+
+# ---------------- ROUTES ----------------
+class Routes:
+    """
+    Collects views declared with @routes.route(...) so controllers don't
+    import the app; init_app() registers them under the endpoint names
+    Flask would have given them (the function name), so url_for is unchanged.
+    """
+
+    def __init__(self):
+        self._rules = []
+
+    def route(self, rule, **options):
+        def decorator(view):
+            self._rules.append((rule, options.pop("endpoint", view.__name__), view, options))
+            return view
+        return decorator
+
+    def init_app(self, app):
+        for rule, endpoint, view, options in self._rules:
+            app.add_url_rule(rule, endpoint, view, **options)
+
+
+routes = Routes()
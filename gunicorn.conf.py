@@ -0,0 +1,26 @@
+# gunicorn.conf.py — `gunicorn app:app` picks this file up from the working directory.
+#
+# The app is imported once in the master and workers fork from it, so a new
+# or restarted worker serves straight away: importing app.py doesn't connect
+# to Mongo or hash anything, and each worker opens its own client on first
+# use (extensions.get_client). Run `flask bootstrap` once per deploy (e.g.
+# as the release/pre-deploy command) to seed the admin account and indexes.
+import os
+
+bind = f"0.0.0.0:{(os.getenv('PORT') or '5000').strip()}"
+workers = int((os.getenv("WEB_CONCURRENCY") or str(2 * (os.cpu_count() or 1) + 1)).strip())
+threads = int((os.getenv("GUNICORN_THREADS") or "4").strip())
+preload_app = True
+timeout = int((os.getenv("GUNICORN_TIMEOUT") or "30").strip())
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then; jittered so they don't all restart together
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def post_worker_init(worker):
+    # Start the bcrypt process before traffic arrives, so the first sign-in
+    # after a (re)start doesn't also pay for spawning it
+    from services.passwords import warm_up
+    warm_up()
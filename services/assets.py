@@ -0,0 +1,127 @@
+# services/assets.py
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory
+from PIL import Image
+
+from extensions import STATIC_FOLDER
+
+try:
+    import brotli
+except ImportError:  # .br copies are skipped without it
+    brotli = None
+
+# `flask build-static` writes content-hashed copies of static/ into
+# static/dist/ and a manifest {"home.css": "dist/home.3f2a9c1e0b7d.css"}.
+# url_for("static", ...) resolves through the manifest, and hashed files are
+# served with a year-long immutable Cache-Control, using their precompressed
+# .br/.gz sibling when the browser accepts it. Without a build (or in debug
+# mode) static/ is served as before.
+DIST_DIR = "dist"
+MANIFEST_PATH = os.path.join(STATIC_FOLDER, DIST_DIR, "manifest.json")
+SKIP_DIRS = {DIST_DIR, "uploads"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".map"}
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _optimized_image(data, ext):
+    """Re-encode a JPEG/PNG without metadata; keeps the original if that's smaller."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            buf = io.BytesIO()
+            if ext in (".jpg", ".jpeg"):
+                image.convert("RGB").save(buf, "JPEG", quality=85, optimize=True, progressive=True)
+            else:
+                image.save(buf, "PNG", optimize=True)
+    except Exception:
+        return data
+    return buf.getvalue() if buf.tell() < len(data) else data
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build_static(static_folder=STATIC_FOLDER):
+    """Write hashed (and compressed) copies of every static file; returns the manifest."""
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            rel = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            stem, ext = os.path.splitext(rel)
+            ext = ext.lower()
+            with open(source, "rb") as f:
+                data = f.read()
+            if ext in (".jpg", ".jpeg", ".png"):
+                data = _optimized_image(data, ext)
+
+            hashed = f"{DIST_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+            target = os.path.join(static_folder, hashed)
+            if not os.path.exists(target):
+                _write(target, data)
+                if ext in COMPRESSIBLE:
+                    _write(target + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+                    if brotli:
+                        _write(target + ".br", brotli.compress(data, quality=11))
+            manifest[rel] = hashed
+
+    _write(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+_manifest = load_manifest()
+# Changes whenever a build renames any asset; part of page ETags, so HTML
+# cached before a deploy isn't revalidated with links to files that are gone
+MANIFEST_HASH = hashlib.sha1(json.dumps(_manifest, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def hashed_static_url(endpoint, values):
+    if endpoint == "static" and not current_app.debug and "filename" in values:
+        values["filename"] = _manifest.get(values["filename"], values["filename"])
+
+
+def serve_static(filename):
+    if not filename.startswith(DIST_DIR + "/") or filename == f"{DIST_DIR}/manifest.json":
+        return current_app.send_static_file(filename)
+
+    # Hashed names never change content: precompressed copy if accepted, cached for good
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encoding, suffix = next(
+        ((enc, suf) for enc, suf in ENCODINGS
+         if request.accept_encodings[enc] and os.path.exists(os.path.join(STATIC_FOLDER, filename + suf))),
+        (None, "")
+    )
+    response = send_from_directory(
+        STATIC_FOLDER, filename + suffix, mimetype=mimetype, conditional=True, max_age=IMMUTABLE_MAX_AGE
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if os.path.splitext(filename)[1] in COMPRESSIBLE:
+        response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.url_defaults(hashed_static_url)
+    app.view_functions["static"] = serve_static
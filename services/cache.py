@@ -0,0 +1,99 @@
+# services/cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache with per-entry expiry and LRU eviction.
+    Each worker has its own copy, so entries must be safe to serve for up to
+    `ttl` seconds after another worker changed the underlying data.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Rendered HTML shared by every student: course cards, course detail bodies,
+# catalog page listings and the public courses page.
+fragment_cache = TTLCache(
+    maxsize=int((os.getenv("FRAGMENT_CACHE_SIZE") or "2000").strip()),
+    ttl=int((os.getenv("FRAGMENT_CACHE_TTL") or "600").strip()),
+)
+
+# Catalog listings aren't keyed by course version, so other workers only see
+# publishes/unpublishes once this expires.
+CATALOG_LIST_TTL = int((os.getenv("CATALOG_LIST_TTL") or "30").strip())
+
+
+def course_fragment_key(kind, course_id, version):
+    """Key for a rendered piece of one course; a version bump makes it unreachable."""
+    return f"course:{course_id}:{kind}:v{version or 0}"
+
+
+def invalidate_course(course_id):
+    """Drop this worker's fragments for a course and its catalog listings."""
+    fragment_cache.delete_prefix(f"course:{course_id}:")
+    fragment_cache.delete_prefix("catalog:")
+
+
+# The signed-in user's profile fields (services/current_user.py), read on
+# nearly every page. Writes to a user drop their entry in this worker; other
+# workers may show an old name or photo until it expires.
+user_cache = TTLCache(
+    maxsize=int((os.getenv("USER_CACHE_SIZE") or "5000").strip()),
+    ttl=int((os.getenv("USER_CACHE_TTL") or "60").strip()),
+)
+
+
+def user_cache_key(user_id):
+    return f"user:{user_id}"
+
+
+def invalidate_user(user_id):
+    user_cache.delete(user_cache_key(user_id))
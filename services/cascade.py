@@ -0,0 +1,71 @@
+# services/cascade.py
+from extensions import db
+from services.course_structure import iter_topics
+from services.course_topics import delete_course_topics, load_structure
+from services.images import variant_urls
+from services.jobs import job_handler
+from services.leaderboard import forget_courses, forget_student
+from services.storage import delete_assets
+
+
+def course_asset_urls(course):
+    """Thumbnail and uploaded topic files of a course (links are not ours to delete)."""
+    urls = [course.get("thumbnail_url")] + variant_urls(course.get("thumbnail_variants"))
+    urls += [
+        t.get("content_url") for t in iter_topics(load_structure(course))
+        if t.get("content_type") != "link"
+    ]
+    return [u for u in urls if u]
+
+
+def profile_asset_urls(user):
+    """A user's uploaded photo and its resized copies."""
+    urls = [user.get("profile_image")] + variant_urls(user.get("profile_image_variants"))
+    return [u for u in urls if u]
+
+
+def _cascade_courses(course_ids, asset_urls):
+    forget_courses(course_ids)
+    delete_course_topics(course_ids)
+    enrollments = db.enrollments.delete_many({"course_id": {"$in": course_ids}})
+    users = db.users.update_many(
+        {"enrolled_courses": {"$in": course_ids}},
+        {"$pull": {"enrolled_courses": {"$in": course_ids}}}
+    )
+    return {
+        "enrollments_deleted": enrollments.deleted_count,
+        "users_updated": users.modified_count,
+        "assets_deleted": delete_assets(asset_urls),
+    }
+
+
+@job_handler("cascade_delete_course")
+def cascade_delete_course(course_id, asset_urls):
+    """Remove what referenced a course that has already been deleted."""
+    return _cascade_courses([course_id], asset_urls)
+
+
+@job_handler("cascade_delete_instructor")
+def cascade_delete_instructor(user_id, asset_urls):
+    """Delete an instructor's courses along with everything that references them."""
+    courses = list(db.courses.find(
+        {"instructor_id": user_id},
+        {"thumbnail_url": 1, "thumbnail_variants": 1, "structure": 1, "outline": 1}
+    ))
+    course_ids = [c["_id"] for c in courses]
+    for course in courses:
+        asset_urls = asset_urls + course_asset_urls(course)
+    result = _cascade_courses(course_ids, asset_urls)
+    result["courses_deleted"] = db.courses.delete_many({"_id": {"$in": course_ids}}).deleted_count
+    return result
+
+
+@job_handler("cascade_delete_student")
+def cascade_delete_student(user_id, asset_urls):
+    """Remove a deleted student's enrollments, leaderboard entries and uploaded files."""
+    forget_student(user_id)
+    enrollments = db.enrollments.delete_many({"user_id": user_id})
+    return {
+        "enrollments_deleted": enrollments.deleted_count,
+        "assets_deleted": delete_assets(asset_urls),
+    }
@@ -0,0 +1,96 @@
+# services/catalog.py
+from bson import ObjectId
+from flask import render_template
+from pymongo import ASCENDING, DESCENDING
+
+from extensions import analytics_db
+from services.cache import course_fragment_key, fragment_cache
+from services.images import srcset
+
+# Fields a catalog card needs; never the structure or reviews
+CATALOG_CARD_FIELDS = {
+    "title": 1, "description": 1, "rating": 1, "thumbnail_url": 1, "thumbnail_variants": 1,
+    "instructor_id": 1, "created_at": 1, "stats": 1,
+    "category": 1, "difficulty": 1, "language": 1, "version": 1,
+}
+
+# ?sort= of the catalog listing: (field, direction), tiebroken on _id
+CATALOG_SORTS = {
+    "newest": ("created_at", DESCENDING),
+    "oldest": ("created_at", ASCENDING),
+    "az": ("title", ASCENDING),
+    "za": ("title", DESCENDING),
+    "rating": ("rating", DESCENDING),
+    "time": ("stats.total_minutes", ASCENDING),
+}
+
+
+def pretty_minutes(total_time):
+    """ "X hrs Y min" or "Y min" """
+    if total_time >= 60:
+        hours = int(total_time // 60)
+        minutes = int(total_time % 60)
+        return f"{hours} hrs {minutes} min" if minutes > 0 else f"{hours} hrs"
+    return f"{int(total_time)} min"
+
+
+def instructor_names(instructor_ids):
+    """Map instructor id -> fullname with a single users query."""
+    ids = list({i for i in instructor_ids if isinstance(i, ObjectId)})
+    if not ids:
+        return {}
+    return {
+        u["_id"]: u.get("fullname")
+        for u in analytics_db.users.find({"_id": {"$in": ids}}, {"fullname": 1})
+    }
+
+
+def catalog_card(course, names):
+    """Fill in display fields of a projected catalog course, in place."""
+    stats = course.get("stats") or {}
+    course["_id"] = str(course["_id"])
+    course["title"] = course.get("title", "No Title")
+    course["description"] = course.get("description", "No description available.")
+    course["rating"] = round(float(course.get("rating", 0)), 1)
+    course["thumbnail_url"] = course.get("thumbnail_url", "/static/images/placeholder.jpg")
+    course["thumbnail_srcset"] = {
+        fmt: srcset(variants) for fmt, variants in (course.get("thumbnail_variants") or {}).items()
+    }
+
+    # Counts and expected time are stored on the course when it's saved
+    course["modules_count"] = stats.get("num_modules", 0)
+    course["chapters_count"] = stats.get("num_chapters", 0)
+    course["topics_count"] = stats.get("num_topics", 0)
+    total_time = stats.get("total_minutes", 0)
+    course["total_time"] = int(round(total_time))
+    course["total_time_pretty"] = pretty_minutes(total_time)
+
+    course["instructor_name"] = names.get(course.get("instructor_id")) or "Unknown Instructor"
+    course["instructor_id"] = str(course.get("instructor_id") or "")
+
+    # Created at for sorting (safe fallback)
+    course["created_at"] = str(course.get("created_at", "2023-01-01T00:00:00"))
+    return course
+
+
+def catalog_cards(courses):
+    names = instructor_names(c.get("instructor_id") for c in courses)
+    return [catalog_card(c, names) for c in courses]
+
+
+def render_course_cards(courses):
+    """
+    Card HTML for projected catalog courses. Cards are cached per course
+    version, so instructor names are only looked up for cache misses.
+    """
+    keys = [course_fragment_key("card", c["_id"], c.get("version")) for c in courses]
+    cards = [fragment_cache.get(key) for key in keys]
+
+    missing = [i for i, card in enumerate(cards) if card is None]
+    if missing:
+        # Copies: the listing itself may be cached
+        rendered = catalog_cards([dict(courses[i]) for i in missing])
+        for i, course in zip(missing, rendered):
+            cards[i] = render_template("student/course_card.html", course=course)
+            fragment_cache.set(keys[i], cards[i])
+    return cards
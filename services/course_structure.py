@@ -0,0 +1,86 @@
+# services/course_structure.py
+import json
+import uuid
+
+
+def coerce_structure(structure):
+    """
+    Return a course structure as a native {"modules": [...]} dict.
+
+    Older documents (and some form posts) carry the structure, or just its
+    module list, as a JSON string. Anything that still isn't a dict with a
+    list of modules after decoding raises ValueError so it never gets written.
+    """
+    if isinstance(structure, (str, bytes)):
+        structure = json.loads(structure or "{}")
+    if structure is None:
+        structure = {}
+    if not isinstance(structure, dict):
+        raise ValueError("Course structure must be an object.")
+
+    modules = structure.get("modules", [])
+    if isinstance(modules, (str, bytes)):
+        modules = json.loads(modules or "[]")
+    if not isinstance(modules, list):
+        raise ValueError("Course structure modules must be a list.")
+
+    structure["modules"] = [m for m in modules if isinstance(m, dict)]
+    return structure
+
+
+def is_native_structure(structure):
+    """True when the stored structure needs no decoding."""
+    return isinstance(structure, dict) and isinstance(structure.get("modules", []), list)
+
+
+def iter_topics(structure):
+    for module in (structure or {}).get("modules", []):
+        for chapter in module.get("chapters", []):
+            for topic in chapter.get("topics", []):
+                yield topic
+
+
+def topic_minutes(topic):
+    try:
+        return float(topic.get("estimated_time", 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def structure_stats(structure):
+    """Module/chapter/topic counts and total estimated minutes of a structure."""
+    modules = (structure or {}).get("modules", [])
+    return {
+        "num_modules": len(modules),
+        "num_chapters": sum(len(m.get("chapters", [])) for m in modules),
+        "num_topics": sum(len(c.get("topics", [])) for m in modules for c in m.get("chapters", [])),
+        "total_minutes": sum(topic_minutes(t) for t in iter_topics(structure)),
+    }
+
+
+def _usable_topic_id(topic_id):
+    # Topic ids become keys of the course's topic_bits map
+    return isinstance(topic_id, str) and topic_id and "." not in topic_id and not topic_id.startswith("$")
+
+
+def assign_topic_bits(structure, topic_bits=None, next_bit=0):
+    """
+    Give every topic a topic_id and a completion bit, in place.
+
+    Bits are keyed by topic_id and never reused, so reordering, inserting or
+    deleting topics leaves students' completed bits pointing at the same
+    topics. Returns (topic_bits, next_bit) covering only the current topics.
+    """
+    topic_bits = topic_bits or {}
+    next_bit = max([next_bit or 0] + [bit + 1 for bit in topic_bits.values()])
+    bits = {}
+    for topic in iter_topics(structure):
+        topic_id = topic.get("topic_id")
+        if not _usable_topic_id(topic_id) or topic_id in bits:
+            topic_id = topic["topic_id"] = f"topic_{uuid.uuid4().hex}"
+        if topic_id in topic_bits:
+            bits[topic_id] = topic_bits[topic_id]
+        else:
+            bits[topic_id] = next_bit
+            next_bit += 1
+    return bits, next_bit
@@ -0,0 +1,107 @@
+# services/course_topics.py
+from pymongo import ASCENDING, DeleteMany, ReplaceOne
+
+from extensions import db
+from services.course_structure import structure_stats
+
+# Topics live in their own collection, one document per topic:
+#   {course_id, topic_id, module, chapter, position, title, description,
+#    content_type, content_url, estimated_time, ...}
+# and the course keeps a lightweight `outline`: the module/chapter tree with
+# just enough of each topic to draw the sidebar and count minutes.
+course_topics = db.course_topics
+OUTLINE_TOPIC_FIELDS = ("topic_id", "title", "content_type", "estimated_time")
+_PLACEMENT_FIELDS = ("_id", "course_id", "module", "chapter", "position")
+
+
+def split_structure(structure):
+    """(outline, topic documents without course_id) for a full structure."""
+    outline, topics = {"modules": []}, []
+    for m_idx, module in enumerate((structure or {}).get("modules", [])):
+        out_module = {k: v for k, v in module.items() if k != "chapters"}
+        out_module["chapters"] = []
+        for c_idx, chapter in enumerate(module.get("chapters", [])):
+            out_chapter = {k: v for k, v in chapter.items() if k != "topics"}
+            out_chapter["topics"] = []
+            for t_idx, topic in enumerate(chapter.get("topics", [])):
+                out_chapter["topics"].append({f: topic.get(f) for f in OUTLINE_TOPIC_FIELDS if f in topic})
+                topics.append({**topic, "module": m_idx, "chapter": c_idx, "position": t_idx})
+            out_module["chapters"].append(out_chapter)
+        outline["modules"].append(out_module)
+    return outline, topics
+
+
+def save_structure(course_id, structure):
+    """
+    Write a course's topics to course_topics and return its outline for the
+    caller to $set on the course. Topics need topic_ids (assign_topic_bits).
+    """
+    outline, topics = split_structure(structure)
+    ops = [
+        ReplaceOne(
+            {"course_id": course_id, "topic_id": t["topic_id"]},
+            {**{k: v for k, v in t.items() if k != "_id"}, "course_id": course_id},
+            upsert=True
+        )
+        for t in topics
+    ]
+    ops.append(DeleteMany({"course_id": course_id, "topic_id": {"$nin": [t["topic_id"] for t in topics]}}))
+    course_topics.bulk_write(ops, ordered=False)
+    return outline
+
+
+def course_outline(course):
+    """Module/chapter/topic tree without topic bodies (older courses: the embedded structure)."""
+    return course.get("outline") or course.get("structure") or {"modules": []}
+
+
+def course_stats(course):
+    return course.get("stats") or structure_stats(course_outline(course))
+
+
+def _strip_placement(topic):
+    return {k: v for k, v in topic.items() if k not in _PLACEMENT_FIELDS}
+
+
+def load_structure(course):
+    """Reassemble the full structure of a course (older courses: the embedded one)."""
+    if "outline" not in course:
+        return course.get("structure") or {"modules": []}
+    topics = {
+        t["topic_id"]: _strip_placement(t)
+        for t in course_topics.find({"course_id": course["_id"]})
+    }
+    return {"modules": [
+        {**module, "chapters": [
+            {**chapter, "topics": [
+                {**topic, **topics.get(topic.get("topic_id"), {})}
+                for topic in chapter.get("topics", [])
+            ]}
+            for chapter in module.get("chapters", [])
+        ]}
+        for module in course["outline"].get("modules", [])
+    ]}
+
+
+def load_topics(course, module_index, chapter_index=None):
+    """Full topics of one module (or one of its chapters), in course order."""
+    if "outline" not in course:
+        modules = (course.get("structure") or {}).get("modules", [])
+        if not 0 <= module_index < len(modules):
+            return []
+        return [
+            {**topic, "chapter": c_idx}
+            for c_idx, chapter in enumerate(modules[module_index].get("chapters", []))
+            if chapter_index is None or c_idx == chapter_index
+            for topic in chapter.get("topics", [])
+        ]
+
+    query = {"course_id": course["_id"], "module": module_index}
+    if chapter_index is not None:
+        query["chapter"] = chapter_index
+    cursor = course_topics.find(query).sort([("chapter", ASCENDING), ("position", ASCENDING)])
+    return [{**_strip_placement(t), "chapter": t["chapter"]} for t in cursor]
+
+
+def delete_course_topics(course_ids):
+    return course_topics.delete_many({"course_id": {"$in": course_ids}}).deleted_count
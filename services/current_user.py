@@ -0,0 +1,27 @@
+# services/current_user.py
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import g, session
+
+from services.cache import user_cache, user_cache_key
+from services.repository import USER_PROFILE, user_repo
+
+
+def _load(user_id):
+    try:
+        oid = ObjectId(user_id)
+    except (InvalidId, TypeError):
+        return None
+    user = user_cache.get_or_set(user_cache_key(user_id), lambda: user_repo.get(oid, USER_PROFILE))
+    # A copy, so a view that adjusts fields for display doesn't change the cached one
+    return dict(user) if user else None
+
+
+def current_user():
+    """
+    The signed-in user's profile fields (no password), or None. Loaded once
+    per request into g.current_user, through this worker's user cache.
+    """
+    if "current_user" not in g:
+        g.current_user = _load(session.get("user_id")) if session.get("user_id") else None
+    return g.current_user
@@ -0,0 +1,94 @@
+# services/enrollments.py
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from extensions import client, db
+from services.cache import invalidate_user
+from services.indexes import DUPLICATE_KEY
+
+# An enrollment lives in two places: the `enrollments` document (progress,
+# bitset, ...) and the course id in `users.enrolled_courses`. The unique
+# (user_id, course_id) index makes creating the first one the duplicate
+# check; `enrolled_courses` is an $addToSet, so repeating it is harmless.
+enrollments = db.enrollments
+MAX_BULK_ENROLL = 5000
+
+_transactions_supported = None
+
+
+def _new_enrollment(user_id, course_id, now):
+    return {"user_id": user_id, "course_id": course_id, "progress": 0, "enrolled_at": now}
+
+
+def enroll(user_id, course_id):
+    """Enroll one student. Returns False if they already were."""
+    try:
+        enrollments.insert_one(_new_enrollment(user_id, course_id, datetime.utcnow()))
+        created = True
+    except DuplicateKeyError:
+        created = False
+    # Also on duplicates: repairs a write that was interrupted between the two
+    db.users.update_one({"_id": user_id}, {"$addToSet": {"enrolled_courses": course_id}})
+    invalidate_user(user_id)
+    return created
+
+
+def _run_in_transaction(fn):
+    """
+    Run fn(session) inside a transaction when the deployment supports them
+    (replica sets, sharded clusters); standalone servers run it without one.
+    """
+    global _transactions_supported
+    if _transactions_supported is not False:
+        try:
+            with client.start_session() as session:
+                result = session.with_transaction(fn)
+            _transactions_supported = True
+            return result
+        except OperationFailure as e:
+            if e.code != 20:  # IllegalOperation: standalone server
+                raise
+            _transactions_supported = False
+    return fn(None)
+
+
+def enroll_many(user_ids, course_id):
+    """
+    Enroll a cohort in one course with one bulk write per collection.
+    Returns {"enrolled": new enrollments, "already": students who had one}.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {"enrolled": 0, "already": 0}
+    now = datetime.utcnow()
+
+    def write(session):
+        ops = [
+            UpdateOne(
+                {"user_id": u, "course_id": course_id},
+                {"$setOnInsert": _new_enrollment(u, course_id, now)},
+                upsert=True
+            )
+            for u in user_ids
+        ]
+        try:
+            created = enrollments.bulk_write(ops, ordered=False, session=session).upserted_count
+        except BulkWriteError as e:
+            # Two concurrent upserts of the same pair: one wins, the other is
+            # "already". (Inside a transaction the error aborts it instead.)
+            if session or any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+                raise
+            created = e.details["nUpserted"]
+        db.users.update_many(
+            {"_id": {"$in": user_ids}},
+            {"$addToSet": {"enrolled_courses": course_id}},
+            session=session
+        )
+        return created
+
+    created = _run_in_transaction(write)
+    for user_id in user_ids:
+        invalidate_user(user_id)
+    return {"enrolled": created, "already": len(user_ids) - created}
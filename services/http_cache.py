@@ -0,0 +1,35 @@
+# services/http_cache.py
+import hashlib
+import os
+
+from flask import make_response, request
+
+from services.assets import MANIFEST_HASH
+
+# Pages behind a login: only the student's own browser may keep a copy, and it
+# has to revalidate on every visit (cheap, thanks to the ETag).
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+# The page markup changes with each deploy too (templates, asset names)
+BUILD_ID = (os.getenv("BUILD_ID") or os.getenv("RENDER_GIT_COMMIT") or "").strip()
+
+
+def course_etag(kind, course, *user_parts):
+    """Strong ETag for a per-student course page: build, course version + whatever of the student it shows."""
+    parts = (BUILD_ID, MANIFEST_HASH, kind, course["_id"], course.get("version") or 0, *user_parts)
+    return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def private_response(response, etag):
+    response = make_response(response)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = PRIVATE_CACHE_CONTROL
+    response.vary.add("Cookie")
+    return response
+
+
+def not_modified(etag):
+    """A 304 when the browser already holds this version of the page, else None."""
+    if request.if_none_match.contains(etag):
+        return private_response(("", 304), etag)
+    return None
@@ -0,0 +1,115 @@
+# services/images.py
+import io
+
+from PIL import Image, ImageOps
+
+from extensions import db
+from services.cache import invalidate_course, invalidate_user
+from services.jobs import job_handler, submit_job
+from services.storage import delete_assets, owner
+
+# Thumbnails and avatars get resized copies, stored beside the original and
+# listed on the document as
+#   <field>_variants: {"webp": [{"width": 320, "url": ...}, ...], "jpeg": [...]}
+# so templates can offer them with srcset. Originals are never upscaled.
+IMAGE_FIELDS = {
+    # field: (collection, widths)
+    "thumbnail_url": ("courses", (320, 640, 960)),
+    "profile_image": ("users", (64, 128, 256)),
+}
+VARIANT_FORMATS = {
+    "webp": {"quality": 80, "method": 4},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+Image.MAX_IMAGE_PIXELS = 50_000_000  # refuse decompression bombs
+
+
+def variants_field(field):
+    return field.replace("_url", "") + "_variants"
+
+
+def render_variants(data, widths):
+    """[(width, format, bytes), ...] for the widths narrower than the image."""
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    targets = [w for w in widths if w < image.width] or [image.width]
+
+    rendered = []
+    for width in targets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt, options in VARIANT_FORMATS.items():
+            frame = resized
+            if fmt == "jpeg" and frame.mode not in ("RGB", "L"):
+                # No alpha in JPEG: flatten onto white
+                rgba = frame.convert("RGBA")
+                frame = Image.new("RGB", rgba.size, (255, 255, 255))
+                frame.paste(rgba, mask=rgba.getchannel("A"))
+            elif fmt == "webp" and frame.mode not in ("RGB", "RGBA"):
+                frame = frame.convert("RGBA")
+            buf = io.BytesIO()
+            frame.save(buf, fmt.upper(), **options)
+            rendered.append((width, fmt, buf.getvalue()))
+    return rendered
+
+
+@job_handler("image_variants")
+def build_image_variants(field, doc_id, url):
+    """Resize the image at `url` and record the variants, unless it was replaced meanwhile."""
+    collection, widths = IMAGE_FIELDS[field]
+    driver = owner(url)
+    if not driver:
+        return {"variants": 0}  # external link, nothing of ours to resize
+
+    variants = {fmt: [] for fmt in VARIANT_FORMATS}
+    for width, fmt, data in render_variants(driver.read(url), widths):
+        variants[fmt].append({"width": width, "url": driver.save_variant(url, data, f"w{width}", fmt)})
+
+    update = {"$set": {variants_field(field): variants}}
+    if collection == "courses":
+        update["$inc"] = {"version": 1}  # cached cards and ETags pick up the srcset
+    result = db[collection].update_one({"_id": doc_id, field: url}, update)
+    if not result.modified_count:
+        delete_assets(variant_urls(variants))
+        return {"variants": 0, "stale": True}
+    if collection == "courses":
+        invalidate_course(str(doc_id))
+    else:
+        invalidate_user(doc_id)
+    return {"variants": sum(len(v) for v in variants.values())}
+
+
+def request_variants(field, doc_id, url):
+    """Build variants for a freshly stored image in the background."""
+    if url and owner(url):
+        submit_job("image_variants", field=field, doc_id=doc_id, url=url)
+
+
+def discard_image(field, previous):
+    """
+    Delete, in the background, the original and variants that `field` held
+    in `previous` (the document before the image was replaced or removed).
+    """
+    urls = [(previous or {}).get(field)] + variant_urls((previous or {}).get(variants_field(field)))
+    urls = [u for u in urls if u and owner(u)]
+    if urls:
+        submit_job("delete_images", urls=urls)
+
+
+@job_handler("delete_images")
+def delete_images(urls):
+    return {"assets_deleted": delete_assets(urls)}
+
+
+def variant_urls(variants):
+    return [v["url"] for group in (variants or {}).values() for v in group]
+
+
+def srcset(variants):
+    """'url 320w, url 640w' for one format's variants."""
+    return ", ".join(f"{v['url']} {v['width']}w" for v in variants or [])
+
+
+def init_app(app):
+    app.add_template_filter(srcset, "srcset")
@@ -0,0 +1,102 @@
+# services/indexes.py
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from extensions import db
+
+# Every index the app relies on, by collection. They are built once per
+# deploy by `flask bootstrap` / `flask ensure-indexes`, never by the web
+# workers; building an index that already exists is a no-op. The course
+# text index is kept with the search code (services/search.py), which also
+# replaces older definitions of it.
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "courses": [
+        IndexModel([("instructor_id", ASCENDING)]),
+        # Published catalog in each of its sorts (the keyset tiebreak is _id);
+        # one index serves a sort and its reverse
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("title", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("rating", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("stats.total_minutes", ASCENDING), ("_id", ASCENDING)]),
+        # Catalog filtered by one facet (search without a text query), newest first
+        IndexModel([("status", ASCENDING), ("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("difficulty", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("language", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "enrollments": [
+        IndexModel(
+            [("user_id", ASCENDING), ("course_id", ASCENDING)],
+            unique=True,
+            # Created before `student_id` was renamed (flask migrate-enrollment-keys)
+            partialFilterExpression={"user_id": {"$exists": True}},
+        ),
+        IndexModel([("course_id", ASCENDING)]),
+    ],
+    "course_topics": [
+        IndexModel([("course_id", ASCENDING), ("topic_id", ASCENDING)], unique=True),
+        IndexModel([("course_id", ASCENDING), ("module", ASCENDING), ("chapter", ASCENDING), ("position", ASCENDING)]),
+    ],
+    "leaderboard": [
+        IndexModel([("courses_completed", DESCENDING), ("updated_at", ASCENDING)]),
+    ],
+    "course_leaderboard": [
+        IndexModel([("course_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        IndexModel([("course_id", ASCENDING), ("topics_completed", DESCENDING)]),
+    ],
+    "leaderboard_weekly": [
+        IndexModel([("week", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        IndexModel([("week", ASCENDING), ("topics_completed", DESCENDING)]),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "login_attempts": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+DUPLICATE_KEY = 11000
+INDEX_CONFLICTS = (85, 86)  # IndexOptionsConflict / IndexKeySpecsConflict
+
+def _drop_conflicting(collection, model):
+    """Drop an existing index with this one's name or keys but other options."""
+    spec = model.document
+    for name, info in collection.index_information().items():
+        if name == spec["name"] or list(info["key"]) == list(spec["key"].items()):
+            collection.drop_index(name)
+
+
+def create_indexes(*collections, replace=False):
+    """
+    Build the registered indexes of `collections` (all when none are given).
+    An existing index defined differently is kept, or rebuilt when `replace`
+    (deploy time only: rebuilding a large index is slow). Returns
+    [(collection, index name)] for the unique indexes that existing
+    duplicates keep from being built (they are built without the constraint
+    instead); any other error is raised.
+    """
+    failed = []
+    for name in collections or INDEXES:
+        for model in INDEXES[name]:
+            try:
+                try:
+                    db[name].create_indexes([model])
+                except OperationFailure as e:
+                    if e.code not in INDEX_CONFLICTS:
+                        raise
+                    # An older definition is in the way (e.g. email before it was unique)
+                    if not replace:
+                        print(f"⚠️ Index {name}.{model.document['name']} is outdated; run `flask ensure-indexes`")
+                        continue
+                    _drop_conflicting(db[name], model)
+                    db[name].create_indexes([model])
+            except OperationFailure as e:
+                if e.code != DUPLICATE_KEY:
+                    raise
+                print(f"⚠️ Index {name}.{model.document['name']} not unique: duplicate keys in existing documents")
+                failed.append((name, model.document["name"]))
+                # Same keys without the constraint, so lookups stay indexed meanwhile
+                options = {k: v for k, v in model.document.items() if k not in ("key", "unique")}
+                db[name].create_index(list(model.document["key"].items()), **options)
+    return failed
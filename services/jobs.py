@@ -0,0 +1,90 @@
+# services/jobs.py
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from extensions import db
+
+# Background work that shouldn't hold up a request. Every job is recorded in
+# the `jobs` collection so its outcome can be checked, and handlers are looked
+# up by name so unfinished jobs can be re-run after a worker restart.
+JOB_HANDLERS = {}
+
+_executor = ThreadPoolExecutor(
+    max_workers=int((os.getenv("JOB_WORKERS") or "2").strip()),
+    thread_name_prefix="jobs",
+)
+
+
+def job_handler(kind):
+    """Register `fn` as the handler for jobs of type `kind`."""
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def submit_job(kind, **params):
+    """Record a job and run it off the request thread. Returns the job id."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {kind}")
+    job_id = db.jobs.insert_one({
+        "kind": kind,
+        "params": params,
+        "status": "queued",
+        "created_at": datetime.utcnow(),
+    }).inserted_id
+    _executor.submit(run_job, job_id, kind, params)
+    return job_id
+
+
+def run_job(job_id, kind, params):
+    db.jobs.update_one(
+        {"_id": job_id},
+        {"$set": {"status": "running", "started_at": datetime.utcnow()}, "$inc": {"attempts": 1}}
+    )
+    try:
+        result = JOB_HANDLERS[kind](**params)
+    except Exception as e:
+        print(f"❌ Job {kind} {job_id} failed:", repr(e))
+        db.jobs.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "status": "failed",
+                "error": repr(e),
+                "traceback": traceback.format_exc(),
+                "finished_at": datetime.utcnow(),
+            }}
+        )
+        return None
+
+    db.jobs.update_one(
+        {"_id": job_id},
+        {"$set": {"status": "done", "result": result, "finished_at": datetime.utcnow()}}
+    )
+    print(f"✅ Job {kind} {job_id} done:", result)
+    return result
+
+
+def find_job(job_id, kind, **params):
+    """
+    The status, result and error of job `job_id` of type `kind` whose
+    params include `params`, or None (also for a malformed id).
+    """
+    if not ObjectId.is_valid(job_id):
+        return None
+    query = {"_id": ObjectId(job_id), "kind": kind}
+    query.update({f"params.{name}": value for name, value in params.items()})
+    return db.jobs.find_one(query, {"status": 1, "result": 1, "error": 1})
+
+
+def stale_jobs(older_than=timedelta(minutes=15)):
+    """Jobs that failed, or were queued/running when their worker went away."""
+    cutoff = datetime.utcnow() - older_than
+    return db.jobs.find({"$or": [
+        {"status": "failed"},
+        {"status": {"$in": ["queued", "running"]}, "created_at": {"$lt": cutoff}},
+    ]})
@@ -0,0 +1,184 @@
+# services/leaderboard.py
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+from extensions import AGGREGATION_MAX_TIME_MS, analytics_db, db
+from services.progress import DAY_FORMAT
+
+# Kept up to date as progress is written, instead of being recomputed from
+# every student's enrollments on each analytics view:
+#   leaderboard          {_id: user_id, courses_completed, updated_at}
+#   leaderboard_scores   {_id: courses_completed, students}  (scores >= 1)
+#   course_leaderboard   {course_id, user_id, topics_completed}
+#   leaderboard_weekly   {week: "2026-W42", user_id, topics_completed, courses_completed, expires_at}
+# Weekly entries expire (TTL index on expires_at) WEEKLY_RETENTION_WEEKS
+# after their week ends.
+WEEKLY_RETENTION_WEEKS = int((os.getenv("WEEKLY_RETENTION_WEEKS") or "8").strip())
+leaderboard = db.leaderboard
+leaderboard_scores = db.leaderboard_scores
+course_leaderboard = db.course_leaderboard
+weekly_leaderboard = db.leaderboard_weekly
+# Rankings are read from a secondary when one is fresh enough
+_reads = analytics_db
+
+
+def week_key(when=None):
+    year, week, _ = (when or datetime.utcnow()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def week_expires_at(when=None):
+    """When the weekly entries of the week holding `when` are deleted."""
+    day = (when or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    week_end = day + timedelta(days=7 - day.weekday())
+    return week_end + timedelta(weeks=WEEKLY_RETENTION_WEEKS)
+
+
+def _move_score(old, new):
+    """Move one student between score buckets of the rank histogram."""
+    ops = []
+    if old > 0:
+        ops.append(UpdateOne({"_id": old}, {"$inc": {"students": -1}}))
+    if new > 0:
+        ops.append(UpdateOne({"_id": new}, {"$inc": {"students": 1}}, upsert=True))
+    if ops:
+        leaderboard_scores.bulk_write(ops, ordered=False)
+
+
+def record_completion(user_id, when=None):
+    """A student finished a course. Callers must make sure this runs once per enrollment."""
+    when = when or datetime.utcnow()
+    doc = leaderboard.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"courses_completed": 1}, "$set": {"updated_at": when}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    _move_score(doc["courses_completed"] - 1, doc["courses_completed"])
+    weekly_leaderboard.update_one(
+        {"week": week_key(when), "user_id": user_id},
+        {"$inc": {"courses_completed": 1}, "$setOnInsert": {"expires_at": week_expires_at(when)}},
+        upsert=True
+    )
+
+
+def remove_completion(user_id):
+    """Undo record_completion, e.g. when a completed enrollment is deleted."""
+    doc = leaderboard.find_one_and_update(
+        {"_id": user_id, "courses_completed": {"$gt": 0}},
+        {"$inc": {"courses_completed": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc:
+        _move_score(doc["courses_completed"] + 1, doc["courses_completed"])
+
+
+def forget_enrollment(user_id, course_id, enrollment):
+    """
+    Take a deleted enrollment (with its completed_at and progress_by_day)
+    back out of the boards: its completion, its course entry and the topics
+    it added to each week.
+    """
+    if enrollment.get("completed_at"):
+        remove_completion(user_id)
+        weekly_leaderboard.update_one(
+            {"week": week_key(enrollment["completed_at"]), "user_id": user_id, "courses_completed": {"$gt": 0}},
+            {"$inc": {"courses_completed": -1}}
+        )
+    course_leaderboard.delete_one({"course_id": course_id, "user_id": user_id})
+    per_week = {}
+    for day, counters in (enrollment.get("progress_by_day") or {}).items():
+        n = (counters or {}).get("topics_completed", 0)
+        try:
+            week = week_key(datetime.strptime(day, DAY_FORMAT))
+        except ValueError:
+            continue
+        per_week[week] = per_week.get(week, 0) + n
+    ops = [
+        UpdateOne({"week": w, "user_id": user_id}, {"$inc": {"topics_completed": -n}})
+        for w, n in per_week.items() if n
+    ]
+    if ops:
+        weekly_leaderboard.bulk_write(ops, ordered=False)
+
+
+def record_topics(counts):
+    """{(user_id, course_id, day datetime): new topics completed} from one progress flush."""
+    if not counts:
+        return
+    per_course, per_week, expires = {}, {}, {}
+    for (user_id, course_id, day), n in counts.items():
+        per_course[(course_id, user_id)] = per_course.get((course_id, user_id), 0) + n
+        per_week[(week_key(day), user_id)] = per_week.get((week_key(day), user_id), 0) + n
+        expires[week_key(day)] = week_expires_at(day)
+    course_leaderboard.bulk_write([
+        UpdateOne({"course_id": c, "user_id": u}, {"$inc": {"topics_completed": n}}, upsert=True)
+        for (c, u), n in per_course.items()
+    ], ordered=False)
+    weekly_leaderboard.bulk_write([
+        UpdateOne(
+            {"week": w, "user_id": u},
+            {"$inc": {"topics_completed": n}, "$setOnInsert": {"expires_at": expires[w]}},
+            upsert=True
+        )
+        for (w, u), n in per_week.items()
+    ], ordered=False)
+
+
+def forget_student(user_id):
+    doc = leaderboard.find_one_and_delete({"_id": user_id})
+    if doc:
+        _move_score(doc.get("courses_completed", 0), 0)
+    course_leaderboard.delete_many({"user_id": user_id})
+    weekly_leaderboard.delete_many({"user_id": user_id})
+
+
+def forget_courses(course_ids):
+    """Drop completions of courses whose enrollments are about to be deleted."""
+    for e in db.enrollments.find(
+        {"course_id": {"$in": course_ids}, "completed_at": {"$exists": True}},
+        {"user_id": 1}
+    ):
+        remove_completion(e["user_id"])
+    course_leaderboard.delete_many({"course_id": {"$in": course_ids}})
+
+
+def top_students(k=5):
+    return list(
+        _reads[leaderboard.name].find({"courses_completed": {"$gt": 0}})
+        .sort([("courses_completed", DESCENDING), ("updated_at", ASCENDING)])
+        .limit(k)
+    )
+
+
+def student_rank(user_id):
+    """
+    (rank, courses_completed) for one student. Ties share a rank. The
+    histogram has one document per distinct score, so this reads a handful
+    of documents however many students there are.
+    """
+    doc = _reads[leaderboard.name].find_one({"_id": user_id}, {"courses_completed": 1}) or {}
+    score = doc.get("courses_completed", 0)
+    above = next(_reads[leaderboard_scores.name].aggregate([
+        {"$match": {"_id": {"$gt": score}}},
+        {"$group": {"_id": None, "n": {"$sum": "$students"}}}
+    ], maxTimeMS=AGGREGATION_MAX_TIME_MS), {}).get("n", 0)
+    return above + 1, score
+
+
+def top_in_course(course_id, k=5):
+    return list(
+        _reads[course_leaderboard.name].find({"course_id": course_id, "topics_completed": {"$gt": 0}})
+        .sort("topics_completed", DESCENDING)
+        .limit(k)
+    )
+
+
+def top_this_week(k=5, week=None):
+    return list(
+        _reads[weekly_leaderboard.name].find({"week": week or week_key(), "topics_completed": {"$gt": 0}})
+        .sort("topics_completed", DESCENDING)
+        .limit(k)
+    )
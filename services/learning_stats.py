@@ -0,0 +1,83 @@
+# services/learning_stats.py
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from extensions import analytics_db, db
+from services.jobs import job_handler, submit_job
+
+# Students keep a running `learning_minutes` (progress x course minutes,
+# summed over their enrollments), updated whenever progress is written.
+# Class-wide figures are refreshed into one small document:
+#   learning_stats {_id: "global", students, average, top, percentiles, refreshed_at}
+STATS_ID = "global"
+PERCENTILES = (25, 50, 75, 90)
+LEARNING_STATS_TTL = timedelta(minutes=int((os.getenv("LEARNING_STATS_TTL_MINUTES") or "15").strip()))
+
+
+def minutes_delta(old_percent, new_percent, course_minutes):
+    """Minutes gained going from old to new percent; progress never takes minutes away."""
+    return max(new_percent - (old_percent or 0), 0) / 100 * (course_minutes or 0)
+
+
+def add_learning_minutes(deltas):
+    """{user_id: minutes} from one progress flush."""
+    ops = [
+        UpdateOne({"_id": user_id}, {"$inc": {"learning_minutes": minutes}})
+        for user_id, minutes in deltas.items() if minutes
+    ]
+    if ops:
+        db.users.bulk_write(ops, ordered=False)
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    index = min(int(round(p / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+@job_handler("refresh_learning_stats")
+def refresh_learning_stats():
+    """Recompute the class-wide learning-time figures from students' running totals."""
+    minutes = sorted(
+        float(u.get("learning_minutes") or 0)
+        for u in analytics_db.users.find(
+            {"role": "student", "learning_minutes": {"$gt": 0}}, {"learning_minutes": 1}
+        ).batch_size(5000)
+    )
+    stats = {
+        "students": len(minutes),
+        "average": round(sum(minutes) / len(minutes), 1) if minutes else 0,
+        "top": round(minutes[-1], 1) if minutes else 0,
+        "percentiles": {f"p{p}": round(_percentile(minutes, p), 1) for p in PERCENTILES},
+        "refreshed_at": datetime.utcnow(),
+    }
+    db.learning_stats.update_one({"_id": STATS_ID}, {"$set": stats}, upsert=True)
+    return {"students": stats["students"]}
+
+
+def learning_stats():
+    """
+    The stored class-wide figures. When they're older than LEARNING_STATS_TTL
+    one caller claims the refresh and runs it as a background job; everyone
+    keeps serving the previous figures meanwhile.
+    """
+    stats = db.learning_stats.find_one({"_id": STATS_ID}) or {}
+    now = datetime.utcnow()
+    if stats.get("refreshed_at") and stats["refreshed_at"] > now - LEARNING_STATS_TTL:
+        return stats
+    try:
+        claimed = db.learning_stats.find_one_and_update(
+            {"_id": STATS_ID, "refresh_claimed_at": {"$not": {"$gt": now - LEARNING_STATS_TTL}}},
+            {"$set": {"refresh_claimed_at": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        claimed = None  # another worker already claimed this refresh
+    if claimed:
+        submit_job("refresh_learning_stats")
+    return stats
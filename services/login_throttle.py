@@ -0,0 +1,54 @@
+# services/login_throttle.py
+import os
+import time
+from datetime import datetime, timezone
+
+from extensions import db
+
+# Failed sign-ins are counted per account and per client IP in fixed
+# windows; once either count reaches its limit, sign-ins for that account
+# (or from that IP) are refused before any bcrypt work until the window
+# ends. One document per key and window:
+#   login_attempts   {_id: "account:<email>:<window>", failures, expires_at}
+# and the TTL index on expires_at deletes them afterwards.
+attempts = db.login_attempts
+WINDOW_S = int((os.getenv("LOGIN_THROTTLE_WINDOW_S") or "900").strip())
+MAX_ACCOUNT_FAILURES = int((os.getenv("LOGIN_MAX_ACCOUNT_FAILURES") or "10").strip())
+MAX_IP_FAILURES = int((os.getenv("LOGIN_MAX_IP_FAILURES") or "100").strip())
+
+
+def _window(now):
+    """(start, end as an aware UTC datetime) of the window holding epoch time `now`."""
+    start = int(now) // WINDOW_S * WINDOW_S
+    return start, datetime.fromtimestamp(start + WINDOW_S, timezone.utc)
+
+
+def _keys(email, ip, start):
+    return {f"account:{email}:{start}": MAX_ACCOUNT_FAILURES, f"ip:{ip}:{start}": MAX_IP_FAILURES}
+
+
+def retry_after(email, ip):
+    """Seconds until `email` may try again from `ip` (0 when it may now)."""
+    now = time.time()
+    start, _ = _window(now)
+    limits = _keys(email, ip, start)
+    for doc in attempts.find({"_id": {"$in": list(limits)}}, {"failures": 1}):
+        if doc["failures"] >= limits[doc["_id"]]:
+            return max(1, int(start + WINDOW_S - now))
+    return 0
+
+
+def record_failure(email, ip):
+    start, expires_at = _window(time.time())
+    for key in _keys(email, ip, start):
+        attempts.update_one(
+            {"_id": key},
+            {"$inc": {"failures": 1}, "$setOnInsert": {"expires_at": expires_at}},
+            upsert=True
+        )
+
+
+def clear_account(email):
+    """Forget an account's failures after a successful sign-in (the IP's are kept)."""
+    start, _ = _window(time.time())
+    attempts.delete_one({"_id": f"account:{email}:{start}"})
@@ -0,0 +1,69 @@
+# services/pagination.py
+import base64
+
+from bson import json_util
+from pymongo import DESCENDING
+
+
+def encode_cursor(value, _id):
+    """Opaque page token for the last document of a page (keeps BSON types)."""
+    raw = json_util.dumps({"v": value, "id": _id})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token):
+    """(value, _id) from a page token; raises ValueError if it's malformed."""
+    try:
+        data = json_util.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+        return data["v"], data["id"]
+    except Exception as e:
+        raise ValueError("Invalid page cursor") from e
+
+
+def _after(field, direction, value, last_id):
+    """
+    Documents after (value, last_id) in (field, _id) order. Mongo sorts a
+    missing or null field before every value, so documents without it come
+    first in ascending order and last in descending order.
+    """
+    op = "$lt" if direction == DESCENDING else "$gt"
+    ties = {field: value, "_id": {op: last_id}}
+    if value is None:
+        if direction == DESCENDING:
+            return [ties]
+        return [ties, {field: {"$ne": None}}]
+    later = [{field: {op: value}}, ties]
+    if direction == DESCENDING:
+        later.append({field: None})
+    return later
+
+
+def keyset_page(collection, query, projection, field, direction, limit, after=None):
+    """
+    One page of `collection` ordered by (`field`, `_id`) in `direction`,
+    starting after the page token `after`. Cost depends only on `limit`,
+    not on how deep into the result set the page is, as long as an index
+    on the query's equality fields followed by (`field`, `_id`) exists.
+
+    Returns (documents, next_token); next_token is None on the last page.
+    """
+    query = dict(query)
+    if after:
+        value, last_id = decode_cursor(after)
+        query["$or"] = _after(field, direction, value, last_id)
+
+    docs = list(
+        collection.find(query, projection)
+        .sort([(field, direction), ("_id", direction)])
+        .limit(limit + 1)
+    )
+    next_token = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        value = last
+        for part in field.split("."):
+            value = (value or {}).get(part)
+        next_token = encode_cursor(value, last["_id"])
+    return docs, next_token
+
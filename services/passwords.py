@@ -0,0 +1,92 @@
+# services/passwords.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import bcrypt
+
+# bcrypt is deliberately slow, so it runs in process pools rather than on
+# the request thread: a sign-in storm queues for the pool instead of
+# starving every other request in the worker. Pools are per web worker, so
+# HASH_WORKERS stays small (total bcrypt processes = web workers x
+# HASH_WORKERS); roster imports get their own pool, so sign-ins never wait
+# behind thousands of queued import hashes. Spawned rather than forked: the
+# web process has threads running, and pool processes only need this module.
+_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+HASH_WORKERS = int((os.getenv("HASH_WORKERS") or "1").strip())
+BULK_HASH_WORKERS = int((os.getenv("BULK_HASH_WORKERS") or str(_CPUS)).strip())
+
+# Cost of new hashes. Existing hashes keep their own cost until the user next
+# signs in, when they are rehashed at this one (see needs_rehash).
+BCRYPT_ROUNDS = int((os.getenv("BCRYPT_ROUNDS") or "12").strip())
+
+
+def _hashpw(password, rounds=BCRYPT_ROUNDS):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _checkpw(password, hashed):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:  # not a bcrypt hash
+        return False
+
+
+class _LazyPool:
+    """A process pool created on first use in each process (and again after a fork)."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                    self._pid = os.getpid()
+        return self._pool
+
+
+_hash_pool = _LazyPool(HASH_WORKERS)
+_bulk_pool = _LazyPool(BULK_HASH_WORKERS)
+
+
+def warm_up():
+    """Start this process's sign-in pool now rather than on the first sign-in."""
+    _hash_pool.get().submit(int).result()
+
+
+def hash_password(password):
+    return _hash_pool.get().submit(_hashpw, password, BCRYPT_ROUNDS).result()
+
+
+def check_password(password, hashed):
+    """Whether `password` matches the stored bcrypt hash (False for anything else)."""
+    if not password or not hashed:
+        return False
+    return _hash_pool.get().submit(_checkpw, password, hashed).result()
+
+
+def needs_rehash(hashed):
+    """True if a stored hash was made with a cost other than BCRYPT_ROUNDS."""
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return True
+
+
+def hash_passwords(passwords):
+    """Hashes of `passwords`, in order, computed across the bulk pool (one process per core)."""
+    passwords = list(passwords)
+    if not passwords:
+        return []
+    chunksize = max(1, len(passwords) // (BULK_HASH_WORKERS * 4))
+    return list(_bulk_pool.get().map(partial(_hashpw, rounds=BCRYPT_ROUNDS), passwords, chunksize=chunksize))
@@ -0,0 +1,65 @@
+# services/progress.py
+from datetime import datetime
+
+from bson.int64 import Int64
+
+# Enrollments keep daily activity as
+#   progress_by_day: {"YYYY-MM-DD": {"topics_completed": n}}
+# so a progress event is a single $inc on today's key. ISO day keys also
+# compare correctly as plain strings in queries and aggregations.
+DAY_FORMAT = "%Y-%m-%d"
+
+# Completed topics are a bitset on the enrollment,
+#   completed_bits: {"<word>": Int64}
+# indexed by the course's topic_bits ({topic_id: bit}) and set with $bit or.
+# 63 bits per word keeps every mask a positive Int64.
+BITS_PER_WORD = 63
+
+
+def day_key(when=None):
+    return (when or datetime.utcnow()).strftime(DAY_FORMAT)
+
+
+def bucket_legacy_updates(updates):
+    """Sum an old `progress_updates` array into {day_key: topics_completed}."""
+    buckets = {}
+    for upd in updates or []:
+        date = upd.get("date")
+        if isinstance(date, datetime):
+            day = day_key(date)
+        else:
+            try:
+                day = day_key(datetime.strptime(str(date)[:10], DAY_FORMAT))
+            except Exception:
+                continue
+        try:
+            topics = int(upd.get("topics_completed") or 0)
+        except (TypeError, ValueError):
+            topics = 0
+        buckets[day] = buckets.get(day, 0) + topics
+    return buckets
+
+
+def bit_masks(bits):
+    """{word: Int64 mask} setting each of `bits`, for a $bit update."""
+    masks = {}
+    for bit in bits:
+        word = str(bit // BITS_PER_WORD)
+        masks[word] = masks.get(word, 0) | (1 << (bit % BITS_PER_WORD))
+    return {word: Int64(mask) for word, mask in masks.items()}
+
+
+def has_bit(completed_bits, bit):
+    word = (completed_bits or {}).get(str(bit // BITS_PER_WORD), 0)
+    return bool(int(word) >> (bit % BITS_PER_WORD) & 1)
+
+
+def completed_topic_ids(completed_bits, topic_bits):
+    return {tid for tid, bit in (topic_bits or {}).items() if has_bit(completed_bits, bit)}
+
+
+def completion_percent(completed_bits, topic_bits):
+    """Share of the course's current topics that are completed, 0-100."""
+    if not topic_bits:
+        return 0
+    return round(100 * len(completed_topic_ids(completed_bits, topic_bits)) / len(topic_bits))
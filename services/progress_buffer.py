@@ -0,0 +1,370 @@
+# services/progress_buffer.py
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from extensions import INSTANCE_PATH, db
+from services.leaderboard import record_completion, record_topics
+from services.learning_stats import add_learning_minutes, minutes_delta
+from services.progress import DAY_FORMAT, bit_masks, completion_percent, day_key, has_bit
+
+# Flush when this many events are waiting, or every FLUSH_SECONDS otherwise
+FLUSH_EVENTS = int((os.getenv("PROGRESS_FLUSH_EVENTS") or "500").strip())
+FLUSH_SECONDS = float((os.getenv("PROGRESS_FLUSH_SECONDS") or "5").strip())
+JOURNAL_DIR = os.getenv("PROGRESS_JOURNAL_DIR") or os.path.join(INSTANCE_PATH, "progress-journal")
+
+
+def _set_topic(user_id, course_id, word, mask, day):
+    """
+    Set one topic's bit and count it towards `day`, unless it is already
+    set. Returns the enrollment as it was before, or None when another
+    flush got there first (and counted it).
+    """
+    field = f"completed_bits.{word}"
+    return db.enrollments.find_one_and_update(
+        {"user_id": user_id, "course_id": course_id,
+         "$or": [{field: {"$exists": False}}, {field: {"$bitsAllClear": mask}}]},
+        {"$bit": {field: {"or": mask}}, "$inc": {f"progress_by_day.{day}.topics_completed": 1}},
+        projection={"progress": 1, "completed_bits": 1, "completed_at": 1}
+    )
+
+
+def _flush_pending(pending):
+    """
+    Write coalesced events and return their side effects (see
+    _apply_effects). Each newly completed topic is its own conditional
+    update, so it is counted by exactly one flush even when two run from the
+    same stale read; progress is then raised to the bitset's share of the
+    course (with $max, so an older client-set value is never lowered), and
+    the resume position is kept unless a newer one is already stored.
+    """
+    course_ids = list({course_id for _, course_id in pending})
+    courses = {
+        c["_id"]: c
+        for c in db.courses.find({"_id": {"$in": course_ids}}, {"topic_bits": 1, "stats.total_minutes": 1})
+    }
+    current = {
+        (e["user_id"], e["course_id"]): e
+        for e in db.enrollments.find(
+            {"$or": [{"user_id": u, "course_id": c} for u, c in pending]},
+            {"user_id": 1, "course_id": 1, "progress": 1, "completed_bits": 1, "completed_at": 1,
+             "last_position.updated_at": 1}
+        )
+    }
+
+    ops, topics, minutes, finished = [], Counter(), Counter(), []
+    for (user_id, course_id), entry in pending.items():
+        if (user_id, course_id) not in current:
+            continue  # not enrolled (any more)
+        course = courses.get(course_id, {})
+        bits = course.get("topic_bits") or {}
+        enrollment = current[(user_id, course_id)]
+        completed = enrollment.get("completed_bits") or {}
+
+        progress, done = None, False
+        for tid, day in entry["topics"].items():
+            if tid not in bits or has_bit(completed, bits[tid]):
+                continue
+            (word, mask), = bit_masks([bits[tid]]).items()
+            before = _set_topic(user_id, course_id, word, mask, day)
+            if before is None:
+                continue
+            completed = dict(before.get("completed_bits") or {})
+            old = max(before.get("progress") or 0, completion_percent(completed, bits))
+            completed[word] = int(completed.get(word, 0)) | int(mask)
+            progress = completion_percent(completed, bits)
+            topics[(str(user_id), str(course_id), day)] += 1
+            minutes[str(user_id)] += minutes_delta(old, progress, (course.get("stats") or {}).get("total_minutes"))
+            done = max(progress, before.get("progress") or 0) >= 100 and not before.get("completed_at")
+        if done:
+            finished.append([str(user_id), str(course_id)])
+
+        update = {}
+        if progress is not None:
+            update["$max"] = {"progress": progress}
+        position = entry["position"]
+        stored_at = (enrollment.get("last_position") or {}).get("updated_at")
+        if position and (not stored_at or stored_at < position["updated_at"]):
+            update["$set"] = {"last_position": position}
+        if update:
+            ops.append(UpdateOne({"user_id": user_id, "course_id": course_id}, update))
+    if ops:
+        db.enrollments.bulk_write(ops, ordered=False)
+
+    return {
+        "topics": [[u, c, day, n] for (u, c, day), n in topics.items()],
+        "minutes": [[u, m] for u, m in minutes.items() if m],
+        "finished": finished,
+    }
+
+
+def _record_topics(rows):
+    record_topics({
+        (ObjectId(u), ObjectId(c), datetime.strptime(day, DAY_FORMAT)): n for u, c, day, n in rows
+    })
+
+
+def _add_learning_minutes(rows):
+    add_learning_minutes({ObjectId(u): m for u, m in rows})
+
+
+def _record_completions(rows):
+    for user_id, course_id in rows:
+        # Only the write that sets completed_at counts the completion
+        crossed = db.enrollments.update_one(
+            {"user_id": ObjectId(user_id), "course_id": ObjectId(course_id), "completed_at": {"$exists": False}},
+            {"$set": {"completed_at": datetime.utcnow()}}
+        )
+        if crossed.modified_count:
+            record_completion(ObjectId(user_id))
+
+
+_EFFECTS = (("topics", _record_topics), ("minutes", _add_learning_minutes), ("finished", _record_completions))
+
+
+def _save_effects(journal_dir, name, effects):
+    """
+    Persist a flush's side effects next to its journal. Their bits are set
+    by now, so replaying the journal would no longer count them: from here
+    on the effects file is what keeps them from being lost.
+    """
+    path = os.path.join(journal_dir, f"{name}.{uuid.uuid4().hex[:8]}.effects.json")
+    with open(path, "w") as f:
+        json.dump(effects, f)
+        f.flush()
+        os.fsync(f.fileno())
+    return path
+
+
+def _apply_effects(path):
+    """
+    Apply a saved flush's leaderboard, learning-minute and completion
+    updates, crossing each kind off the file as it is written, then delete
+    it. Raises (keeping the file) if a write fails.
+    """
+    with open(path) as f:
+        effects = json.load(f)
+    for kind, apply in _EFFECTS:
+        if effects.get(kind):
+            apply(effects[kind])
+            effects[kind] = []
+            with open(path, "w") as f:
+                json.dump(effects, f)
+    os.remove(path)
+
+
+def _coalesce(pending, user_id, course_id, topic_id, position, day):
+    entry = pending.setdefault((user_id, course_id), {"topics": {}, "position": None})
+    if topic_id:
+        entry["topics"].setdefault(topic_id, day)  # first day it was completed
+    if position:
+        entry["position"] = position
+
+
+def _merge(older, newer):
+    """Fold `newer` into `older`: newer positions win, completed topics add up."""
+    for key, entry in newer.items():
+        target = older.setdefault(key, {"topics": {}, "position": None})
+        for topic_id, day in entry["topics"].items():
+            target["topics"].setdefault(topic_id, day)
+        if entry["position"]:
+            target["position"] = entry["position"]
+    return older
+
+
+def _journal_line(user_id, course_id, topic_id, position, day):
+    if position:
+        position = {**position, "updated_at": position["updated_at"].isoformat()}
+    return json.dumps({"u": str(user_id), "c": str(course_id), "t": topic_id, "pos": position, "d": day}) + "\n"
+
+
+def _read_journal(path, pending):
+    with open(path) as f:
+        for line in f:
+            try:
+                e = json.loads(line)
+            except ValueError:
+                continue  # torn last line: that event was never acknowledged
+            position = e.get("pos")
+            if position:
+                position["updated_at"] = datetime.fromisoformat(position["updated_at"])
+            _coalesce(pending, ObjectId(e["u"]), ObjectId(e["c"]), e.get("t"), position, e["d"])
+
+
+class ProgressBuffer:
+    """
+    Per-worker write-behind buffer for enrollment progress.
+
+    Events are appended to an fsync'd journal before the request is
+    acknowledged, coalesced in memory per (student, course), and written with
+    one bulk_write per flush. Each worker holds an flock on its own lock file
+    for as long as it lives; journals whose lock can be taken belong to a dead
+    worker and are replayed by whoever finds them. Replaying a batch that was
+    already written is harmless: set bits stay set and don't count again.
+    Side effects of a written batch (leaderboards, learning minutes,
+    completions) are saved to an effects file before its journal is
+    dropped, and retried from there until they are written.
+    """
+
+    def __init__(self, journal_dir=JOURNAL_DIR):
+        self.journal_dir = journal_dir
+        os.makedirs(journal_dir, exist_ok=True)
+        self.name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = {}
+        self._count = 0
+        self._segments = []  # journals covered by _pending, deleted once it is written
+        self._seq = 0
+        self._effects = []  # effects files still to apply, oldest first
+        self._effects_lock = threading.Lock()
+
+        self._lockfile = open(os.path.join(journal_dir, f"{self.name}.lock"), "w")
+        fcntl.flock(self._lockfile, fcntl.LOCK_EX)
+        self._journal = self._open_segment()
+
+        try:
+            replay_orphans(journal_dir, exclude=self.name)
+        except Exception as e:
+            print(f"❌ Could not replay orphaned progress journals: {e}")
+        threading.Thread(target=self._run, name="progress-flusher", daemon=True).start()
+        atexit.register(self.close)
+
+    def _open_segment(self):
+        self._seq += 1
+        path = os.path.join(self.journal_dir, f"{self.name}.{self._seq:06d}.jsonl")
+        self._segments.append(path)
+        return open(path, "a")
+
+    def add(self, events):
+        """
+        Journal and buffer [(user_id, course_id, completed_topic_id, position), ...]
+        where either of the last two may be None; durable on return.
+        """
+        day = day_key()
+        with self._lock:
+            for event in events:
+                self._journal.write(_journal_line(*event, day))
+                _coalesce(self._pending, *event, day)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._count += len(events)
+            if self._count >= FLUSH_EVENTS:
+                self._wake.set()
+
+    def flush(self):
+        written = self._flush_events()
+        self._apply_effects()
+        return written
+
+    def _flush_events(self):
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending, self._count = self._pending, {}, 0
+            segments, self._segments = self._segments, []
+            self._journal.close()
+            self._journal = self._open_segment()
+
+        try:
+            effects = _flush_pending(pending)
+        except Exception as e:
+            print(f"❌ Progress flush failed, will retry: {e}")
+            with self._lock:
+                self._pending = _merge(pending, self._pending)
+                self._segments = segments + self._segments
+            return 0
+
+        if any(effects.values()):
+            with self._effects_lock:
+                self._effects.append(_save_effects(self.journal_dir, self.name, effects))
+        for path in segments:
+            os.remove(path)
+        return len(pending)
+
+    def _apply_effects(self):
+        with self._effects_lock:
+            while self._effects:
+                try:
+                    _apply_effects(self._effects[0])
+                except Exception as e:
+                    print(f"❌ Progress side effects failed, will retry: {e}")
+                    return
+                self._effects.pop(0)
+
+    def _run(self):
+        while True:
+            self._wake.wait(FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._journal.close()
+            if not self._pending and not self._effects:
+                for path in self._segments:
+                    os.remove(path)
+                self._segments = []
+                os.remove(self._lockfile.name)
+            self._lockfile.close()
+
+
+def replay_orphans(journal_dir=JOURNAL_DIR, exclude=None):
+    """Write out journals (and unapplied side effects) left behind by workers that died."""
+    replayed = 0
+    for lock_path in glob.glob(os.path.join(journal_dir, "*.lock")):
+        name = os.path.basename(lock_path)[:-len(".lock")]
+        if name == exclude:
+            continue
+        try:
+            lockfile = open(lock_path, "a")
+        except FileNotFoundError:
+            continue  # another worker just finished replaying it
+        try:
+            fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lockfile.close()
+            continue  # owner is alive
+        try:
+            segments = sorted(glob.glob(os.path.join(journal_dir, f"{name}.*.jsonl")))
+            pending = {}
+            for path in segments:
+                _read_journal(path, pending)
+            if pending:
+                effects = _flush_pending(pending)
+                if any(effects.values()):
+                    _save_effects(journal_dir, name, effects)
+                print(f"✅ Replayed {len(pending)} progress update(s) from worker {name}")
+            for path in segments:
+                os.remove(path)
+            for path in glob.glob(os.path.join(journal_dir, f"{name}.*.effects.json")):
+                _apply_effects(path)
+            os.remove(lock_path)
+            replayed += len(pending)
+        finally:
+            lockfile.close()
+    return replayed
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def progress_buffer():
+    """This process's buffer, created on first use (after any fork)."""
+    global _buffer
+    if _buffer is None or not _buffer.name.startswith(f"{os.getpid()}-"):
+        with _buffer_lock:
+            if _buffer is None or not _buffer.name.startswith(f"{os.getpid()}-"):
+                _buffer = ProgressBuffer()
+    return _buffer
@@ -0,0 +1,119 @@
+# services/query_plans.py
+from bson import ObjectId
+from bson.son import SON
+from pymongo import monitoring
+
+from extensions import db, listening_client
+from services.catalog import CATALOG_SORTS
+from services.course_topics import load_topics
+from services.indexes import INDEXES
+from services.leaderboard import top_in_course, top_this_week, top_students
+from services.repository import course_repo, enrollment_repo, user_repo
+from services.search import search_courses
+
+# What (nearly) every page view reads, as the calls the app makes for it.
+# `flask check-query-plans` runs each one, records the commands it sends
+# and explains them, so the check follows the code instead of a copy of
+# its queries. Reads only: nothing is created or changed.
+_ID = ObjectId()
+HOT_PATHS = [
+    ("sign-in by email", lambda: user_repo.by_email("someone@example.com")),
+    ("student's enrollments", lambda: enrollment_repo.for_student(_ID, {"progress": 1})),
+    ("student's enrollment in a course", lambda: enrollment_repo.get(_ID, _ID, {"progress": 1})),
+    ("courses' enrollments", lambda: enrollment_repo.for_courses([_ID], {"user_id": 1})),
+    ("instructor's courses", lambda: course_repo.by_instructor(_ID)),
+    *[
+        (f"published catalog, sort={sort}", lambda field=field, direction=direction: course_repo.catalog_page(field, direction, 24))
+        for sort, (field, direction) in CATALOG_SORTS.items()
+    ],
+    ("published catalog in one category", lambda: search_courses("", {"category": "Programming"})),
+    ("one module's topics", lambda: load_topics({"_id": _ID, "outline": []}, 0)),
+    ("leaderboard top k", top_students),
+    ("course leaderboard", lambda: top_in_course(_ID)),
+    ("weekly leaderboard", top_this_week),
+]
+
+# Parts of a read command that shape its plan; the rest (session, read
+# preference, batch size, ...) is left out of the explain
+_PLAN_FIELDS = {
+    "find": ("filter", "sort", "projection", "hint", "limit", "skip"),
+    "aggregate": ("pipeline", "hint"),
+    "count": ("query", "hint", "limit"),
+}
+
+
+class _ReadRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        fields = _PLAN_FIELDS.get(event.command_name)
+        if fields is not None:
+            command = SON([(event.command_name, event.command[event.command_name])])
+            command.update((k, event.command[k]) for k in fields if k in event.command)
+            self.commands.append(command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _winning_plans(explain):
+    """Every winningPlan in an explain result (aggregations nest theirs in stages)."""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from _winning_plans(item)
+
+
+def _plan_stages(plan):
+    """Every stage name in an explain plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def collection_scans():
+    """[(description, collection, winning plan stages)] for hot-path reads that scan a whole collection."""
+    recorded = []
+    for description, call in HOT_PATHS:
+        recorder = _ReadRecorder()
+        with listening_client(recorder):
+            call()
+        recorded += [(description, command) for command in recorder.commands]
+
+    scans = []
+    for description, command in recorded:
+        explain = db.command("explain", command, verbosity="queryPlanner")
+        stages = [stage for plan in _winning_plans(explain) for stage in _plan_stages(plan)]
+        if "COLLSCAN" in stages:
+            scans.append((description, next(iter(command.values())), stages))
+    return scans
+
+
+def _key(spec):
+    return tuple((field, int(d) if isinstance(d, (int, float)) else d) for field, d in spec)
+
+
+def missing_indexes():
+    """[(collection, index name)] of the registered indexes (INDEXES) that don't exist."""
+    missing = []
+    for name, models in INDEXES.items():
+        existing = {_key(info["key"]) for info in db[name].index_information().values()}
+        missing += [
+            (name, model.document["name"]) for model in models
+            if _key(model.document["key"].items()) not in existing
+        ]
+    return missing
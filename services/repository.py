@@ -0,0 +1,348 @@
+# services/repository.py
+import threading
+from datetime import datetime
+
+from pymongo import ASCENDING
+
+from extensions import AGGREGATION_MAX_TIME_MS, analytics_db, db
+from services.cache import invalidate_user
+from services.catalog import CATALOG_CARD_FIELDS
+from services.pagination import keyset_page
+
+# The controllers' reads and writes on users, courses and enrollments.
+# Each access pattern is one named method with the projection its page
+# renders, and queries on a secondary key are hinted to the index that
+# serves them (lookups by _id need no hint). A hint is only sent once the
+# index is known to exist, so a unique index that couldn't be built (see
+# `flask dedupe-enrollments`) degrades to an unhinted query, not an error.
+#
+# Enrollments are keyed by `user_id`; `flask migrate-enrollment-keys`
+# renames the `student_id` of older documents.
+#
+# Reads for analytics and the catalog (analytics=True) may be served by a
+# secondary and lag the primary by up to ANALYTICS_MAX_STALENESS_S; a
+# student's own enrollments and anything followed by a write stay on the
+# primary.
+
+# ---------- projections ----------
+USER_NAV = {"fullname": 1, "email": 1, "profile_image": 1, "profile_image_variants": 1, "photo_url": 1}
+USER_PROFILE = {
+    **USER_NAV, "username": 1, "role": 1, "mobile": 1, "skills": 1, "linkedin": 1, "github": 1,
+    "achievements": 1, "createdAt": 1, "last_login": 1,
+    "total_courses": 1, "total_students": 1, "average_rating": 1,
+}
+USER_ANALYTICS = {**USER_NAV, "learning_minutes": 1}
+USER_PASSWORD = {"password": 1}
+USER_SIGN_IN = {"password": 1, "role": 1}
+USER_ASSETS = {"profile_image": 1, "profile_image_variants": 1}
+INSTRUCTOR_CARD = {"fullname": 1, "profile_image": 1, "photo_url": 1, "tagline": 1}
+REVIEWER = {"fullname": 1, "profile_image": 1}
+
+COURSE_CARD = {
+    "title": 1, "description": 1, "thumbnail_url": 1, "thumbnail_variants": 1,
+    "instructor_id": 1, "rating": 1, "slug": 1,
+}
+COURSE_SUMMARY = {"structure": 0, "outline": 0, "topic_bits": 0}
+COURSE_PAGE = {"topic_bits": 0, "topic_bit_next": 0}
+COURSE_EDIT = {"reviews": 0, "thumbnail_variants": 0}
+COURSE_PLAYER = {"title": 1, "instructor_id": 1, "outline": 1, "structure": 1, "topic_bits": 1, "version": 1}
+COURSE_ANALYTICS = {"title": 1, "status": 1, "rating": 1, "language": 1, "reviews.stars": 1}
+COURSE_THUMBNAIL = {"thumbnail_url": 1, "thumbnail_variants": 1}
+COURSE_ASSETS = {"thumbnail_url": 1, "thumbnail_variants": 1, "structure": 1, "outline": 1}
+
+# ---------- indexes ----------
+COURSE_BY_INSTRUCTOR = [("instructor_id", ASCENDING)]
+ENROLLMENT_BY_STUDENT = [("user_id", ASCENDING), ("course_id", ASCENDING)]
+ENROLLMENT_BY_COURSE = [("course_id", ASCENDING)]
+
+_available_lock = threading.Lock()
+_available = None
+
+
+def _available_indexes():
+    """Key specs of the indexes that exist, listed once per process (they're built by `flask bootstrap`)."""
+    global _available
+    if _available is None:
+        with _available_lock:
+            if _available is None:
+                _available = {
+                    (collection.name, tuple((k, int(d)) for k, d in info["key"]))
+                    for collection in (db.users, db.courses, db.enrollments)
+                    for info in collection.index_information().values()
+                }
+    return _available
+
+
+def _hint(collection, keys):
+    return {"hint": keys} if (collection.name, tuple(keys)) in _available_indexes() else {}
+
+
+class UserRepository:
+    collection = db.users
+
+    def get(self, user_id, fields=USER_NAV):
+        return self.collection.find_one({"_id": user_id}, fields)
+
+    def by_email(self, email, fields=USER_SIGN_IN):
+        return self.collection.find_one({"email": email}, fields)
+
+    def by_ids(self, user_ids, fields=USER_NAV):
+        """{_id: user} for the users that exist."""
+        return {u["_id"]: u for u in self.collection.find({"_id": {"$in": list(user_ids)}}, fields)}
+
+    def names(self, user_ids):
+        return {_id: u.get("fullname") for _id, u in self.by_ids(user_ids, {"fullname": 1}).items()}
+
+    def students_matching(self, user_ids, emails):
+        """Students among `user_ids` or with one of `emails`."""
+        return list(self.collection.find(
+            {"role": "student", "$or": [{"_id": {"$in": list(user_ids)}}, {"email": {"$in": list(emails)}}]},
+            {"email": 1}
+        ))
+
+    def update_profile(self, user_id, fields, unset=None):
+        """Returns the photo fields as they were before (see USER_ASSETS)."""
+        update = {"$set": fields}
+        if unset:
+            update["$unset"] = dict.fromkeys(unset, "")
+        previous = self.collection.find_one_and_update({"_id": user_id}, update, projection=USER_ASSETS)
+        invalidate_user(user_id)
+        return previous
+
+    def remove_photo(self, user_id):
+        """Returns the removed photo fields (see USER_ASSETS)."""
+        previous = self.collection.find_one_and_update(
+            {"_id": user_id}, {"$unset": {"profile_image": "", "profile_image_variants": ""}},
+            projection=USER_ASSETS
+        )
+        invalidate_user(user_id)
+        return previous
+
+    def set_password(self, user_id, password_hash):
+        self.collection.update_one({"_id": user_id}, {"$set": {"password": password_hash}})
+        invalidate_user(user_id)
+
+    def delete(self, user_id):
+        """Delete the account; returns its uploaded image fields (or None)."""
+        user = self.collection.find_one_and_delete({"_id": user_id}, projection=USER_ASSETS)
+        invalidate_user(user_id)
+        return user
+
+
+class CourseRepository:
+    collection = db.courses
+    replica = analytics_db.courses
+
+    def _reads(self, analytics):
+        return self.replica if analytics else self.collection
+
+    def get(self, course_id, fields, published=False):
+        query = {"_id": course_id}
+        if published:
+            query["status"] = "published"
+        return self.collection.find_one(query, fields)
+
+    def owned(self, course_id, instructor_id, fields):
+        """The course if `instructor_id` teaches it (any instructor when None)."""
+        query = {"_id": course_id}
+        if instructor_id is not None:
+            query["instructor_id"] = instructor_id
+        return self.collection.find_one(query, fields)
+
+    def by_instructor(self, instructor_id, fields=COURSE_SUMMARY, analytics=False):
+        return list(self._reads(analytics).find(
+            {"instructor_id": instructor_id}, fields, **_hint(self.collection, COURSE_BY_INSTRUCTOR)
+        ))
+
+    def ids(self, instructor_id=None):
+        """Ids of an instructor's courses, or of every course when None."""
+        if instructor_id is None:
+            return {c["_id"] for c in self.collection.find({}, {"_id": 1})}
+        return {c["_id"] for c in self.by_instructor(instructor_id, {"_id": 1})}
+
+    def published_in(self, course_ids, fields=COURSE_CARD):
+        return list(self.collection.find({"_id": {"$in": list(course_ids)}, "status": "published"}, fields))
+
+    def titles(self, course_ids):
+        return {c["_id"]: c.get("title") for c in self.collection.find({"_id": {"$in": list(course_ids)}}, {"title": 1})}
+
+    def count_published(self):
+        return self.replica.count_documents({"status": "published"})
+
+    def catalog_page(self, field, direction, limit, after=None):
+        """(cards, next_token) of the published catalog; raises ValueError on a bad token."""
+        return keyset_page(self.replica, {"status": "published"}, CATALOG_CARD_FIELDS,
+                           field, direction, limit, after=after)
+
+    def insert(self, course):
+        self.collection.insert_one(course)
+
+    def update(self, course_id, fields, unset=None):
+        """
+        Set `fields` and bump the version (drops cached pages and ETags).
+        Returns the thumbnail fields as they were before.
+        """
+        update = {"$set": {**fields, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}}
+        if unset:
+            update["$unset"] = dict.fromkeys(unset, "")
+        return self.collection.find_one_and_update({"_id": course_id}, update, projection=COURSE_THUMBNAIL)
+
+    def bump_instructor(self, instructor_id):
+        """
+        Bump the version of every course by `instructor_id`, whose name and
+        photo are part of the cached course pages; returns their ids.
+        """
+        course_ids = self.ids(instructor_id)
+        if course_ids:
+            self.collection.update_many({"_id": {"$in": list(course_ids)}}, {"$inc": {"version": 1}})
+        return course_ids
+
+    def set_status(self, course_id, status):
+        self.update(course_id, {"status": status})
+
+    def add_review(self, course_id, review):
+        self.collection.update_one(
+            {"_id": course_id},
+            {"$push": {"reviews": review},
+             "$set": {"updated_at": datetime.utcnow()},
+             "$inc": {"version": 1}}
+        )
+
+    def delete_owned(self, course_id, instructor_id):
+        """Delete the course; returns its asset fields (or None if it isn't theirs)."""
+        return self.collection.find_one_and_delete(
+            {"_id": course_id, "instructor_id": instructor_id}, projection=COURSE_ASSETS
+        )
+
+
+class EnrollmentRepository:
+    collection = db.enrollments
+    replica = analytics_db.enrollments
+
+    def _reads(self, analytics):
+        return self.replica if analytics else self.collection
+
+    def get(self, user_id, course_id, fields):
+        return self.collection.find_one(
+            {"user_id": user_id, "course_id": course_id}, fields,
+            **_hint(self.collection, ENROLLMENT_BY_STUDENT)
+        )
+
+    def is_enrolled(self, user_id, course_id):
+        return self.collection.count_documents(
+            {"user_id": user_id, "course_id": course_id}, limit=1,
+            **_hint(self.collection, ENROLLMENT_BY_STUDENT)
+        ) > 0
+
+    def for_student(self, user_id, fields, analytics=False):
+        return list(self._reads(analytics).find(
+            {"user_id": user_id}, fields, **_hint(self.collection, ENROLLMENT_BY_STUDENT)
+        ))
+
+    def for_courses(self, course_ids, fields, completed=False, analytics=False):
+        query = {"course_id": {"$in": list(course_ids)}}
+        if completed:
+            query["progress"] = {"$gte": 100}
+        return list(self._reads(analytics).find(query, fields, **_hint(self.collection, ENROLLMENT_BY_COURSE)))
+
+    def counts_by_course(self, course_ids, analytics=False):
+        """{course_id: number of enrollments}, from the course_id index alone."""
+        return {
+            row["_id"]: row["n"]
+            for row in self._reads(analytics).aggregate([
+                {"$match": {"course_id": {"$in": list(course_ids)}}},
+                {"$group": {"_id": "$course_id", "n": {"$sum": 1}}},
+            ], maxTimeMS=AGGREGATION_MAX_TIME_MS, **_hint(self.collection, ENROLLMENT_BY_COURSE))
+        }
+
+    def remove(self, user_id, course_id):
+        """Unenroll; returns the deleted enrollment's completed_at and progress_by_day (or None if there was none)."""
+        removed = self.collection.find_one_and_delete(
+            {"user_id": user_id, "course_id": course_id},
+            projection={"completed_at": 1, "progress_by_day": 1},
+            **_hint(self.collection, ENROLLMENT_BY_STUDENT)
+        )
+        invalidate_user(user_id)
+        return removed
+
+    def student_overview(self, user_id, first_day):
+        """Dashboard cards, totals and per-day topics since `first_day` (a day key), in one round trip."""
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$addFields": {"days": {"$objectToArray": {"$ifNull": ["$progress_by_day", {}]}}}},
+            {"$facet": {
+                "cards": [
+                    {"$lookup": {
+                        "from": "courses",
+                        "localField": "course_id",
+                        "foreignField": "_id",
+                        "pipeline": [{"$project": {"title": 1, "description": 1, "thumbnail_url": 1}}],
+                        "as": "course"
+                    }},
+                    {"$unwind": "$course"},
+                    {"$project": {"progress": 1, "course": 1}}
+                ],
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "completed": {"$sum": {"$cond": [{"$gte": ["$progress", 100]}, 1, 0]}},
+                        "topics": {"$sum": {"$sum": "$days.v.topics_completed"}}
+                    }}
+                ],
+                "weekly": [
+                    {"$unwind": "$days"},
+                    {"$match": {"days.k": {"$gte": first_day}}},
+                    {"$group": {"_id": "$days.k", "topics": {"$sum": "$days.v.topics_completed"}}}
+                ]
+            }}
+        ]
+        return next(self.collection.aggregate(
+            pipeline, maxTimeMS=AGGREGATION_MAX_TIME_MS, **_hint(self.collection, ENROLLMENT_BY_STUDENT)
+        ), {})
+
+    def export_rows(self, course_id, enrolled_before=None, first_day=None, end_day=None, batch_size=1000):
+        """
+        Cursor over a course's enrollments with the student's name and email
+        and the progress_by_day entries in [first_day, end_day).
+        """
+        match = {"course_id": course_id}
+        if enrolled_before:
+            match["enrolled_at"] = {"$lt": enrolled_before}
+
+        # Day keys are ISO strings, so the range compares as strings
+        day_conds = []
+        if first_day:
+            day_conds.append({"$gte": ["$$u.k", first_day]})
+        if end_day:
+            day_conds.append({"$lt": ["$$u.k", end_day]})
+
+        pipeline = [
+            {"$match": match},
+            {"$lookup": {
+                "from": "users",
+                "localField": "user_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"fullname": 1, "email": 1}}],
+                "as": "student"
+            }},
+            {"$project": {
+                "user_id": 1,
+                "enrolled_at": 1,
+                "progress": 1,
+                "student_name": {"$arrayElemAt": ["$student.fullname", 0]},
+                "student_email": {"$arrayElemAt": ["$student.email", 0]},
+                "progress_days": {"$filter": {
+                    "input": {"$objectToArray": {"$ifNull": ["$progress_by_day", {}]}},
+                    "as": "u",
+                    "cond": {"$and": day_conds} if day_conds else True
+                }}
+            }}
+        ]
+        return self.collection.aggregate(
+            pipeline, batchSize=batch_size, **_hint(self.collection, ENROLLMENT_BY_COURSE)
+        )
+
+
+user_repo = UserRepository()
+course_repo = CourseRepository()
+enrollment_repo = EnrollmentRepository()
@@ -0,0 +1,182 @@
+# services/roster.py
+import csv
+import io
+import os
+import re
+import uuid
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from extensions import INSTANCE_PATH, db
+from services.enrollments import enroll_many
+from services.jobs import job_handler
+from services.passwords import hash_passwords
+from services.repository import course_repo
+
+# Roster CSV: a header row naming these columns, in any order
+#   fullname, email, password, mobile (optional), role (optional), course_id (optional)
+# Rows are read and written ROSTER_BATCH_SIZE at a time, so a large file
+# never sits in memory and each batch costs one users bulk_write plus one
+# enrollment bulk_write per course.
+REQUIRED_COLUMNS = ("fullname", "email", "password")
+ROSTER_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+# Uploaded rosters wait here for their import job, which deletes them when done
+ROSTER_UPLOAD_DIR = os.getenv("ROSTER_UPLOAD_DIR") or os.path.join(INSTANCE_PATH, "roster-uploads")
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _validate(row, allowed_roles, default_course, allowed_courses, seen):
+    """(user fields, course ObjectId or None) for a row, or raises ValueError."""
+    fullname = (row.get("fullname") or "").strip()
+    email = (row.get("email") or "").strip().lower()
+    password = (row.get("password") or "").strip()
+    role = (row.get("role") or "student").strip().lower()
+    if not fullname or not email or not password:
+        raise ValueError("fullname, email and password are required")
+    if not EMAIL_RE.match(email):
+        raise ValueError("invalid email")
+    if email in seen:
+        raise ValueError("email repeated in this file")
+    if role not in allowed_roles:
+        raise ValueError(f"role must be one of: {', '.join(allowed_roles)}")
+
+    course = default_course
+    if (row.get("course_id") or "").strip():
+        if not ObjectId.is_valid(row["course_id"].strip()):
+            raise ValueError("invalid course_id")
+        course = ObjectId(row["course_id"].strip())
+    if course and course not in allowed_courses:
+        raise ValueError("unknown course, or not yours")
+    if course and role != "student":
+        raise ValueError("only students can be enrolled")
+
+    seen.add(email)
+    return {
+        "fullname": fullname,
+        "email": email,
+        "mobile": (row.get("mobile") or "").strip(),
+        "password": password,
+        "role": role,
+    }, course
+
+
+def _write_batch(batch, summary):
+    """Create new users and enroll everyone that has a course. batch: [(line, user, course)]."""
+    existing = {
+        u["email"]: u
+        for u in db.users.find({"email": {"$in": [user["email"] for _, user, _ in batch]}}, {"email": 1, "role": 1})
+    }
+    new = [(line, user, course) for line, user, course in batch if user["email"] not in existing]
+    for line, user, course in batch:
+        if user["email"] in existing:
+            summary["existing"] += 1
+            if course and existing[user["email"]].get("role") != "student":
+                _error(summary, line, user["email"], "existing account is not a student")
+
+    ids = {email: u["_id"] for email, u in existing.items() if u.get("role") == "student"}
+    if new:
+        hashes = hash_passwords(user["password"] for _, user, _ in new)
+        ops = [
+            # Keyed on email so a concurrent signup isn't overwritten
+            UpdateOne({"email": user["email"]}, {"$setOnInsert": {**user, "password": hashed}}, upsert=True)
+            for (_, user, _), hashed in zip(new, hashes)
+        ]
+        result = db.users.bulk_write(ops, ordered=False)
+        summary["created"] += result.upserted_count
+        summary["existing"] += len(new) - result.upserted_count
+        for index, user_id in result.upserted_ids.items():
+            ids[new[index][1]["email"]] = user_id
+
+    by_course = {}
+    for _, user, course in batch:
+        if course and user["email"] in ids:
+            by_course.setdefault(course, []).append(ids[user["email"]])
+    for course, user_ids in by_course.items():
+        result = enroll_many(user_ids, course)
+        summary["enrolled"] += result["enrolled"]
+
+
+def _error(summary, line, email, message):
+    summary["failed"] += 1
+    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({"line": line, "email": email, "error": message})
+
+
+def _reader(stream):
+    """DictReader over a CSV byte stream; raises ValueError if a required column is missing."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    columns = {(c or "").strip().lower() for c in reader.fieldnames or []}
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return reader
+
+
+def save_upload(stream):
+    """
+    Keep an uploaded roster for import_roster_job and return its path.
+    Raises ValueError (or UnicodeDecodeError) for a file without the
+    required columns, which is not kept.
+    """
+    os.makedirs(ROSTER_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(ROSTER_UPLOAD_DIR, f"{uuid.uuid4().hex}.csv")
+    with open(path, "wb") as f:
+        while chunk := stream.read(64 * 1024):
+            f.write(chunk)
+    try:
+        with open(path, "rb") as f:
+            _reader(f)
+    except (ValueError, UnicodeDecodeError):
+        os.remove(path)
+        raise
+    return path
+
+
+def import_roster(stream, allowed_roles=("student",), default_course=None, allowed_courses=None):
+    """
+    Import users (and enrollments) from a CSV byte stream. Existing accounts
+    are left as they are but still enrolled. Returns counts and a per-row
+    error report (line numbers as in the file, header = line 1).
+    """
+    summary = {"rows": 0, "created": 0, "existing": 0, "enrolled": 0, "failed": 0, "errors": []}
+    reader = _reader(stream)
+    allowed_courses = set(allowed_courses or ())
+    if default_course:
+        allowed_courses.add(default_course)
+
+    seen, batch = set(), []
+    for row in reader:
+        row = {(k or "").strip().lower(): v for k, v in row.items()}
+        summary["rows"] += 1
+        try:
+            user, course = _validate(row, allowed_roles, default_course, allowed_courses, seen)
+        except ValueError as e:
+            _error(summary, reader.line_num, (row.get("email") or "").strip(), str(e))
+            continue
+        batch.append((reader.line_num, user, course))
+        if len(batch) >= ROSTER_BATCH_SIZE:
+            _write_batch(batch, summary)
+            batch = []
+    if batch:
+        _write_batch(batch, summary)
+    return summary
+
+
+@job_handler("import_roster")
+def import_roster_job(path, requested_by, role, default_course=None):
+    """
+    Import a roster kept by save_upload, as `requested_by` (an instructor
+    imports students into their own courses, an admin anyone anywhere).
+    """
+    with open(path, "rb") as f:
+        summary = import_roster(
+            f,
+            allowed_roles=("student", "instructor") if role == "admin" else ("student",),
+            default_course=default_course,
+            allowed_courses=course_repo.ids(None if role == "admin" else requested_by),
+        )
+    os.remove(path)
+    print(f"✅ Roster import: {summary['created']} created, {summary['enrolled']} enrolled, {summary['failed']} failed")
+    return summary
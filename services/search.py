@@ -0,0 +1,152 @@
+# services/search.py
+import hashlib
+import json
+import os
+
+from pymongo import DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+from extensions import AGGREGATION_MAX_TIME_MS, analytics_db, db
+from services.cache import CATALOG_LIST_TTL, fragment_cache
+from services.catalog import CATALOG_CARD_FIELDS
+from services.pagination import keyset_page
+
+SEARCH_INDEX_NAME = "course_search"
+SEARCH_INDEX_KEYS = [
+    ("title", TEXT),
+    ("description", TEXT),
+    ("category", TEXT),
+    ("language", TEXT),
+    ("outline.modules.chapters.topics.title", TEXT),
+]
+SEARCH_INDEX_OPTIONS = {
+    "name": SEARCH_INDEX_NAME,
+    "weights": {
+        "title": 10,
+        "category": 5,
+        "outline.modules.chapters.topics.title": 3,
+        "language": 2,
+        "description": 2,
+    },
+    "default_language": "english",
+    # Courses have their own `language` field ("Hindi", "Tamil", ...), which
+    # Mongo would otherwise read as the stemming language of the document.
+    "language_override": "text_search_language",
+}
+
+FACET_FIELDS = ("category", "difficulty", "language")
+MAX_PAGE_SIZE = 50
+# Most courses a search ranks, pages through and counts facets over
+MAX_COUNTED = int((os.getenv("SEARCH_MAX_COUNTED") or "1000").strip())
+MAX_FACET_VALUES = 50
+
+
+def create_search_index():
+    """Create the course text index (no-op if it exists); `flask ensure-indexes` runs it."""
+    try:
+        db.courses.create_index(SEARCH_INDEX_KEYS, **SEARCH_INDEX_OPTIONS)
+    except OperationFailure as e:
+        if e.code not in (85, 86):  # IndexOptionsConflict / IndexKeySpecsConflict
+            raise
+        # An older definition of the index (e.g. over `structure`) is in the way
+        db.courses.drop_index(SEARCH_INDEX_NAME)
+        db.courses.create_index(SEARCH_INDEX_KEYS, **SEARCH_INDEX_OPTIONS)
+
+
+def _facet_counts(match, filters):
+    """
+    {"total", "capped", "facets"} for the published courses matching
+    `match` (text query) and `filters`. Counts cover at most MAX_COUNTED
+    courses (the best-ranked ones for a text query), so the work and the
+    $facet output stay bounded however big the catalog gets; they are
+    cached briefly and dropped with the catalog listings on publish.
+    """
+    key = "catalog:facets:" + hashlib.sha1(
+        json.dumps([match, sorted(filters.items())], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    cached = fragment_cache.get(key)
+    if cached is not None:
+        return cached
+
+    pipeline = [{"$match": match}]
+    if "$text" in match:
+        pipeline.append({"$sort": {"score": {"$meta": "textScore"}, "_id": -1}})
+    pipeline += [
+        {"$limit": MAX_COUNTED + 1},
+        {"$project": dict.fromkeys(FACET_FIELDS, 1)},
+    ]
+    facets = {"total": [{"$match": filters}, {"$count": "n"}]}
+    for field in FACET_FIELDS:
+        others = {f: v for f, v in filters.items() if f != field}
+        facets[field] = [
+            {"$match": others},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": MAX_FACET_VALUES},
+        ]
+    pipeline.append({"$facet": facets})
+    result = next(analytics_db.courses.aggregate(pipeline, maxTimeMS=AGGREGATION_MAX_TIME_MS), {})
+
+    total = (result.get("total") or [{"n": 0}])[0]["n"]
+    counts = {
+        "total": min(total, MAX_COUNTED),
+        "capped": total > MAX_COUNTED,
+        "facets": {
+            field: [
+                {"value": f["_id"], "count": f["count"]}
+                for f in result.get(field, []) if f["_id"]
+            ]
+            for field in FACET_FIELDS
+        },
+    }
+    fragment_cache.set(key, counts, ttl=CATALOG_LIST_TTL)
+    return counts
+
+
+def search_courses(query="", filters=None, page=1, per_page=20, after=None):
+    """
+    Ranked, faceted search over published courses.
+
+    Returns {"results": [...], "total": int, "capped": bool, "page", "per_page",
+    "next": page token or None, "facets": {field: [{"value", "count"}]}}.
+    Each facet is counted with every other filter applied but not its own, so
+    picking a category still shows how many results the other categories have.
+
+    Without a text query the results are the filtered catalog, newest first,
+    paged by token (`after`/"next") over an index like the catalog itself.
+    A text query is paged by number through its MAX_COUNTED best matches.
+    Raises ValueError on a bad page token.
+    """
+    filters = {f: v for f, v in (filters or {}).items() if f in FACET_FIELDS and v}
+    page = max(int(page), 1)
+    per_page = min(max(int(per_page), 1), MAX_PAGE_SIZE)
+
+    match = {"status": "published"}
+    if query:
+        match["$text"] = {"$search": query}
+    found = {**_facet_counts(match, filters), "page": page, "per_page": per_page, "next": None}
+
+    if not query:
+        found["page"] = None
+        found["results"], found["next"] = keyset_page(
+            analytics_db.courses, {**match, **filters}, CATALOG_CARD_FIELDS,
+            "created_at", DESCENDING, per_page, after=after
+        )
+        return found
+
+    # $sort + $limit is a top-k sort: memory is bounded by MAX_COUNTED
+    skip = (page - 1) * per_page
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        {"$sort": {"score": -1, "_id": -1}},
+        {"$limit": MAX_COUNTED},
+        {"$match": filters},
+        {"$skip": skip},
+        {"$limit": per_page},
+        {"$project": {**CATALOG_CARD_FIELDS, "score": 1}},
+    ]
+    found["results"] = list(
+        analytics_db.courses.aggregate(pipeline, maxTimeMS=AGGREGATION_MAX_TIME_MS)
+    ) if skip < MAX_COUNTED else []
+    return found
@@ -0,0 +1,189 @@
+# services/storage.py
+import io
+import os
+import re
+import uuid
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+import cloudinary.api
+import cloudinary.uploader
+from werkzeug.utils import secure_filename
+
+from extensions import INSTANCE_PATH, STATIC_FOLDER
+
+# STORAGE_BACKEND picks where uploads go: "cloudinary" (the default when
+# Cloudinary is configured) or "local", which keeps files under MEDIA_ROOT and
+# serves them from /media/ (controllers/media.py). Stored URLs say which
+# driver owns a file, so deletes work whichever backend is active now.
+STORAGE_BACKEND = (
+    os.getenv("STORAGE_BACKEND")
+    or ("cloudinary" if (os.getenv("CLOUDINARY_CLOUD_NAME") or "").strip() else "local")
+).strip().lower()
+MEDIA_ROOT = os.getenv("MEDIA_ROOT") or os.path.join(INSTANCE_PATH, "media")
+MEDIA_URL_PREFIX = "/media/"
+LEGACY_UPLOAD_PREFIX = "/static/uploads/"  # student photos saved before the local driver
+
+# Extensions the local driver accepts, by resource type ("auto" takes any of
+# them). Its files are served from the app's own origin, so nothing a
+# browser would run (HTML, SVG, scripts) may be stored there.
+ALLOWED_EXTENSIONS = {
+    "image": {".jpg", ".jpeg", ".png", ".gif", ".webp"},
+    "video": {".mp4", ".webm", ".mov", ".m4v"},
+    "raw": {".pdf", ".zip", ".txt", ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx"},
+}
+ALLOWED_EXTENSIONS["auto"] = set().union(*ALLOWED_EXTENSIONS.values())
+
+CLOUDINARY_DELETE_BATCH = 100  # Admin API limit per delete_resources call
+MAX_READ_BYTES = 25 * 1024 * 1024
+
+
+def resource_type_for(content_type):
+    """Cloudinary resource type for a topic's content type."""
+    if content_type == "video":
+        return "video"
+    if content_type in ("pdf", "zip", "other"):
+        return "raw"
+    if content_type == "image":
+        return "image"
+    return "auto"
+
+
+def _cloudinary_public_id(url):
+    """(resource_type, public_id) of a Cloudinary delivery URL, else None."""
+    parsed = urlparse(url)
+    if not parsed.netloc.endswith(".cloudinary.com"):
+        return None
+    # /<cloud>/<resource_type>/<delivery_type>/[v<version>/]<public_id>[.<ext>]
+    parts = parsed.path.strip("/").split("/")
+    if len(parts) < 4:
+        return None
+    resource_type, rest = parts[1], parts[3:]
+    for i, part in enumerate(rest):
+        if re.fullmatch(r"v\d+", part):
+            rest = rest[i + 1:]
+            break
+    public_id = "/".join(rest)
+    if resource_type != "raw":
+        public_id = os.path.splitext(public_id)[0]
+    return resource_type, public_id
+
+
+class CloudinaryStorage:
+    name = "cloudinary"
+
+    def save(self, file, resource_type="auto", folder=None):
+        options = {"resource_type": resource_type}
+        if folder:
+            options["folder"] = f"ascend/{folder}"
+        return cloudinary.uploader.upload(file, **options).get("secure_url")
+
+    def owns(self, url):
+        return _cloudinary_public_id(url) is not None
+
+    def read(self, url):
+        with urlopen(url, timeout=30) as response:
+            return response.read(MAX_READ_BYTES)
+
+    def save_variant(self, url, data, label, ext):
+        """Store `data` beside the file at `url`, as <public_id>_<label>.<ext>."""
+        _, public_id = _cloudinary_public_id(url)
+        return cloudinary.uploader.upload(
+            io.BytesIO(data), public_id=f"{public_id}_{label}", format=ext,
+            resource_type="image", overwrite=True
+        ).get("secure_url")
+
+    def delete(self, urls):
+        by_type = {}
+        for url in urls:
+            ref = _cloudinary_public_id(url)
+            if ref:
+                by_type.setdefault(ref[0], []).append(ref[1])
+        deleted = 0
+        for resource_type, public_ids in by_type.items():
+            for i in range(0, len(public_ids), CLOUDINARY_DELETE_BATCH):
+                batch = public_ids[i:i + CLOUDINARY_DELETE_BATCH]
+                result = cloudinary.api.delete_resources(batch, resource_type=resource_type)
+                deleted += sum(1 for status in result.get("deleted", {}).values() if status == "deleted")
+        return deleted
+
+
+class LocalStorage:
+    """
+    Files under MEDIA_ROOT/<folder>/<random name><ext>. Names are never reused,
+    so a URL always means the same bytes and can be cached as immutable.
+    """
+    name = "local"
+
+    def __init__(self, root=MEDIA_ROOT):
+        self.root = root
+
+    def save(self, file, resource_type="auto", folder=None):
+        """Raises ValueError for a file type outside ALLOWED_EXTENSIONS."""
+        ext = os.path.splitext(secure_filename(file.filename or ""))[1].lower()
+        if ext not in ALLOWED_EXTENSIONS.get(resource_type, ALLOWED_EXTENSIONS["auto"]):
+            raise ValueError(f"Files of type {ext or '(none)'} can't be uploaded here")
+        key = f"{folder or 'files'}/{uuid.uuid4().hex}{ext}"
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file.save(path)  # streamed to disk in chunks
+        return MEDIA_URL_PREFIX + key
+
+    def owns(self, url):
+        return url.startswith((MEDIA_URL_PREFIX, LEGACY_UPLOAD_PREFIX))
+
+    def _path(self, url):
+        if url.startswith(LEGACY_UPLOAD_PREFIX):
+            return os.path.join(STATIC_FOLDER, "uploads", os.path.basename(url))
+        key = os.path.normpath(url[len(MEDIA_URL_PREFIX):])
+        if key.startswith(("..", "/")):
+            return None
+        return os.path.join(self.root, key)
+
+    def read(self, url):
+        with open(self._path(url), "rb") as f:
+            return f.read(MAX_READ_BYTES)
+
+    def save_variant(self, url, data, label, ext):
+        """Store `data` beside the file at `url`, as <name>.<label>.<ext>."""
+        stem = os.path.splitext(self._path(url))[0]
+        with open(f"{stem}.{label}.{ext}", "wb") as f:
+            f.write(data)
+        return f"{os.path.splitext(url)[0]}.{label}.{ext}"
+
+    def delete(self, urls):
+        deleted = 0
+        for url in urls:
+            path = self._path(url)
+            if not path:
+                continue
+            try:
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+        return deleted
+
+
+DRIVERS = {"cloudinary": CloudinaryStorage(), "local": LocalStorage()}
+if STORAGE_BACKEND not in DRIVERS:
+    raise RuntimeError(f"❌ Unknown STORAGE_BACKEND {STORAGE_BACKEND!r} (expected one of {', '.join(DRIVERS)})")
+
+
+def storage():
+    """The driver new uploads go to."""
+    return DRIVERS[STORAGE_BACKEND]
+
+
+def owner(url):
+    """The driver holding the file at `url`, or None for links we don't store."""
+    return next((driver for driver in DRIVERS.values() if driver.owns(url)), None)
+
+
+def delete_assets(urls):
+    """Delete stored files, each through the driver that owns it. Returns the count removed."""
+    urls = {u for u in urls if u}
+    return sum(
+        driver.delete([u for u in urls if driver.owns(u)])
+        for driver in DRIVERS.values()
+    )
@@ -1,84 +1,134 @@
 document.addEventListener('DOMContentLoaded', () => {
-    // === Filter Logic ===
+    const courseGrid = document.getElementById('courseGrid');
     const filterBtns = document.querySelectorAll('.filter-btn');
-    const courseCards = document.querySelectorAll('.course-card');
+    const searchInput = document.getElementById('searchInput');
+    const searchBtn = document.getElementById('searchBtn');
+
+    // === Server-side Search ===
+    // Results, ranking and category counts come from /api/courses/search,
+    // so the page never has to ship the whole catalog.
+    let activeCategory = 'all';
+    let searchTimer = null;
+
+    function escapeHtml(text) {
+        const entities = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+        return (text == null ? '' : String(text)).replace(/[&<>"']/g, ch => entities[ch]);
+    }
+
+    // Resized WebP/JPEG copies of the thumbnail, once they've been generated
+    const CARD_SIZES = '(max-width: 600px) 100vw, 400px';
+    function renderThumbnail(course) {
+        const srcset = course.thumbnail_srcset || {};
+        const img = `<img src="${escapeHtml(course.thumbnail_url)}" alt="${escapeHtml(course.title)}" loading="lazy"` +
+            (srcset.jpeg ? ` srcset="${escapeHtml(srcset.jpeg)}" sizes="${CARD_SIZES}"` : '') + ' />';
+        if (!srcset.webp) return img;
+        return `<picture style="display: contents"><source type="image/webp" srcset="${escapeHtml(srcset.webp)}" sizes="${CARD_SIZES}">${img}</picture>`;
+    }
 
+    function renderCard(course) {
+        return `
+        <div class="course-card fade-in" data-category="${escapeHtml(course.category)}" data-desc="${escapeHtml(course.description)}">
+          <div class="card-image">
+            ${renderThumbnail(course)}
+            <div class="overlay">
+              <button class="view-details-btn">Quick View</button>
+            </div>
+          </div>
+          <div class="card-content">
+            <div class="card-header">
+              <span class="category-tag">${escapeHtml(course.category || '')}</span>
+              <span class="rating"><i class="fas fa-star"></i> ${escapeHtml(course.rating)}</span>
+            </div>
+            <h3>${escapeHtml(course.title)}</h3>
+            <p class="instructor">By <span class="instructor-name">${escapeHtml(course.instructor_name)}</span></p>
+            <div class="card-footer">
+              <span class="duration"><i class="far fa-clock"></i> ${escapeHtml(course.total_time_pretty)}</span>
+            </div>
+          </div>
+        </div>`;
+    }
+
+    function updateFacetCounts(facets) {
+        const counts = {};
+        (facets.category || []).forEach(f => { counts[f.value] = f.count; });
+        const total = Object.values(counts).reduce((a, b) => a + b, 0);
+        filterBtns.forEach(btn => {
+            if (!btn.dataset.label) btn.dataset.label = btn.innerText;
+            const value = btn.getAttribute('data-filter');
+            const count = value === 'all' ? total : (counts[value] || 0);
+            btn.innerText = `${btn.dataset.label} (${count})`;
+        });
+    }
+
+    async function runSearch(initial = false) {
+        const params = new URLSearchParams({ q: searchInput.value.trim(), per_page: 12 });
+        if (activeCategory !== 'all') params.set('category', activeCategory);
+        try {
+            const response = await fetch(`/api/courses/search?${params.toString()}`);
+            if (!response.ok) return;
+            const data = await response.json();
+            updateFacetCounts(data.facets);
+            // Keep the featured cards until there's a real catalog to show
+            if (initial && !data.results.length) return;
+            courseGrid.innerHTML = data.results.length
+                ? data.results.map(renderCard).join('')
+                : '<p class="no-courses">No courses found.</p>';
+        } catch {
+            // Keep whatever is on screen if the search service is unreachable
+        }
+    }
+
+    // === Filter Logic ===
     filterBtns.forEach(btn => {
         btn.addEventListener('click', () => {
-            // Remove active class from all
             filterBtns.forEach(b => b.classList.remove('active'));
-            // Add active to clicked
             btn.classList.add('active');
-
-            const filterValue = btn.getAttribute('data-filter');
-
-            courseCards.forEach(card => {
-                if (filterValue === 'all' || card.getAttribute('data-category') === filterValue) {
-                    card.style.display = 'block';
-                    // Re-trigger AOS animation if needed, or just fade in
-                    card.classList.add('fade-in');
-                } else {
-                    card.style.display = 'none';
-                    card.classList.remove('fade-in');
-                }
-            });
+            activeCategory = btn.getAttribute('data-filter');
+            runSearch();
         });
     });
 
     // === Search Logic ===
-    const searchInput = document.getElementById('searchInput');
-    const searchBtn = document.getElementById('searchBtn');
-
-    function filterCourses() {
-        const searchTerm = searchInput.value.toLowerCase();
-        courseCards.forEach(card => {
-            const title = card.querySelector('h3').innerText.toLowerCase();
-            if (title.includes(searchTerm)) {
-                card.style.display = 'block';
-            } else {
-                card.style.display = 'none';
-            }
-        });
-    }
+    searchBtn.addEventListener('click', () => runSearch());
+    searchInput.addEventListener('keyup', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => runSearch(), 250);
+    });
 
-    searchBtn.addEventListener('click', filterCourses);
-    searchInput.addEventListener('keyup', filterCourses);
+    runSearch(true);
 
     // === Modal Logic ===
     const modal = document.getElementById('courseModal');
     const closeModal = document.querySelector('.close-modal');
-    const viewBtns = document.querySelectorAll('.view-details-btn');
 
     // Elements to update in modal
     const modalTitle = document.getElementById('modalTitle');
     const modalImg = document.getElementById('modalImg');
     const modalDesc = document.getElementById('modalDesc');
     const modalInstructor = document.getElementById('modalInstructor');
-    const modalPrice = document.getElementById('modalPrice');
-
-    viewBtns.forEach(btn => {
-        btn.addEventListener('click', (e) => {
-            e.preventDefault();
-            const card = btn.closest('.course-card');
-
-            // Extract data from card
-            const title = card.querySelector('h3').innerText;
-            const img = card.querySelector('img').src;
-            const instructor = card.querySelector('.instructor-name').innerText;
-            // const price = card.querySelector('.price-tag').innerText;
-            const desc = card.getAttribute('data-desc') || "Unlock your potential with this comprehensive course designed to take you from beginner to expert.";
-
-            // Update modal
-            modalTitle.innerText = title;
-            modalImg.src = img;
-            modalInstructor.innerText = instructor;
-            // modalPrice.innerText = price;
-            modalDesc.innerText = desc;
-
-            // Show modal
-            modal.classList.add('show');
-            document.body.style.overflow = 'hidden'; // Prevent background scrolling
-        });
+
+    // Cards are re-rendered by search, so listen on the grid
+    courseGrid.addEventListener('click', (e) => {
+        const btn = e.target.closest('.view-details-btn');
+        if (!btn) return;
+        e.preventDefault();
+        const card = btn.closest('.course-card');
+
+        // Extract data from card
+        const title = card.querySelector('h3').innerText;
+        const img = card.querySelector('img').src;
+        const instructor = card.querySelector('.instructor-name').innerText;
+        const desc = card.getAttribute('data-desc') || "Unlock your potential with this comprehensive course designed to take you from beginner to expert.";
+
+        // Update modal
+        modalTitle.innerText = title;
+        modalImg.src = img;
+        modalInstructor.innerText = instructor;
+        modalDesc.innerText = desc;
+
+        // Show modal
+        modal.classList.add('show');
+        document.body.style.overflow = 'hidden'; // Prevent background scrolling
     });
 
     closeModal.addEventListener('click', () => {